@@ -0,0 +1,106 @@
+"""
+Compiled, read-only serializers for the hot message lists. They render the rows of .values() querysets into the same
+output as ChannelChatMessageSerializer, FriendChatMessageSerializer and ChatMessageAuthorSerializer, but the URLs of the
+rows are built from a prefix reversed once per serializer instead of with a reverse() call for each row and field, and
+no field objects or model instances are created. They're used for the message list views: any change to the fields of
+the DRF serializers must be applied to these too.
+"""
+from rest_framework import ISO_8601, serializers
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+
+# Value of the primary key that URLs are reversed with, which is then replaced by each row's ID
+URL_PLACEHOLDER = '00000000-0000-0000-0000-000000000000'
+
+
+def compile_detail_url(view_name, context):
+    """ Returns a function that builds the detail URL of an object from its ID, the same way as DRF's hyperlinked
+    fields, reversing the URL only once. """
+    url = reverse(view_name, kwargs={'pk': URL_PLACEHOLDER}, request=context['request'], format=context.get('format'))
+    prefix, suffix = url.split(URL_PLACEHOLDER)
+    return lambda pk: f'{prefix}{pk}{suffix}'
+
+
+def compile_datetime():
+    """ Returns a function that formats datetimes the same way as DRF's DateTimeField, with the current timezone and
+    format settings looked up only once. Falls back to the field itself unless the output is aware ISO 8601. """
+    field = serializers.DateTimeField(read_only=True)
+    field_timezone = field.default_timezone()
+    if field_timezone is None or (api_settings.DATETIME_FORMAT or '').lower() != ISO_8601:
+        return field.to_representation
+
+    def to_representation(value):
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    return to_representation
+
+
+class CompiledAuthorSerializer:
+    """ Compiled equivalent of ChatMessageAuthorSerializer, for the rows whose user fields are prefixed by the given
+    prefix (e.g. 'author__'). """
+
+    def __init__(self, context, prefix=''):
+        self.get_url = compile_detail_url('customuser-detail', context)
+        self.id_field = f'{prefix}id'
+        self.username_field = f'{prefix}username'
+        self.value_fields = (self.id_field, self.username_field)
+
+    def to_representation(self, row):
+        user_id = row[self.id_field]
+        return {
+            'id': str(user_id),
+            'url': self.get_url(user_id),
+            'username': row[self.username_field],
+        }
+
+
+class CompiledMessageSerializer:
+    """ Base compiled message serializer. Subclasses set the name of the message's chat field and the view names of
+    the message and the chat. """
+
+    chat_field_name = None
+    view_name = None
+    chat_view_name = None
+
+    def __init__(self, context):
+        self.get_url = compile_detail_url(self.view_name, context)
+        self.get_chat_url = compile_detail_url(self.chat_view_name, context)
+        self.get_timestamp = compile_datetime()
+        self.author = CompiledAuthorSerializer(context, prefix='author__')
+        self.chat_id_field = f'{self.chat_field_name}_id'
+
+    def get_values(self, queryset):
+        """ Returns the queryset's rows with the fields that the serializer needs. """
+        return queryset.values('id', self.chat_id_field, 'content', 'timestamp', 'sequence', *self.author.value_fields)
+
+    def to_representation(self, row):
+        message_id = row['id']
+        return {
+            'id': str(message_id),
+            'url': self.get_url(message_id),
+            'author': self.author.to_representation(row),
+            self.chat_field_name: self.get_chat_url(row[self.chat_id_field]),
+            'content': row['content'],
+            'timestamp': self.get_timestamp(row['timestamp']),
+            'sequence': row['sequence'],
+        }
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+class CompiledFriendChatMessageSerializer(CompiledMessageSerializer):
+    """ Compiled equivalent of FriendChatMessageSerializer. """
+
+    chat_field_name = 'chat'
+    view_name = 'friendchatmessage-detail'
+    chat_view_name = 'friendchat-detail'
+
+
+class CompiledChannelChatMessageSerializer(CompiledMessageSerializer):
+    """ Compiled equivalent of ChannelChatMessageSerializer. """
+
+    chat_field_name = 'channel'
+    view_name = 'channelchatmessage-detail'
+    chat_view_name = 'channel-detail'
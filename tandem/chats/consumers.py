@@ -1,16 +1,93 @@
+import asyncio
+import functools
+import time
+
 from asgiref.sync import async_to_sync
+from channels.consumer import get_handler_name
+from channels.db import database_sync_to_async
 from channels.generic.websocket import JsonWebsocketConsumer
+from channels.layers import get_channel_layer
 from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import PermissionDenied
 
 from chats.models import FriendChat, ChannelChatMessage, FriendChatMessage
+from chats.ephemeral import EPHEMERAL_EVENT_FIELDS, CONNECTION_RATE, CONNECTION_BURST, TokenBucket, build_event, \
+    group_throttle
+from chats.presence import get_presence_store
 from communities.models import Membership, Channel
+from tandem.authorization import to_uuid
+from tandem.ratelimit import get_rate_limiter
+from tandem.routers import routing_context
+
+
+def get_user_group_name(user_id):
+    """ Returns the name of the group that all the connections of a user are added to. """
+    return f'user_{user_id}'
+
+
+def send_chats_join(chat_ids_by_user):
+    """ Tells the connected consumers of each user in the dictionary to join the groups of the chats in their list, with
+    a single message per user. Should be called after the chats are committed, e.g. with transaction.on_commit(). """
+    channel_layer = get_channel_layer()
+    for user_id, chat_ids in chat_ids_by_user.items():
+        async_to_sync(channel_layer.group_send)(
+            get_user_group_name(user_id),
+            {
+                'type': 'chats.join',
+                'chat_ids': [str(chat_id) for chat_id in chat_ids]
+            }
+        )
 
 
 class ChatConsumer(JsonWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super(ChatConsumer, self).__init__(*args, **kwargs)
         self.chat_ids = []
+        # Time of the last heartbeat written to the presence store
+        self.last_heartbeat = None
+        self.ephemeral_event_bucket = TokenBucket(CONNECTION_RATE, CONNECTION_BURST)
+
+    async def __call__(self, scope, receive, send):
+        # Keep the asynchronous send function, which is used to relay ephemeral events from the event loop
+        self.async_send = send
+        return await super(ChatConsumer, self).__call__(scope, receive, send)
+
+    async def dispatch(self, message):
+        """ Handles ephemeral events (see chats.ephemeral) directly in the event loop, as they don't need the database,
+        so that they don't compete with messages for the sync thread pool. Everything else goes to dispatch_sync(). """
+        if message['type'] == 'ephemeral.event':
+            return await self.ephemeral_event(message)
+        if message['type'] == 'websocket.receive' and message.get('text'):
+            try:
+                content = self.decode_json(message['text'])
+            except ValueError:
+                return await self.dispatch_sync(message)
+            if isinstance(content, dict) and content.get('type') in EPHEMERAL_EVENT_FIELDS:
+                return await self.receive_ephemeral_event(content)
+            # Pass the decoded content on, so that websocket_receive() doesn't decode the text again
+            message = {**message, 'json': content}
+        return await self.dispatch_sync(message)
+
+    @functools.partial(database_sync_to_async, thread_sensitive=False)
+    def dispatch_sync(self, message):
+        """ Dispatches incoming messages to their handlers like SyncConsumer.dispatch(), but runs them in the worker's
+        sync thread pool (see tandem.asgi) instead of the single thread shared by every consumer in the process.
+        Messages for a given consumer are still handled one at a time. """
+        handler = getattr(self, get_handler_name(message), None)
+        if handler:
+            # Route the handler's queries on behalf of the connection's user, so that they can read their own writes
+            user = self.scope.get('user')
+            with routing_context(user_id=user.id if user is not None and user.is_authenticated else None):
+                handler(message)
+        else:
+            raise ValueError("No handler for message type %s" % message["type"])
+
+    def websocket_receive(self, message):
+        """ Passes the content of the messages decoded by dispatch() to receive_json(), and decodes the rest. """
+        if 'json' in message:
+            self.receive_json(message['json'])
+        else:
+            super(ChatConsumer, self).websocket_receive(message)
 
     def connect(self):
         user = self.scope['user']
@@ -22,7 +99,13 @@ class ChatConsumer(JsonWebsocketConsumer):
                     chat_id,
                     self.channel_name
                 )
+            # Add the consumer to the user's group, through which it's told to join new chats
+            async_to_sync(self.channel_layer.group_add)(
+                get_user_group_name(user.id),
+                self.channel_name
+            )
             self.accept()
+            self.join_presence()
         else:
             self.disconnect(1003)
 
@@ -32,12 +115,72 @@ class ChatConsumer(JsonWebsocketConsumer):
         friend_chats = user.friend_chats.all().values_list('pk', flat=True)
         self.chat_ids = [str(x) for x in list(memberships) + list(friend_chats)]
 
+    def websocket_disconnect(self, message):
+        if self.last_heartbeat is not None:
+            self.leave_presence()
+        super(ChatConsumer, self).websocket_disconnect(message)
+
+    def join_presence(self):
+        """ Registers the connection in the presence store, announces the user to their chats if they just came online,
+        and sends the client the heartbeat interval and the online counts of their chats. """
+        store = get_presence_store()
+        self.last_heartbeat = time.monotonic()
+        if store.touch(str(self.scope['user'].id), self.channel_name, self.chat_ids):
+            self.broadcast_presence(online=True)
+        self.send_json({
+            'presence': {
+                'heartbeat_interval': store.heartbeat_interval,
+                'online_counts': store.get_online_counts(self.chat_ids)
+            }
+        })
+
+    def heartbeat(self):
+        """ Refreshes the connection's presence entry. Heartbeats sent more often than every half interval are ignored,
+        so that clients can't make the store do more work than it's sized for. """
+        store = get_presence_store()
+        now = time.monotonic()
+        if self.last_heartbeat is None or now - self.last_heartbeat < store.heartbeat_interval / 2:
+            return
+        self.last_heartbeat = now
+        # The user may have been considered gone if their heartbeats were delayed
+        if store.touch(str(self.scope['user'].id), self.channel_name, self.chat_ids):
+            self.broadcast_presence(online=True)
+
+    def leave_presence(self):
+        if get_presence_store().remove(str(self.scope['user'].id), self.channel_name, self.chat_ids):
+            self.broadcast_presence(online=False)
+
+    def broadcast_presence(self, online):
+        """ Tells the user's chats that they came online or went offline, along with the chats' new online counts. """
+        online_counts = get_presence_store().get_online_counts(self.chat_ids)
+        async_to_sync(self.group_send_many)([
+            (chat_id, {
+                'type': 'presence.update',
+                'presence': {
+                    'chat_id': chat_id,
+                    'user_id': str(self.scope['user'].id),
+                    'online': online,
+                    'online_count': online_counts[chat_id]
+                }
+            }) for chat_id in self.chat_ids
+        ])
+
+    async def group_send_many(self, messages):
+        """ Sends each message to its group concurrently. Takes a list of (group, message) tuples. """
+        await asyncio.gather(*(self.channel_layer.group_send(group, message) for group, message in messages))
+
     def disconnect(self, close_code):
         for chat_id in self.chat_ids:
             async_to_sync(self.channel_layer.group_discard)(
                 chat_id,
                 self.channel_name
             )
+        user = self.scope['user']
+        if not isinstance(user, AnonymousUser):
+            async_to_sync(self.channel_layer.group_discard)(
+                get_user_group_name(user.id),
+                self.channel_name
+            )
 
     def save_message(self, message):
         """Saves a message to the DB before sending it."""
@@ -89,6 +232,7 @@ class ChatConsumer(JsonWebsocketConsumer):
                 },
                 'content': message_content,
                 'timestamp': message_object.timestamp.isoformat(),
+                'sequence': message_object.sequence,
             }
         except (KeyError, ValueError, Channel.DoesNotExist, FriendChat.DoesNotExist, PermissionDenied) as e:
             # If the message does not have the required attributes or the provided ID is not found, close the
@@ -100,8 +244,23 @@ class ChatConsumer(JsonWebsocketConsumer):
     def receive_json(self, content):
         try:
             message_type = content['type']
+            if message_type == 'heartbeat':
+                self.heartbeat()
+                return
             chat_id = content['chat_id']
 
+            # Reject messages over the user's rate limit for their type before doing any work for them
+            allowed, retry_after = get_rate_limiter().check(f'ws.{message_type}', f'user:{self.scope["user"].id}')
+            if not allowed:
+                self.send_json({
+                    'error': {
+                        'type': 'rate_limited',
+                        'message_type': message_type,
+                        'retry_after': retry_after
+                    }
+                })
+                return
+
             if message_type == 'chat_message':
                 # Persist message to DB
                 saved_message = self.save_message(content)
@@ -115,8 +274,9 @@ class ChatConsumer(JsonWebsocketConsumer):
                     }
                 )
             elif message_type == 'join_chat':
-                # Join the group with the provided ID
-                self.chat_join(chat_id)
+                # Join the group with the provided ID, if the user is a member of the chat
+                if chat_id not in self.chat_ids and self.is_chat_member(chat_id):
+                    self.chat_join(chat_id)
 
         except KeyError:
             pass
@@ -130,11 +290,60 @@ class ChatConsumer(JsonWebsocketConsumer):
             'message': message
         })
 
-    # Add the consumer to a group after the user joins a channel or creates a user chat
+    def is_chat_member(self, chat_id):
+        """ Returns whether the user is a member of the channel or friend chat with the given ID. """
+        chat_id = to_uuid(chat_id)
+        if chat_id is None:
+            return False
+        user = self.scope['user']
+        return Membership.objects.filter(user=user, channel_id=chat_id).exists() \
+            or user.friend_chats.filter(id=chat_id).exists()
+
+    # Add the consumer to a group after the user joins a channel or creates a user chat, and to the user's chats, so
+    # that it relays the chat's ephemeral events and presence
     def chat_join(self, chat_id):
         async_to_sync(self.channel_layer.group_add)(
             chat_id,
             self.channel_name
         )
+        self.chat_ids.append(chat_id)
+
+    async def receive_ephemeral_event(self, content):
+        """ Relays an ephemeral event from the client to the chat's group, if it's valid, the user is a member of the
+        chat, and neither the connection's rate limit nor the group's throttle drop it. """
+        user = self.scope['user']
+        if user.is_anonymous:
+            return
+        event = build_event(content, str(user.id))
+        if event is None or event['chat_id'] not in self.chat_ids:
+            return
+        if not self.ephemeral_event_bucket.consume() or not group_throttle.allow(event):
+            return
+        await self.channel_layer.group_send(event['chat_id'], {
+            'type': 'ephemeral.event',
+            'sender': self.channel_name,
+            'event': event
+        })
+
+    # Receive an ephemeral event from one of the chats, forward it to the client unless it was sent by this connection
+    async def ephemeral_event(self, message):
+        if message['sender'] != self.channel_name:
+            await self.async_send({
+                'type': 'websocket.send',
+                'text': self.encode_json({'event': message['event']})
+            })
+
+    # Receive a user's presence change from one of their chats, forward it to the client unless it's about its own user
+    def presence_update(self, event):
+        if event['presence']['user_id'] != str(self.scope['user'].id):
+            self.send_json({
+                'presence': event['presence']
+            })
+
+    # Add the consumer to the groups of several chats at once, after they're created by a bulk creation request
+    def chats_join(self, event):
+        for chat_id in event['chat_ids']:
+            if chat_id not in self.chat_ids:
+                self.chat_join(chat_id)
 
 # Code initially sourced from https://channels.readthedocs.io/en/stable/tutorial/part_2.html
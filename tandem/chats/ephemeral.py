@@ -0,0 +1,116 @@
+"""
+Ephemeral chat events, such as typing indicators and read receipts. They're relayed to the chat's group through the
+channel layer as they arrive, and are never saved to the database. As they're sent far more often than messages, they
+are rate limited per connection and throttled per group, so that a busy chat can't flood its members' connections.
+"""
+import time
+from collections import OrderedDict
+
+# Types of the ephemeral events that clients can send, and the extra fields of each one
+EPHEMERAL_EVENT_FIELDS = {
+    'typing': (),
+    'stop_typing': (),
+    'read': ('sequence',),
+}
+
+# Events that each connection can send per second, and in a burst
+CONNECTION_RATE = 5
+CONNECTION_BURST = 10
+
+# Events that each group can receive per second from the connections of a worker, and in a burst
+GROUP_RATE = 20
+GROUP_BURST = 40
+
+# Minimum seconds between the typing events of a user in a chat. Clients send them while the user types, but one every
+# few seconds is enough to keep the indicator on.
+TYPING_INTERVAL = 2
+
+# Maximum number of groups whose state is kept by each worker. The least recently used ones are dropped beyond that.
+MAX_GROUPS = 10000
+
+
+class TokenBucket:
+    """ Allows events at a rate of 'rate' per second on average, with bursts of up to 'capacity' events. """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self):
+        """ Takes a token from the bucket if there's one available. Returns whether the event is allowed. """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class GroupState:
+    def __init__(self):
+        self.bucket = TokenBucket(GROUP_RATE, GROUP_BURST)
+        # Time of the last typing event of each user, and sequence number of the last message read by each user
+        self.typing = {}
+        self.read = {}
+
+
+class GroupThrottle:
+    """
+    Throttles the ephemeral events sent to each group from a worker. Besides the group's rate limit, typing events are
+    limited to one every TYPING_INTERVAL seconds for each user, and read receipts are only sent when the user's last
+    read message is newer than the one in their previous receipt. Must only be used from the worker's event loop.
+    """
+
+    def __init__(self):
+        self.groups = OrderedDict()
+
+    def get_group(self, chat_id):
+        group = self.groups.pop(chat_id, None) or GroupState()
+        self.groups[chat_id] = group
+        if len(self.groups) > MAX_GROUPS:
+            self.groups.popitem(last=False)
+        return group
+
+    def allow(self, event):
+        """ Returns whether the event can be sent to its chat's group. """
+        group = self.get_group(event['chat_id'])
+        user_id = event['user_id']
+        if event['type'] == 'typing':
+            now = time.monotonic()
+            if now - group.typing.get(user_id, float('-inf')) < TYPING_INTERVAL:
+                return False
+            if not group.bucket.consume():
+                return False
+            group.typing[user_id] = now
+            return True
+        if event['type'] == 'read':
+            if event['sequence'] <= group.read.get(user_id, 0):
+                return False
+            if not group.bucket.consume():
+                return False
+            group.read[user_id] = event['sequence']
+            return True
+        if event['type'] == 'stop_typing':
+            group.typing.pop(user_id, None)
+        return group.bucket.consume()
+
+
+group_throttle = GroupThrottle()
+
+
+def build_event(content, user_id):
+    """ Builds the event to relay from the content sent by the client. Returns None if it's not a valid event. """
+    event_type = content.get('type')
+    if event_type not in EPHEMERAL_EVENT_FIELDS:
+        return None
+    event = {'type': event_type, 'chat_id': content.get('chat_id'), 'user_id': user_id}
+    for field in EPHEMERAL_EVENT_FIELDS[event_type]:
+        value = content.get(field)
+        # Sequence numbers are the only extra fields so far
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            return None
+        event[field] = value
+    return event
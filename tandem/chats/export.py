@@ -0,0 +1,111 @@
+"""
+Export of the messages of a user's chats, as JSON Lines or CSV. Messages are read with server-side cursors and written
+as they're read, so the memory used doesn't depend on the number of messages.
+
+Messages are exported in a stable order: friend chat messages first, then channel messages, each sorted by chat and
+sequence number. Every exported message has a cursor, which can be passed back to resume the export after it.
+"""
+import csv
+import itertools
+import json
+import uuid
+
+from django.db.models import Q
+from rest_framework import fields
+
+from chats.models import FriendChat, FriendChatMessage, ChannelChatMessage
+from communities.models import Membership
+
+# Number of messages fetched from the database at a time, which are also written out together
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_COLUMNS = ['cursor', 'chat_type', 'chat', 'id', 'sequence', 'timestamp', 'author', 'content']
+
+# Chat type, message model and name of the message's chat field, in export order
+CHAT_TYPES = [
+    ('friend_chat', FriendChatMessage, 'chat'),
+    ('channel', ChannelChatMessage, 'channel'),
+]
+
+
+def parse_cursor(cursor):
+    """ Parses a '<chat type>:<chat ID>:<sequence>' cursor. Returns the index of the chat type, the chat's ID and the
+    sequence number. Raises ValueError if the cursor isn't valid. """
+    chat_type, chat_id, sequence = cursor.split(':')
+    chat_types = [name for name, _, _ in CHAT_TYPES]
+    if chat_type not in chat_types:
+        raise ValueError(f"'{chat_type}' is not a valid chat type.")
+    return chat_types.index(chat_type), uuid.UUID(chat_id), int(sequence)
+
+
+def get_chat_ids(user, chat_type):
+    if chat_type == 'friend_chat':
+        return FriendChat.objects.filter(users=user).values('id')
+    return Membership.objects.filter(user=user).values('channel_id')
+
+
+def iter_messages(user, cursor=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """ Yields the messages of the user's friend chats and channels as dictionaries, starting after the given cursor.
+    """
+    start = parse_cursor(cursor) if cursor else None
+    timestamp_field = fields.DateTimeField()
+
+    for index, (chat_type, model, chat_field) in enumerate(CHAT_TYPES):
+        if start and index < start[0]:
+            continue
+        messages = model.objects.filter(**{f'{chat_field}__in': get_chat_ids(user, chat_type)})
+        if start and index == start[0]:
+            _, chat_id, sequence = start
+            messages = messages.filter(Q(**{f'{chat_field}__gt': chat_id})
+                                       | Q(**{chat_field: chat_id, 'sequence__gt': sequence}))
+        # Order by the chat's ID, and not by the chat model's default ordering
+        rows = messages.order_by(f'{chat_field}_id', 'sequence') \
+            .values_list('id', chat_field, 'sequence', 'timestamp', 'author', 'content') \
+            .iterator(chunk_size=chunk_size)
+
+        for message_id, chat_id, sequence, timestamp, author_id, content in rows:
+            yield {
+                'cursor': f'{chat_type}:{chat_id}:{sequence}',
+                'chat_type': chat_type,
+                'chat': str(chat_id),
+                'id': str(message_id),
+                'sequence': sequence,
+                'timestamp': timestamp_field.to_representation(timestamp),
+                'author': str(author_id),
+                'content': content,
+            }
+
+
+def chunked(messages, chunk_size):
+    iterator = iter(messages)
+    while chunk := list(itertools.islice(iterator, chunk_size)):
+        yield chunk
+
+
+def render_jsonl(messages, chunk_size=EXPORT_CHUNK_SIZE):
+    """ Yields the messages as JSON Lines, a chunk of messages at a time. """
+    for chunk in chunked(messages, chunk_size):
+        yield ''.join(json.dumps(message, ensure_ascii=False) + '\n' for message in chunk)
+
+
+class LineBuffer:
+    """ File-like object that returns the lines written to it, to be used by a CSV writer. """
+
+    @staticmethod
+    def write(value):
+        return value
+
+
+def render_csv(messages, chunk_size=EXPORT_CHUNK_SIZE):
+    """ Yields the messages as CSV, with a header row, a chunk of messages at a time. """
+    writer = csv.DictWriter(LineBuffer(), fieldnames=EXPORT_COLUMNS)
+    yield writer.writeheader()
+    for chunk in chunked(messages, chunk_size):
+        yield ''.join(writer.writerow(message) for message in chunk)
+
+
+# Content type and renderer of each export format
+EXPORT_FORMATS = {
+    'jsonl': ('application/x-ndjson', render_jsonl),
+    'csv': ('text/csv', render_csv),
+}
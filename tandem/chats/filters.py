@@ -1,3 +1,4 @@
+from django import forms
 from django.contrib.auth import get_user_model
 from django_filters import rest_framework as filters
 
@@ -6,35 +7,62 @@ from chats.models import ChannelChatMessage, FriendChatMessage, FriendChat
 
 class ChannelChatMessageFilter(filters.FilterSet):
     """
-    Filter class for ChannelChatMessageViewSet. Requires a 'channel' parameter to filter by.
+    Filter class for ChannelChatMessageViewSet. Requires a 'channel' parameter to filter by. Accepts 'since' and 'until'
+    parameters to limit the messages to a time range, which lets the database skip the partitions outside of it, and
+    'after_sequence' and 'before_sequence' parameters to fetch the messages after or before a given one.
     """
 
     channel = filters.UUIDFilter(required=True)
+    since = filters.IsoDateTimeFilter(field_name='timestamp', lookup_expr='gte')
+    until = filters.IsoDateTimeFilter(field_name='timestamp', lookup_expr='lt')
+    after_sequence = filters.NumberFilter(field_name='sequence', lookup_expr='gt')
+    before_sequence = filters.NumberFilter(field_name='sequence', lookup_expr='lt')
 
     class Meta:
         model = ChannelChatMessage
-        fields = ('channel',)
+        fields = ('channel', 'since', 'until', 'after_sequence', 'before_sequence')
+
+
+class FriendChatFilterForm(forms.Form):
+
+    def clean(self):
+        cleaned_data = super(FriendChatFilterForm, self).clean()
+        if not cleaned_data.get('users') and not cleaned_data.get('pair'):
+            raise forms.ValidationError("Either the 'users' or the 'pair' parameter is required.")
+        return cleaned_data
 
 
 class FriendChatFilter(filters.FilterSet):
     """
-    Filter class for FriendChatMessageViewSet. Requires a 'chat' parameter to filter by.
+    Filter class for FriendChatViewSet. Requires either a 'users' parameter to filter by, or a 'pair' parameter with
+    the ID of a user, which returns the session user's chat with them by looking up the chats' user pair key.
     """
 
-    users = filters.ModelMultipleChoiceFilter(required=True, queryset=get_user_model().objects.all())
+    users = filters.ModelMultipleChoiceFilter(queryset=get_user_model().objects.all())
+    pair = filters.UUIDFilter(method='get_pair')
+
+    def get_pair(self, queryset, name, value):
+        return queryset.filter(user_pair=FriendChat.get_user_pair(self.request.user.id, value))
 
     class Meta:
         model = FriendChat
-        fields = ('users',)
+        form = FriendChatFilterForm
+        fields = ('users', 'pair')
 
 
 class FriendChatMessageFilter(filters.FilterSet):
     """
-    Filter class for FriendChatMessageViewSet. Requires a 'chat' parameter to filter by.
+    Filter class for FriendChatMessageViewSet. Requires a 'chat' parameter to filter by. Accepts 'since' and 'until'
+    parameters to limit the messages to a time range, which lets the database skip the partitions outside of it, and
+    'after_sequence' and 'before_sequence' parameters to fetch the messages after or before a given one.
     """
 
     chat = filters.UUIDFilter(required=True)
+    since = filters.IsoDateTimeFilter(field_name='timestamp', lookup_expr='gte')
+    until = filters.IsoDateTimeFilter(field_name='timestamp', lookup_expr='lt')
+    after_sequence = filters.NumberFilter(field_name='sequence', lookup_expr='gt')
+    before_sequence = filters.NumberFilter(field_name='sequence', lookup_expr='lt')
 
     class Meta:
         model = FriendChatMessage
-        fields = ('chat',)
+        fields = ('chat', 'since', 'until', 'after_sequence', 'before_sequence')
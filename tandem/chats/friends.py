@@ -0,0 +1,45 @@
+"""
+Friend adjacency sets: the IDs of the users that each user has a friend chat with. They're kept in the cache for
+settings.FRIENDS_CACHE_TIMEOUT seconds, so that friendship checks and "not friends with" exclusions are set operations
+instead of joins across the friend chats' users table. The sets of a chat's users are removed from the cache when its
+users change or it's deleted (see tandem.signals), and when chats are created in bulk.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from chats.models import FriendChat
+
+
+def get_friends_cache_key(user_id):
+    return f'friends:{user_id}'
+
+
+def load_friend_ids(user_id):
+    """ Returns the IDs of the user's friends from the primary database, as a set read from a replica that lags behind
+    could be cached after the change that invalidated it. """
+    ChatUser = FriendChat.users.through
+    chat_ids = ChatUser.objects.using(DEFAULT_DB_ALIAS).filter(customuser_id=user_id).values('friendchat_id')
+    return frozenset(ChatUser.objects.using(DEFAULT_DB_ALIAS).filter(friendchat_id__in=chat_ids)
+                     .exclude(customuser_id=user_id).values_list('customuser_id', flat=True))
+
+
+def get_friend_ids(user_id):
+    """ Returns the IDs of the user's friends, from the cache if they're in it. """
+    key = get_friends_cache_key(user_id)
+    friend_ids = cache.get(key)
+    if friend_ids is None:
+        friend_ids = load_friend_ids(user_id)
+        cache.set(key, friend_ids, settings.FRIENDS_CACHE_TIMEOUT)
+    return friend_ids
+
+
+def are_friends(user_id, other_user_id):
+    return other_user_id in get_friend_ids(user_id)
+
+
+def invalidate_friend_ids(user_ids):
+    """ Removes the friend sets of the users from the cache once the current transaction is committed. """
+    keys = [get_friends_cache_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,39 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from chats.export import EXPORT_FORMATS, iter_messages, parse_cursor
+
+
+class Command(BaseCommand):
+    help = "Exports the messages of all of a user's friend chats and channels, as JSON Lines or CSV. Each message " \
+           "includes a cursor, which can be passed with --cursor to resume an interrupted export after it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Username of the user whose messages are exported.')
+        parser.add_argument('--file-type', choices=list(EXPORT_FORMATS), default='jsonl', help='Format of the export.')
+        parser.add_argument('--cursor', help='Cursor of the last exported message, to resume the export after it.')
+        parser.add_argument('--output', help='File to write the export to. Defaults to the standard output.')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+        if options['cursor']:
+            try:
+                parse_cursor(options['cursor'])
+            except ValueError:
+                raise CommandError('Invalid cursor.')
+
+        _, render = EXPORT_FORMATS[options['file_type']]
+        parts = render(iter_messages(user, options['cursor']))
+        if options['output'] is None:
+            sys.stdout.writelines(parts)
+            return
+        # Append when resuming, so that the export continues in the same file, which already has the CSV header row
+        if options['cursor'] and options['file_type'] == 'csv':
+            next(parts)
+        with open(options['output'], 'a' if options['cursor'] else 'w', newline='', encoding='utf-8') as file:
+            file.writelines(parts)
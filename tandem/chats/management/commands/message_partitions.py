@@ -0,0 +1,63 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chats.partitions import PARTITIONED_MODELS, month_start, add_months, get_partitions, create_partition, \
+    detach_partition
+
+
+class Command(BaseCommand):
+    help = 'Manages the monthly partitions of the chat message tables. Should be run periodically (e.g. daily) with ' \
+           'the "create" action, as messages can only be inserted if a partition exists for their month.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'create', 'archive'],
+                            help='"list" shows the existing partitions, "create" creates the partitions for the '
+                                 'current month and the following ones, and "archive" detaches old partitions.')
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Number of months after the current one to create partitions for.')
+        parser.add_argument('--before', type=lambda x: datetime.datetime.strptime(x, '%Y-%m'),
+                            help='Archive the partitions of the months before this one (YYYY-MM).')
+        parser.add_argument('--drop', action='store_true',
+                            help='Drop archived partitions after detaching them, instead of keeping them as '
+                                 'standalone tables.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Message partitions are only supported on PostgreSQL.')
+
+        tables = [model._meta.db_table for model in PARTITIONED_MODELS]
+        with connection.cursor() as cursor:
+            if options['action'] == 'list':
+                for table in tables:
+                    for month, name in sorted(get_partitions(cursor, table).items()):
+                        self.stdout.write(f'{table}: {name} ({month:%Y-%m})')
+
+            elif options['action'] == 'create':
+                current_month = month_start(datetime.datetime.now(datetime.timezone.utc))
+                for table in tables:
+                    for i in range(options['months_ahead'] + 1):
+                        month = add_months(current_month, i)
+                        if create_partition(cursor, table, month):
+                            self.stdout.write(self.style.SUCCESS(f'Created partition {month:%Y-%m} of {table}'))
+
+            elif options['action'] == 'archive':
+                if options['before'] is None:
+                    raise CommandError('The --before argument is required to archive partitions.')
+                before = options['before'].replace(tzinfo=datetime.timezone.utc)
+                if before > month_start(datetime.datetime.now(datetime.timezone.utc)):
+                    raise CommandError('The partition of the current month cannot be archived.')
+
+                for table in tables:
+                    for month, name in sorted(get_partitions(cursor, table).items()):
+                        if month >= before:
+                            continue
+                        # Detaching concurrently doesn't block the table, so it can be done while the app is running
+                        detach_partition(cursor, table, name)
+                        if options['drop']:
+                            cursor.execute(f'DROP TABLE "{name}"')
+                            self.stdout.write(self.style.SUCCESS(f'Detached and dropped partition {name}'))
+                        else:
+                            self.stdout.write(self.style.SUCCESS(
+                                f'Detached partition {name}. It can now be backed up with pg_dump and dropped.'))
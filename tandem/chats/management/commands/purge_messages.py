@@ -0,0 +1,53 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from chats.models import FriendChat
+from chats.purge import purge_expired_messages, purge_channel_messages, purge_friend_chat_messages, \
+    purge_deleted_channels
+from communities.models import Channel
+
+
+class Command(BaseCommand):
+    help = 'Deletes chat messages in batches. Should be run periodically (e.g. daily) with the "expired" action to ' \
+           'enforce the message retention periods, and with the "deleted" action to finish the deletion of channels ' \
+           'whose purge was interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['expired', 'deleted', 'channel', 'friend_chat'],
+                            help='"expired" deletes the messages older than their retention period, "deleted" deletes '
+                                 'the channels marked as deleted along with their messages, and "channel" and '
+                                 '"friend_chat" delete a chat along with all its messages.')
+        parser.add_argument('--id', help='ID of the chat to delete.')
+        parser.add_argument('--batch-size', type=int, help='Number of messages deleted at a time.')
+        parser.add_argument('--delay', type=float, help='Seconds to pause between batches.')
+
+    def handle(self, *args, **options):
+        kwargs = {'batch_size': options['batch_size'], 'delay': options['delay']}
+
+        if options['action'] == 'expired':
+            deleted = purge_expired_messages(
+                progress=lambda description, count: self.stdout.write(f'{description}: {count} messages deleted'),
+                **kwargs)
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired messages'))
+            return
+
+        if options['action'] == 'deleted':
+            deleted = purge_deleted_channels(
+                progress=lambda channel_id, count: self.stdout.write(f'channel {channel_id}: {count} messages deleted'),
+                **kwargs)
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} channels'))
+            return
+
+        if options['id'] is None:
+            raise CommandError('The --id argument is required to delete a chat.')
+        # Channels marked as deleted can be deleted too
+        model, manager, purge = (Channel, Channel.all_objects, purge_channel_messages) \
+            if options['action'] == 'channel' else (FriendChat, FriendChat.objects, purge_friend_chat_messages)
+        try:
+            chat = manager.get(id=options['id'])
+        except (model.DoesNotExist, ValidationError):
+            raise CommandError(f"{model.__name__} '{options['id']}' does not exist.")
+
+        deleted = purge(chat, progress=lambda count: self.stdout.write(f'{count} messages deleted'), **kwargs)
+        chat.delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {model.__name__} {chat.id} and its {deleted} messages'))
@@ -0,0 +1,101 @@
+"""
+Converts the chat message tables into tables partitioned by month on their timestamp, and moves the existing messages
+into them. PostgreSQL requires the partition key to be part of the primary key, so the tables' primary key becomes
+(id, timestamp), while Django keeps treating 'id' as the primary key.
+
+Partitions are created from the month of the oldest message until three months from now. Further partitions must be
+created ahead of time with the 'message_partitions create' command, as messages outside of them can't be inserted.
+
+Only applies to PostgreSQL, other databases are left unchanged.
+"""
+import datetime
+
+from django.db import migrations
+
+TABLES = {
+    'chats_channelchatmessage': ('channel_id', 'communities_channel'),
+    'chats_friendchatmessage': ('chat_id', 'chats_friendchat'),
+}
+MONTHS_AHEAD = 3
+
+
+def month_start(value):
+    value = value.astimezone(datetime.timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def get_months(cursor, table):
+    """ Returns the UTC month starts from the table's oldest message until its newest message or MONTHS_AHEAD months
+    from now, whichever is later. """
+    cursor.execute(f'SELECT MIN("timestamp"), MAX("timestamp") FROM "{table}"')
+    oldest, newest = cursor.fetchone()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    month = month_start(oldest or now)
+    last = max(add_months(month_start(now), MONTHS_AHEAD), month_start(newest or now))
+    months = []
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def add_constraints(cursor, table, primary_key):
+    parent_column, parent_table = TABLES[table]
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY ({primary_key})')
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_author_id_fk" FOREIGN KEY ("author_id") '
+                   f'REFERENCES "users_customuser" ("id") DEFERRABLE INITIALLY DEFERRED')
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_{parent_column}_fk" FOREIGN KEY ("{parent_column}") '
+                   f'REFERENCES "{parent_table}" ("id") DEFERRABLE INITIALLY DEFERRED')
+    cursor.execute(f'CREATE INDEX "{table}_author_id_idx" ON "{table}" ("author_id")')
+    # Serves the message lists, which filter by chat and are ordered by timestamp
+    cursor.execute(f'CREATE INDEX "{table}_{parent_column}_timestamp_idx" ON "{table}" '
+                   f'("{parent_column}", "timestamp" DESC)')
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f'CREATE TABLE "{table}_partitioned" (LIKE "{table}" INCLUDING DEFAULTS) '
+                           f'PARTITION BY RANGE ("timestamp")')
+            for month in get_months(cursor, table):
+                cursor.execute(f'CREATE TABLE "{table}_p{month:%Y%m}" PARTITION OF "{table}_partitioned" '
+                               f'FOR VALUES FROM (%s) TO (%s)', [month, add_months(month, 1)])
+            cursor.execute(f'INSERT INTO "{table}_partitioned" SELECT * FROM "{table}"')
+            cursor.execute(f'DROP TABLE "{table}"')
+            cursor.execute(f'ALTER TABLE "{table}_partitioned" RENAME TO "{table}"')
+            add_constraints(cursor, table, '"id", "timestamp"')
+
+
+def unpartition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f'CREATE TABLE "{table}_unpartitioned" (LIKE "{table}" INCLUDING DEFAULTS)')
+            cursor.execute(f'INSERT INTO "{table}_unpartitioned" SELECT * FROM "{table}"')
+            # Dropping the partitioned table drops its partitions too
+            cursor.execute(f'DROP TABLE "{table}"')
+            cursor.execute(f'ALTER TABLE "{table}_unpartitioned" RENAME TO "{table}"')
+            add_constraints(cursor, table, '"id"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0002_initial'),
+        ('communities', '0002_initial'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
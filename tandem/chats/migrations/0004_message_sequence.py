@@ -0,0 +1,87 @@
+"""
+Gives new messages time-ordered (version 7) UUIDs, and adds a per-chat sequence number to messages. Existing messages
+keep their IDs, and their sequence numbers are set in timestamp order, one chat and batch at a time, so that the
+backfill doesn't hold long locks on the message tables.
+"""
+from django.db import migrations, models, transaction
+
+import tandem.identifiers
+
+BATCH_SIZE = 1000
+
+
+def backfill_sequences(apps, schema_editor):
+    for model_name, chat_field in (('ChannelChatMessage', 'channel_id'), ('FriendChatMessage', 'chat_id')):
+        model = apps.get_model('chats', model_name)
+        chat_ids = model.objects.filter(sequence__isnull=True).values_list(chat_field, flat=True).distinct()
+        for chat_id in chat_ids.iterator():
+            messages = model.objects.filter(**{chat_field: chat_id}).order_by('timestamp', 'id')
+            batch = []
+            for sequence, message_id in enumerate(messages.values_list('id', flat=True).iterator(chunk_size=BATCH_SIZE), start=1):
+                batch.append(model(id=message_id, sequence=sequence))
+                if len(batch) == BATCH_SIZE:
+                    with transaction.atomic():
+                        model.objects.bulk_update(batch, ['sequence'])
+                    batch = []
+            with transaction.atomic():
+                model.objects.bulk_update(batch, ['sequence'])
+
+
+class Migration(migrations.Migration):
+
+    # Each batch of the backfill runs in its own transaction
+    atomic = False
+
+    dependencies = [
+        ('chats', '0003_partition_messages'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='channelchatmessage',
+            name='id',
+            field=models.UUIDField(default=tandem.identifiers.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='friendchatmessage',
+            name='id',
+            field=models.UUIDField(default=tandem.identifiers.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AddField(
+            model_name='channelchatmessage',
+            name='sequence',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='friendchatmessage',
+            name='sequence',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_sequences, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='channelchatmessage',
+            name='sequence',
+            field=models.PositiveBigIntegerField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='friendchatmessage',
+            name='sequence',
+            field=models.PositiveBigIntegerField(editable=False),
+        ),
+        migrations.AlterModelOptions(
+            name='channelchatmessage',
+            options={'ordering': ['-timestamp', '-sequence']},
+        ),
+        migrations.AlterModelOptions(
+            name='friendchatmessage',
+            options={'ordering': ['-timestamp', '-sequence']},
+        ),
+        migrations.AddIndex(
+            model_name='channelchatmessage',
+            index=models.Index(fields=['channel', 'sequence'], name='channelchatmessage_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendchatmessage',
+            index=models.Index(fields=['chat', 'sequence'], name='friendchatmessage_seq_idx'),
+        ),
+    ]
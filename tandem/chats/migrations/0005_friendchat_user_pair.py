@@ -0,0 +1,51 @@
+"""
+Adds the user pair key of friend chats. The field is added without its unique index, backfilled for the chats with
+exactly two users, and then made unique. If a pair of users has several chats, only the one with the lowest ID gets the
+key, and the rest are left without it.
+"""
+from collections import defaultdict
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_user_pairs(apps, schema_editor):
+    FriendChat = apps.get_model('chats', 'FriendChat')
+    ChatUser = FriendChat.users.through
+
+    users = defaultdict(list)
+    for chat_id, user_id in ChatUser.objects.order_by('friendchat_id').values_list('friendchat_id', 'customuser_id') \
+            .iterator(chunk_size=BATCH_SIZE):
+        users[chat_id].append(str(user_id))
+
+    chats, pairs = [], set()
+    for chat_id, user_ids in users.items():
+        if len(user_ids) != 2:
+            continue
+        pair = ':'.join(sorted(user_ids))
+        if pair not in pairs:
+            pairs.add(pair)
+            chats.append(FriendChat(id=chat_id, user_pair=pair))
+    FriendChat.objects.bulk_update(chats, ['user_pair'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0004_message_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='friendchat',
+            name='user_pair',
+            field=models.CharField(blank=True, editable=False, max_length=73, null=True),
+        ),
+        migrations.RunPython(backfill_user_pairs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='friendchat',
+            name='user_pair',
+            field=models.CharField(blank=True, editable=False, max_length=73, null=True, unique=True),
+        ),
+    ]
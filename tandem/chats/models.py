@@ -1,24 +1,72 @@
 import uuid
 
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Max
 from django.utils import timezone
 from dry_rest_permissions.generics import authenticated_users, allow_staff_or_superuser
 from rest_framework.generics import get_object_or_404
 
+from tandem.authorization import get_authorization_context
+from tandem.identifiers import uuid7
+
 
 class AbstractChatMessage(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    """
+    Base chat message model. Messages get time-ordered (version 7) UUIDs, and a sequence number that increases by one
+    with each message of the same chat, which gives messages with the same timestamp a stable order and lets clients
+    fetch the messages after the last one they've seen.
+    """
+
+    # Name of the foreign key to the chat that the message belongs to
+    chat_field_name = None
+
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     content = models.TextField(
         max_length=2048
     )
     timestamp = models.DateTimeField(
         default=timezone.now
     )
+    sequence = models.PositiveBigIntegerField(
+        editable=False
+    )
 
     class Meta:
         abstract = True
 
+    def get_next_sequence(self):
+        """ Returns the next sequence number of the message's chat. Must be called inside a transaction: the chat's row
+        is locked until it ends, so that concurrent messages don't get the same number. """
+        field = self._meta.get_field(self.chat_field_name)
+        chat_id = getattr(self, field.attname)
+        # A 'no key' lock doesn't block the inserts of other rows that reference the chat
+        list(field.related_model.objects.select_for_update(no_key=True).filter(pk=chat_id).values_list('pk'))
+        messages = type(self).objects.filter(**{field.attname: chat_id})
+        return (messages.aggregate(Max('sequence'))['sequence__max'] or 0) + 1
+
+    def save(self, *args, **kwargs):
+        if self.sequence is not None:
+            return self.save_to_partition(*args, **kwargs)
+        with transaction.atomic():
+            self.sequence = self.get_next_sequence()
+            return self.save_to_partition(*args, **kwargs)
+
+    def save_to_partition(self, *args, **kwargs):
+        """ Saves the message. If the table has no partition for the message's month (e.g. if the 'message_partitions
+        create' command hasn't been run in time), the partition is created and the message is saved again. """
+        # Imported here, as the partitions module imports the message models
+        from chats.partitions import create_missing_partition, is_missing_partition_error
+
+        try:
+            with transaction.atomic():
+                return super(AbstractChatMessage, self).save(*args, **kwargs)
+        except IntegrityError as error:
+            if not is_missing_partition_error(error):
+                raise
+        create_missing_partition(self._meta.db_table, self.timestamp)
+        return super(AbstractChatMessage, self).save(*args, **kwargs)
+
 
 class FriendChatMessage(AbstractChatMessage):
 
@@ -27,16 +75,22 @@ class FriendChatMessage(AbstractChatMessage):
     @allow_staff_or_superuser
     def has_list_permission(request):
         """ Allow only chat members and staff to access the message list. """
-        chat = get_object_or_404(FriendChat, id=request.query_params.get('chat'))
-        return chat.users.filter(id=request.user.id).exists()
+        chat_id = request.query_params.get('chat')
+        if get_authorization_context(request).is_friend_chat_member(chat_id):
+            return True
+        # Respond with a 404 status if the chat doesn't exist
+        get_object_or_404(FriendChat, id=chat_id)
+        return False
 
     @authenticated_users
     @allow_staff_or_superuser
     def has_object_read_permission(self, request):
         """ Allow only chat members and staff to access the message's details. """
-        return self.chat.users.filter(id=request.user.id).exists()
+        return get_authorization_context(request).is_friend_chat_member(self.chat_id)
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    chat_field_name = 'chat'
+
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     chat = models.ForeignKey(
         to='FriendChat',
         blank=False,
@@ -50,7 +104,10 @@ class FriendChatMessage(AbstractChatMessage):
     )
 
     class Meta:
-        ordering = ['-timestamp']
+        ordering = ['-timestamp', '-sequence']
+        indexes = [
+            models.Index(fields=['chat', 'sequence'], name='friendchatmessage_seq_idx'),
+        ]
 
 
 class FriendChat(models.Model):
@@ -60,6 +117,21 @@ class FriendChat(models.Model):
         blank=False,
         related_name="friend_chats"
     )
+    # Canonical key of the chat's pair of users (see get_user_pair()), which makes the chat of each pair unique and lets
+    # it be found with a single index lookup. Kept in sync with the chat's users (see tandem.signals), and null if the
+    # chat doesn't have exactly two users.
+    user_pair = models.CharField(
+        max_length=73,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False
+    )
+
+    @staticmethod
+    def get_user_pair(user_id, other_user_id):
+        """ Returns the key of a pair of users: their IDs in ascending order, separated by a colon. """
+        return ':'.join(sorted((str(user_id), str(other_user_id))))
 
 
 class ChannelChatMessage(AbstractChatMessage):
@@ -70,16 +142,22 @@ class ChannelChatMessage(AbstractChatMessage):
     def has_list_permission(request):
         """ Allow only channel members and staff to access the message list. """
         from communities.models import Channel
-        channel = get_object_or_404(Channel, id=request.query_params.get('channel'))
-        return channel.memberships.filter(user=request.user).exists()
+        channel_id = request.query_params.get('channel')
+        if get_authorization_context(request).is_channel_member(channel_id):
+            return True
+        # Respond with a 404 status if the channel doesn't exist
+        get_object_or_404(Channel, id=channel_id)
+        return False
 
     @authenticated_users
     @allow_staff_or_superuser
     def has_object_read_permission(self, request):
         """ Allow only channel members and staff to access the message's details. """
-        return self.channel.memberships.filter(user=request.user).exists()
+        return get_authorization_context(request).is_channel_member(self.channel_id)
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    chat_field_name = 'channel'
+
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     author = models.ForeignKey(
         to=settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -92,4 +170,7 @@ class ChannelChatMessage(AbstractChatMessage):
     )
 
     class Meta:
-        ordering = ['-timestamp']
+        ordering = ['-timestamp', '-sequence']
+        indexes = [
+            models.Index(fields=['channel', 'sequence'], name='channelchatmessage_seq_idx'),
+        ]
@@ -0,0 +1,88 @@
+"""
+Helpers to manage the monthly range partitions of the chat message tables, which are partitioned by timestamp (see
+migration 0003_partition_messages). Partitions are named '<table>_p<YYYYMM>' and cover one calendar month in UTC.
+"""
+import datetime
+import logging
+import re
+
+from django.db import ProgrammingError, connection, transaction
+from psycopg2 import errorcodes
+
+from chats.models import ChannelChatMessage, FriendChatMessage
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_MODELS = [ChannelChatMessage, FriendChatMessage]
+
+
+def month_start(value):
+    """ Returns the first instant of the UTC month of the given datetime. """
+    value = value.astimezone(datetime.timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, months):
+    """ Returns the start of the month that is the given number of months after (or before) the given month start. """
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def get_partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def get_partitions(cursor, table):
+    """ Returns a dictionary with the month start of each of the table's partitions as keys and their names as values.
+    Partitions that don't follow the naming scheme are ignored. """
+    cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s
+    """, [table])
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = re.fullmatch(rf'{re.escape(table)}_p(\d{{4}})(\d{{2}})', name)
+        if match:
+            month = datetime.datetime(int(match[1]), int(match[2]), 1, tzinfo=datetime.timezone.utc)
+            partitions[month] = name
+    return partitions
+
+
+def create_partition(cursor, table, month):
+    """ Creates the partition for the given month, if it doesn't exist. Returns whether it was created. """
+    if month in get_partitions(cursor, table):
+        return False
+    cursor.execute(
+        f'CREATE TABLE "{get_partition_name(table, month)}" PARTITION OF "{table}" FOR VALUES FROM (%s) TO (%s)',
+        [month, add_months(month, 1)]
+    )
+    return True
+
+
+def is_missing_partition_error(error):
+    """ Returns whether the database error was raised because a row was inserted into a partitioned table which has no
+    partition for it. """
+    cause = error.__cause__
+    return getattr(cause, 'pgcode', None) == errorcodes.CHECK_VIOLATION and 'no partition of relation' in str(cause)
+
+
+def create_missing_partition(table, timestamp):
+    """ Creates the partition of the timestamp's month when a message is inserted without one. Concurrent inserts may
+    create it at the same time, in which case the error of the one that loses is ignored. """
+    month = month_start(timestamp)
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            if create_partition(cursor, table, month):
+                logger.warning('Created missing partition %s', get_partition_name(table, month))
+    except ProgrammingError as error:
+        if getattr(error.__cause__, 'pgcode', None) != errorcodes.DUPLICATE_TABLE:
+            raise
+
+
+def detach_partition(cursor, table, name):
+    """ Detaches a partition from its table without blocking reads and writes to the rest of the table. The partition is
+    kept as a standalone table. Must be run outside of a transaction. """
+    cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}" CONCURRENTLY')
@@ -0,0 +1,162 @@
+"""
+Presence tracking for the chat WebSocket. Each connection refreshes its entry in a presence store with a heartbeat, and
+entries expire if they aren't refreshed within the store's timeout, so connections that are dropped without closing
+(e.g. when a worker crashes) go offline by themselves. The store also keeps the users online in each chat, to provide
+per-chat online counts.
+
+Nothing is written to the database: the store is kept in Redis, shared by all workers, or in memory for development and
+tests. Presence changes are only broadcast when a user comes online or goes offline, not on every heartbeat.
+"""
+import functools
+import threading
+import time
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BasePresenceStore:
+    """ Base class of presence stores. User, connection and chat IDs are strings. """
+
+    def __init__(self, timeout=60, **kwargs):
+        # Seconds after which a connection that hasn't sent a heartbeat is considered gone
+        self.timeout = timeout
+
+    @property
+    def heartbeat_interval(self):
+        """ Seconds between the heartbeats of each connection. Leaves room for two heartbeats to be lost before the
+        connection's entry expires. """
+        return self.timeout / 3
+
+    def touch(self, user_id, connection_id, chat_ids):
+        """ Registers a connection of the user, or refreshes it. Returns True if the user had no other live connections,
+        i.e. if they just came online. """
+        raise NotImplementedError
+
+    def remove(self, user_id, connection_id, chat_ids):
+        """ Removes a connection of the user. Returns True if the user has no live connections left, i.e. if they just
+        went offline. """
+        raise NotImplementedError
+
+    def get_online_counts(self, chat_ids):
+        """ Returns a dictionary with the number of users online in each of the given chats. """
+        raise NotImplementedError
+
+
+class InMemoryPresenceStore(BasePresenceStore):
+    """ Presence store kept in the memory of the current process. Only suitable for development and tests, as each
+    worker has its own store. """
+
+    def __init__(self, timeout=60, **kwargs):
+        super(InMemoryPresenceStore, self).__init__(timeout, **kwargs)
+        self.lock = threading.Lock()
+        # Expiry times of each user's connections and of each chat's online users
+        self.connections = defaultdict(dict)
+        self.chats = defaultdict(dict)
+
+    @staticmethod
+    def prune(entries, now):
+        for key in [key for key, expiry in entries.items() if expiry <= now]:
+            del entries[key]
+
+    def touch(self, user_id, connection_id, chat_ids):
+        now = time.monotonic()
+        with self.lock:
+            connections = self.connections[user_id]
+            self.prune(connections, now)
+            came_online = not connections
+            connections[connection_id] = now + self.timeout
+            for chat_id in chat_ids:
+                self.chats[chat_id][user_id] = now + self.timeout
+        return came_online
+
+    def remove(self, user_id, connection_id, chat_ids):
+        now = time.monotonic()
+        with self.lock:
+            connections = self.connections[user_id]
+            connections.pop(connection_id, None)
+            self.prune(connections, now)
+            if connections:
+                return False
+            del self.connections[user_id]
+            for chat_id in chat_ids:
+                self.chats[chat_id].pop(user_id, None)
+        return True
+
+    def get_online_counts(self, chat_ids):
+        now = time.monotonic()
+        with self.lock:
+            return {chat_id: sum(expiry > now for expiry in self.chats.get(chat_id, {}).values())
+                    for chat_id in chat_ids}
+
+
+class RedisPresenceStore(BasePresenceStore):
+    """
+    Presence store kept in Redis. Each user's connections and each chat's online users are kept in sorted sets, scored
+    by their expiry time. Expired members are ignored when counting and removed on the next write to their set, and the
+    sets themselves expire when they're no longer written to. Each operation takes a single round trip, plus one more
+    when a user's last connection is removed.
+    """
+
+    def __init__(self, timeout=60, location='redis://localhost:6379/0', key_prefix='presence', **kwargs):
+        super(RedisPresenceStore, self).__init__(timeout, **kwargs)
+        self.client = redis.Redis.from_url(location)
+        self.key_prefix = key_prefix
+
+    def get_user_key(self, user_id):
+        return f'{self.key_prefix}:user:{user_id}'
+
+    def get_chat_key(self, chat_id):
+        return f'{self.key_prefix}:chat:{chat_id}'
+
+    def touch(self, user_id, connection_id, chat_ids):
+        now = time.time()
+        expiry = now + self.timeout
+        user_key = self.get_user_key(user_id)
+        with self.client.pipeline() as pipe:
+            pipe.zremrangebyscore(user_key, '-inf', now)
+            pipe.zcard(user_key)
+            pipe.zadd(user_key, {connection_id: expiry})
+            pipe.expire(user_key, self.timeout)
+            for chat_id in chat_ids:
+                chat_key = self.get_chat_key(chat_id)
+                pipe.zadd(chat_key, {user_id: expiry})
+                pipe.expire(chat_key, self.timeout)
+            connection_count = pipe.execute()[1]
+        return connection_count == 0
+
+    def remove(self, user_id, connection_id, chat_ids):
+        now = time.time()
+        user_key = self.get_user_key(user_id)
+        with self.client.pipeline() as pipe:
+            pipe.zrem(user_key, connection_id)
+            pipe.zremrangebyscore(user_key, '-inf', now)
+            pipe.zcard(user_key)
+            connection_count = pipe.execute()[2]
+        if connection_count:
+            return False
+
+        with self.client.pipeline() as pipe:
+            for chat_id in chat_ids:
+                chat_key = self.get_chat_key(chat_id)
+                pipe.zrem(chat_key, user_id)
+                pipe.zremrangebyscore(chat_key, '-inf', now)
+            pipe.execute()
+        return True
+
+    def get_online_counts(self, chat_ids):
+        now = time.time()
+        with self.client.pipeline(transaction=False) as pipe:
+            for chat_id in chat_ids:
+                pipe.zcount(self.get_chat_key(chat_id), f'({now}', '+inf')
+            return dict(zip(chat_ids, pipe.execute()))
+
+
+@functools.lru_cache(maxsize=None)
+def get_presence_store():
+    """ Returns the presence store configured in settings.PRESENCE, which is shared by all the consumers of the process.
+    """
+    options = {key.lower(): value for key, value in settings.PRESENCE.items()}
+    return import_string(options.pop('backend'))(**options)
@@ -0,0 +1,141 @@
+"""
+Chunked deletion of chat messages, used to enforce the message retention policies and to delete chats with many
+messages. Django's cascading deletes load every related row into memory before deleting it, and delete them all in a
+single transaction. Instead, messages are deleted here in batches of settings.MESSAGE_PURGE['BATCH_SIZE'] rows, each
+one with a single set-based DELETE statement in its own transaction, pausing for settings.MESSAGE_PURGE['BATCH_DELAY']
+seconds between batches so that purges don't starve live traffic. Deleted channels are hidden and purged by a
+background thread of the worker, outside of the request that deletes them. They stay marked as deleted until they're
+gone, so that the 'purge_messages' command finishes their deletion if the worker stops before it's done.
+"""
+import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction, router
+from django.utils import timezone
+
+from chats.models import ChannelChatMessage, FriendChatMessage
+from communities.models import Channel, Membership
+
+logger = logging.getLogger(__name__)
+
+# Runs the deletions of channels one at a time, so that they don't add up to more than one purge per worker
+purge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='purge')
+
+
+def delete_in_batches(queryset, batch_size=None, delay=None, progress=None):
+    """ Deletes the rows of the queryset in batches. Returns the number of rows deleted. 'progress' is called with the
+    total number of rows deleted so far after each batch. Must only be used with models that no other rows reference,
+    as the deletes bypass Django's collector and signals. """
+    batch_size = batch_size or settings.MESSAGE_PURGE['BATCH_SIZE']
+    delay = settings.MESSAGE_PURGE['BATCH_DELAY'] if delay is None else delay
+    model = queryset.model
+    using = router.db_for_write(model)
+    table = connections[using].ops.quote_name(model._meta.db_table)
+    pk_column = connections[using].ops.quote_name(model._meta.pk.column)
+
+    total = 0
+    while True:
+        batch = queryset.order_by().values('pk')[:batch_size]
+        subquery, params = batch.query.get_compiler(using=using).as_sql()
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE {pk_column} IN ({subquery})', params)
+            deleted = cursor.rowcount
+        total += deleted
+        if progress is not None:
+            progress(total)
+        if deleted < batch_size:
+            return total
+        if delay:
+            time.sleep(delay)
+
+
+def purge_channel_messages(channel, **kwargs):
+    """ Deletes all the messages of a channel, so that it can then be deleted without loading them. """
+    deleted = delete_in_batches(ChannelChatMessage.objects.filter(channel=channel), **kwargs)
+    logger.info('Purged %d messages of channel %s', deleted, channel.id)
+    return deleted
+
+
+def delete_channel(channel_id, **kwargs):
+    """ Deletes the channel's messages in batches, and then the channel, so that the messages aren't loaded into memory
+    by the cascading delete. Does nothing unless the channel is marked as deleted, e.g. if it has already been deleted.
+    """
+    channel = Channel.all_objects.filter(id=channel_id, deleted_at__isnull=False).first()
+    if channel is not None:
+        purge_channel_messages(channel, **kwargs)
+        channel.delete()
+
+
+def run_purge(function, *args):
+    """ Runs a purge in the purge thread, and closes the thread's database connections afterwards. """
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Purge %s%r failed', function.__name__, args)
+    finally:
+        connections.close_all()
+
+
+def schedule_channel_deletion(channel):
+    """ Marks the channel as deleted and deletes its memberships, so that it's no longer listed and no one can post in
+    it, and then deletes it in the purge thread once the current transaction is committed. """
+    with transaction.atomic():
+        channel.deleted_at = timezone.now()
+        channel.save(update_fields=['deleted_at'])
+        # The memberships' signals are skipped, as the counters of the deleted channel don't need to be updated
+        delete_in_batches(Membership.objects.filter(channel=channel), delay=0)
+    channel_id = channel.id
+    transaction.on_commit(lambda: purge_executor.submit(run_purge, delete_channel, channel_id))
+
+
+def purge_deleted_channels(progress=None, **kwargs):
+    """ Deletes the channels that are marked as deleted and their messages, e.g. those whose deletion was interrupted
+    by a restart of the worker. Returns the number of channels deleted. 'progress' is called with the ID of each
+    channel and the number of its messages deleted so far. """
+    channel_ids = list(Channel.all_objects.filter(deleted_at__isnull=False).values_list('id', flat=True))
+    for channel_id in channel_ids:
+        delete_channel(channel_id, progress=(lambda count: progress(channel_id, count)) if progress else None, **kwargs)
+    return len(channel_ids)
+
+
+def purge_friend_chat_messages(chat, **kwargs):
+    """ Deletes all the messages of a friend chat, so that it can then be deleted without loading them. """
+    deleted = delete_in_batches(FriendChatMessage.objects.filter(chat=chat), **kwargs)
+    logger.info('Purged %d messages of friend chat %s', deleted, chat.id)
+    return deleted
+
+
+def get_expired_messages():
+    """ Yields a description and a queryset of each set of messages that are older than their retention period.
+    Channels use their own retention period if they have one, and the global one otherwise. Messages are kept forever if
+    neither is set. """
+    now = timezone.now()
+    # Channels' retention periods can't be less than a day, but a 0 saved without validation would delete all of the
+    # channel's messages, so it keeps them forever instead, like the global setting
+    channels = Channel.objects.filter(message_retention_days__gte=1).values_list('id', 'message_retention_days')
+    for channel_id, retention_days in list(channels):
+        yield f'channel {channel_id}', ChannelChatMessage.objects.filter(
+            channel_id=channel_id, timestamp__lt=now - datetime.timedelta(days=retention_days))
+
+    retention_days = settings.MESSAGE_PURGE['RETENTION_DAYS']
+    if retention_days:
+        cutoff = now - datetime.timedelta(days=retention_days)
+        yield 'channels', ChannelChatMessage.objects.filter(channel__message_retention_days__isnull=True,
+                                                            timestamp__lt=cutoff)
+        yield 'friend chats', FriendChatMessage.objects.filter(timestamp__lt=cutoff)
+
+
+def purge_expired_messages(progress=None, **kwargs):
+    """ Deletes the messages that are older than their retention period. Returns the number of messages deleted.
+    'progress' is called with the description of each set of messages and the number deleted so far. """
+    total = 0
+    for description, queryset in get_expired_messages():
+        deleted = delete_in_batches(
+            queryset, progress=(lambda count: progress(description, count)) if progress else None, **kwargs)
+        if deleted:
+            logger.info('Purged %d expired messages of %s', deleted, description)
+        total += deleted
+    return total
@@ -2,9 +2,10 @@ from django.contrib.auth import get_user_model
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 from rest_framework.reverse import reverse
-from rest_framework.utils.field_mapping import get_nested_relation_kwargs
 
 from chats.models import FriendChat, FriendChatMessage, ChannelChatMessage
+from common.serializers import BULK_CREATE_MAX_SIZE
+from tandem.authorization import get_authorization_context
 
 
 class ChatMessageAuthorSerializer(serializers.HyperlinkedModelSerializer):
@@ -28,11 +29,24 @@ class FriendChatMessageSerializer(serializers.HyperlinkedModelSerializer):
             'author',
             'chat',
             'content',
-            'timestamp'
+            'timestamp',
+            'sequence'
+        ]
+
+
+class FriendChatUserSerializer(serializers.HyperlinkedModelSerializer):
+    class Meta:
+        model = get_user_model()
+        fields = [
+            'id',
+            'url',
+            'username',
+            'image'
         ]
 
 
 class FriendChatSerializer(serializers.HyperlinkedModelSerializer):
+    users = FriendChatUserSerializer(many=True, read_only=True)
     messages = serializers.SerializerMethodField(method_name='get_messages')
 
     def to_representation(self, instance):
@@ -47,32 +61,13 @@ class FriendChatSerializer(serializers.HyperlinkedModelSerializer):
         # If the user is admin or a member of the chat, get only the chat's latest message. Else, return an empty
         # queryset.
         user = self.context['request'].user
-        if user.is_staff or user in instance.users.all():
-            queryset = instance.messages.order_by('-timestamp')[:1]
+        if user.is_staff or get_authorization_context(self.context['request']).is_friend_chat_member(instance.id):
+            queryset = instance.messages.order_by('-timestamp', '-sequence')[:1]
         else:
             queryset = instance.messages.none()
         return FriendChatMessageSerializer(queryset, many=True, read_only=True,
                                            context={'request': self.context['request']}).data
 
-    def build_nested_field(self, field_name, relation_info, nested_depth):
-        """
-        Create nested fields for forward and reverse relationships.
-        Source: https://stackoverflow.com/a/50633184
-        """
-
-        class NestedUserSerializer(serializers.HyperlinkedModelSerializer):
-            class Meta:
-                model = get_user_model()
-                depth = nested_depth - 1
-                fields = ['id', 'url', 'username', 'image']
-
-        if field_name == 'users':
-            field_class = NestedUserSerializer
-
-        field_kwargs = get_nested_relation_kwargs(relation_info)
-
-        return field_class, field_kwargs
-
     class Meta:
         model = FriendChat
         fields = [
@@ -81,7 +76,6 @@ class FriendChatSerializer(serializers.HyperlinkedModelSerializer):
             'users',
             'messages'
         ]
-        depth = 1
 
 
 class ChannelChatMessageSerializer(serializers.HyperlinkedModelSerializer):
@@ -95,5 +89,22 @@ class ChannelChatMessageSerializer(serializers.HyperlinkedModelSerializer):
             'author',
             'channel',
             'content',
-            'timestamp'
+            'timestamp',
+            'sequence'
         ]
+
+
+class FriendChatBulkCreateSerializer(serializers.Serializer):
+    """
+    Validates the data of bulk friend chat creation requests: the IDs of the users to open chats with. All users are
+    fetched in one query.
+    """
+
+    users = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=BULK_CREATE_MAX_SIZE)
+
+    def validate_users(self, value):
+        user_ids = set(value)
+        found_ids = set(get_user_model().objects.filter(id__in=user_ids).values_list('id', flat=True))
+        if missing_ids := user_ids - found_ids:
+            raise serializers.ValidationError(f"Users not found: {', '.join(sorted(map(str, missing_ids)))}.")
+        return sorted(user_ids)
@@ -0,0 +1,723 @@
+import csv
+import datetime
+import io
+import json
+import uuid
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase, APIRequestFactory, force_authenticate
+
+from chats.compiled_serializers import CompiledChannelChatMessageSerializer, CompiledFriendChatMessageSerializer
+from chats.consumers import ChatConsumer
+from chats.ephemeral import GroupThrottle, build_event
+from chats.friends import get_friend_ids, get_friends_cache_key, load_friend_ids
+from chats.models import ChannelChatMessage, FriendChat, FriendChatMessage
+from chats.partitions import PARTITIONED_MODELS, create_partition, get_partitions, month_start
+from chats.presence import InMemoryPresenceStore
+from chats.purge import delete_in_batches, purge_executor, purge_expired_messages, purge_deleted_channels
+from chats.serializers import ChannelChatMessageSerializer, FriendChatMessageSerializer
+from communities.models import Channel, Membership, ChannelRole
+from tandem.backends import CachedModelBackend
+from tandem.handlers import StreamingASGIHandler
+from tandem.routers import PrimaryReplicaRouter
+from users.views import UserViewSet
+
+
+def create_message_partitions(*timestamps):
+    """
+    Creates the message partitions of the months of the given timestamps. The migrations only create the partitions
+    from the current month on, and messages outside of them can't be inserted. Does nothing with databases other than
+    PostgreSQL, whose tables aren't partitioned.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for model in PARTITIONED_MODELS:
+            for timestamp in timestamps:
+                create_partition(cursor, model._meta.db_table, month_start(timestamp))
+
+
+class ChannelChatMessageListTests(APITestCase):
+    """Contains tests for the channel chat message list endpoint."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='message_list_user', email='message_list@example.com',
+                                                        password='password')
+        cls.channel = Channel.objects.create(name='message list channel', language='DE', level='BE')
+        Membership.objects.create(user=cls.user, channel=cls.channel, role=ChannelRole.USER)
+        now = timezone.now()
+        create_message_partitions(*(now - datetime.timedelta(days=days) for days in (1, 40, 80)))
+        for days in (1, 40, 80):
+            ChannelChatMessage.objects.create(author=cls.user, channel=cls.channel, content=f'{days} days ago',
+                                              timestamp=now - datetime.timedelta(days=days))
+
+    def setUp(self):
+        super(ChannelChatMessageListTests, self).setUp()
+        self.client.force_authenticate(user=self.user)
+
+    def test_message_list_filtered_by_time_range(self):
+        """
+        Tests that the 'since' and 'until' parameters limit the list to the messages sent in that time range.
+        """
+        now = timezone.now()
+        url = reverse('channelchatmessage-list')
+        params = {
+            'channel': self.channel.id,
+            'since': (now - datetime.timedelta(days=60)).isoformat(),
+            'until': (now - datetime.timedelta(days=2)).isoformat(),
+        }
+        response = self.client.get(url, data=params)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([message['content'] for message in response.data['results']], ['40 days ago'])
+
+    def test_message_list_permissions(self):
+        """
+        Tests that users who aren't members of the channel can't list its messages, and that a 404 status is returned
+        if the channel doesn't exist.
+        """
+        url = reverse('channelchatmessage-list')
+        other_channel = Channel.objects.create(name='other message list channel', language='DE', level='BE')
+
+        response = self.client.get(url, data={'channel': other_channel.id})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get(url, data={'channel': uuid.uuid4()})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_message_list_after_sequence(self):
+        """
+        Tests that the 'after_sequence' parameter limits the list to the messages after the given one.
+        """
+        url = reverse('channelchatmessage-list')
+        response = self.client.get(url, data={'channel': self.channel.id, 'after_sequence': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([message['sequence'] for message in response.data['results']], [2, 3])
+
+
+class CompiledMessageSerializerTests(APITestCase):
+    """Contains tests for the compiled message serializers of the message list endpoints."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [get_user_model().objects.create_user(username=f'compiled_user_{i}',
+                                                          email=f'compiled_{i}@example.com', password='password')
+                     for i in range(2)]
+        cls.channel = Channel.objects.create(name='compiled channel', language='DE', level='BE')
+        Membership.objects.create(user=cls.users[0], channel=cls.channel, role=ChannelRole.USER)
+        cls.chat = FriendChat.objects.create()
+        cls.chat.users.add(*cls.users)
+        timestamp = datetime.datetime(2022, 3, 27, 0, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+        create_message_partitions(timestamp)
+        for i, user in enumerate(cls.users * 2):
+            ChannelChatMessage.objects.create(author=user, channel=cls.channel, content=f'Channel message {i}',
+                                              timestamp=timestamp + datetime.timedelta(hours=i))
+            FriendChatMessage.objects.create(author=user, chat=cls.chat, content=f'Friend message {i}',
+                                             timestamp=timestamp + datetime.timedelta(hours=i))
+
+    def setUp(self):
+        super(CompiledMessageSerializerTests, self).setUp()
+        self.client.force_authenticate(user=self.users[0])
+
+    def test_output_matches_serializers(self):
+        """
+        Tests that the message list endpoints return the same output as the messages' DRF serializers, in the
+        messages' order, across a daylight saving time change of the current timezone.
+        """
+        runs = [
+            ('channelchatmessage-list', {'channel': self.channel.id}, ChannelChatMessageSerializer,
+             self.channel.messages.all()),
+            ('friendchatmessage-list', {'chat': self.chat.id}, FriendChatMessageSerializer, self.chat.messages.all()),
+        ]
+        for view_name, params, serializer_class, queryset in runs:
+            with self.subTest(view_name=view_name):
+                response = self.client.get(reverse(view_name), data=params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                expected = serializer_class(queryset, many=True, context={'request': response.wsgi_request}).data
+                self.assertEqual(response.json()['results'], json.loads(json.dumps(expected)))
+
+    @override_settings(USE_TZ=True, TIME_ZONE='UTC')
+    def test_compiled_serializers_with_format_suffix(self):
+        """
+        Tests that the compiled serializers keep the URL format suffix and format UTC timestamps with a 'Z' suffix.
+        """
+        request = self.client.get(reverse('channelchatmessage-list'), data={'channel': self.channel.id}).wsgi_request
+        runs = [
+            (CompiledChannelChatMessageSerializer, ChannelChatMessageSerializer, self.channel.messages.all()),
+            (CompiledFriendChatMessageSerializer, FriendChatMessageSerializer, self.chat.messages.all()),
+        ]
+        for compiled_serializer_class, serializer_class, queryset in runs:
+            with self.subTest(serializer_class=serializer_class.__name__):
+                context = {'request': request, 'format': 'json'}
+                compiled = compiled_serializer_class(context)
+                expected = serializer_class(queryset, many=True, context=context).data
+                self.assertEqual(compiled.serialize(compiled.get_values(queryset)), expected)
+                self.assertTrue(expected[0]['url'].endswith('.json'))
+                self.assertTrue(expected[0]['timestamp'].endswith('Z'))
+
+
+class ChatMessageSequenceTests(APITestCase):
+    """Contains tests for the identifiers and sequence numbers of chat messages."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='sequence_user', email='sequence@example.com',
+                                                        password='password')
+        cls.channels = [Channel.objects.create(name=f'sequence channel {i}', language='DE', level='BE')
+                        for i in range(2)]
+
+    def test_sequence_increases_per_chat(self):
+        """
+        Tests that each chat's messages are numbered independently, starting from 1.
+        """
+        for channel in self.channels * 2:
+            ChannelChatMessage.objects.create(author=self.user, channel=channel, content='Message')
+
+        for channel in self.channels:
+            self.assertEqual(list(channel.messages.order_by('sequence').values_list('sequence', flat=True)), [1, 2])
+
+    def test_missing_partition_is_created(self):
+        """
+        Tests that messages can be saved for a month without a partition, whose partition is then created.
+        """
+        timestamp = datetime.datetime(2000, 1, 15, tzinfo=datetime.timezone.utc)
+        message = ChannelChatMessage.objects.create(author=self.user, channel=self.channels[0], content='Message',
+                                                    timestamp=timestamp)
+
+        self.assertTrue(ChannelChatMessage.objects.filter(id=message.id).exists())
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                self.assertIn(month_start(timestamp), get_partitions(cursor, ChannelChatMessage._meta.db_table))
+
+    def test_message_ids_are_time_ordered(self):
+        """
+        Tests that new messages get version 7 UUIDs, whose leading bits are the creation time in milliseconds.
+        """
+        messages = [ChannelChatMessage.objects.create(author=self.user, channel=self.channels[0], content='Message')
+                    for _ in range(3)]
+
+        self.assertTrue(all(message.id.version == 7 for message in messages))
+        timestamps = [message.id.int >> 80 for message in messages]
+        self.assertEqual(sorted(timestamps), timestamps)
+
+
+class FriendChatBulkCreateTests(APITestCase):
+    """Contains tests for the bulk friend chat creation endpoint."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.other_users = [
+            get_user_model().objects.create_user(username=f'bulk_chat_user_{i}', email=f'bulk_chat_{i}@example.com',
+                                                 password='password')
+            for i in range(4)
+        ]
+        chat = FriendChat.objects.create()
+        chat.users.add(cls.user, cls.other_users[0])
+
+    def setUp(self):
+        super(FriendChatBulkCreateTests, self).setUp()
+        self.client.force_authenticate(user=self.user)
+
+    def test_bulk_create_skips_existing_chats(self):
+        """
+        Tests that a chat is created with each user who didn't have one with the session's user, along with its first
+        message, and that the rest of the users are skipped.
+        """
+        url = reverse('friendchat-bulk-create')
+        user_ids = [str(user.id) for user in self.other_users] + [str(self.user.id)]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data={'users': user_ids}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual({str(chat['user']) for chat in response.data['created']}, set(user_ids[1:3]))
+        self.assertEqual({str(user_id) for user_id in response.data['skipped']}, {user_ids[0], user_ids[3]})
+        for created_chat in response.data['created']:
+            chat = FriendChat.objects.get(id=created_chat['id'])
+            self.assertEqual(set(chat.users.values_list('id', flat=True)), {self.user.id, created_chat['user']})
+            self.assertEqual(list(chat.messages.values_list('sequence', flat=True)), [1])
+
+    def test_bulk_create_with_unknown_user(self):
+        """
+        Tests that no chats are created if any of the specified users doesn't exist.
+        """
+        url = reverse('friendchat-bulk-create')
+        response = self.client.post(url, data={'users': [str(self.other_users[1].id), str(uuid.uuid4())]},
+                                    format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(FriendChat.objects.filter(users=self.other_users[1]).exists())
+
+
+class FriendCacheTests(APITestCase):
+    """Contains tests for the cached friend sets."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.other_users = [
+            get_user_model().objects.create_user(username=f'friend_cache_user_{i}',
+                                                 email=f'friend_cache_{i}@example.com')
+            for i in range(4)
+        ]
+        cls.chat = FriendChat.objects.create()
+        cls.chat.users.add(cls.user, cls.other_users[0])
+
+    def setUp(self):
+        super(FriendCacheTests, self).setUp()
+        self.client.force_authenticate(user=self.user)
+        cache.clear()
+
+    def test_friend_sets_are_invalidated(self):
+        """
+        Tests that the cached friend sets of a chat's users are updated when users are added to or removed from the
+        chat, and when it's deleted.
+        """
+        self.assertEqual(get_friend_ids(self.user.id), {self.other_users[0].id})
+        self.assertEqual(get_friend_ids(self.other_users[1].id), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            chat = FriendChat.objects.create()
+            chat.users.add(self.user)
+            self.other_users[1].friend_chats.add(chat)
+        self.assertEqual(get_friend_ids(self.user.id), {self.other_users[0].id, self.other_users[1].id})
+        self.assertEqual(get_friend_ids(self.other_users[1].id), {self.user.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chat.users.remove(self.other_users[0])
+        self.assertEqual(get_friend_ids(self.user.id), {self.other_users[1].id})
+        self.assertEqual(get_friend_ids(self.other_users[0].id), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            chat.delete()
+        self.assertEqual(get_friend_ids(self.user.id), set())
+        self.assertEqual(get_friend_ids(self.other_users[1].id), set())
+
+    def test_duplicate_chat_is_rejected(self):
+        """
+        Tests that a chat can't be created between two users who already have one, even if the cached friend set is
+        outdated, and that users other than the session's user are listed as discoverable.
+        """
+        url = reverse('friendchat-list')
+        response = self.client.post(url, data={'users': [str(self.other_users[0].id)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        cache.set(get_friends_cache_key(self.user.id), frozenset())
+        response = self.client.post(url, data={'users': [str(self.other_users[0].id)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data={'users': [str(self.other_users[1].id)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(get_friend_ids(self.user.id), {self.other_users[0].id, self.other_users[1].id})
+
+        response = self.client.get(reverse('customuser-discover'))
+        self.assertEqual([str(user['id']) for user in response.data['results']], [str(self.other_users[2].id)])
+
+    def test_cached_data_is_loaded_from_primary(self):
+        """
+        Tests that friend sets and session users are loaded from the primary database even if reads are sent to the
+        replicas, so that a replica that lags behind doesn't put outdated data back into the cache.
+        """
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_read', return_value='replica'):
+            self.assertEqual(load_friend_ids(self.user.id), {self.other_users[0].id})
+            self.assertEqual(CachedModelBackend().get_user(self.user.id), self.user)
+
+
+class FriendChatPairTests(APITestCase):
+    """Contains tests for the user pair key of friend chats."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.other_users = [
+            get_user_model().objects.create_user(username=f'pair_user_{i}', email=f'pair_{i}@example.com')
+            for i in range(4)
+        ]
+        cls.chat = FriendChat.objects.create()
+        cls.chat.users.add(cls.user, cls.other_users[0])
+
+    def setUp(self):
+        super(FriendChatPairTests, self).setUp()
+        self.client.force_authenticate(user=self.user)
+
+    def test_user_pair_follows_users(self):
+        """
+        Tests that the user pair key is set when a chat has two users, cleared otherwise, and that a second chat can't
+        be created for the same pair of users.
+        """
+        user_pair = FriendChat.get_user_pair(self.other_users[0].id, self.user.id)
+        self.assertEqual(FriendChat.objects.get(user_pair=user_pair), self.chat)
+
+        chat = FriendChat.objects.create()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            chat.users.add(self.user, self.other_users[0])
+
+        self.chat.users.remove(self.other_users[0])
+        self.chat.refresh_from_db()
+        self.assertIsNone(self.chat.user_pair)
+        self.other_users[1].friend_chats.add(self.chat)
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.user_pair, FriendChat.get_user_pair(self.user.id, self.other_users[1].id))
+
+    def test_pair_filter(self):
+        """
+        Tests that the chat list returns the session user's chat with the user specified in the 'pair' parameter, and
+        that either the 'users' or the 'pair' parameter is required.
+        """
+        url = reverse('friendchat-list')
+        response = self.client.get(url, {'pair': str(self.other_users[0].id)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([chat['id'] for chat in response.data['results']], [str(self.chat.id)])
+
+        response = self.client.get(url, {'pair': str(self.other_users[1].id)})
+        self.assertEqual(response.data['results'], [])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_created_chats_have_user_pairs(self):
+        """
+        Tests that the chats created through the API get their user pair keys.
+        """
+        response = self.client.post(reverse('friendchat-list'), data={'users': [str(self.other_users[1].id)]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(FriendChat.objects.get(id=response.data['id']).user_pair,
+                         FriendChat.get_user_pair(self.user.id, self.other_users[1].id))
+
+        response = self.client.post(reverse('friendchat-bulk-create'),
+                                    data={'users': [str(self.other_users[0].id), str(self.other_users[2].id)]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([str(user_id) for user_id in response.data['skipped']], [str(self.other_users[0].id)])
+        self.assertEqual(FriendChat.objects.get(id=response.data['created'][0]['id']).user_pair,
+                         FriendChat.get_user_pair(self.user.id, self.other_users[2].id))
+
+
+class MessageExportTests(APITestCase):
+    """Contains tests for the message export endpoint."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='export_user', email='export_user@example.com')
+        cls.friend = get_user_model().objects.create_user(username='export_friend', email='export_friend@example.com')
+        chat = FriendChat.objects.create()
+        chat.users.add(cls.user, cls.friend)
+        for i in range(2):
+            FriendChatMessage.objects.create(author=cls.friend, chat=chat, content=f'friend chat message {i}')
+        channel = Channel.objects.create(name='export channel', language='DE', level='BE')
+        Membership.objects.create(user=cls.user, channel=channel, role=ChannelRole.USER)
+        for i in range(3):
+            ChannelChatMessage.objects.create(author=cls.user, channel=channel, content=f'channel message {i}')
+        other_channel = Channel.objects.create(name='other export channel', language='DE', level='BE')
+        ChannelChatMessage.objects.create(author=cls.friend, channel=other_channel, content='not exported')
+        cls.url = reverse('customuser-export', kwargs={'pk': cls.user.id})
+
+    def setUp(self):
+        super(MessageExportTests, self).setUp()
+        self.client.force_authenticate(user=self.user)
+
+    def get_lines(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_export_and_resume(self):
+        """
+        Tests that the messages of the user's chats are exported in order, and that the export can be resumed after
+        the cursor of any of them.
+        """
+        messages = [json.loads(line) for line in self.get_lines(self.client.get(self.url))]
+        self.assertEqual([message['content'] for message in messages],
+                         ['friend chat message 0', 'friend chat message 1',
+                          'channel message 0', 'channel message 1', 'channel message 2'])
+
+        response = self.client.get(self.url, data={'cursor': messages[1]['cursor']})
+        resumed = [json.loads(line) for line in self.get_lines(response)]
+        self.assertEqual(resumed, messages[2:])
+
+    def test_csv_export(self):
+        """
+        Tests that the export can be downloaded as CSV, with a header row.
+        """
+        response = self.client.get(self.url, data={'file_type': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO('\n'.join(self.get_lines(response)))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[2]['chat_type'], 'channel')
+        self.assertEqual(rows[2]['sequence'], '1')
+
+    def test_export_permissions_and_validation(self):
+        """
+        Tests that users can only export their own messages, and that invalid parameters get a 400 response.
+        """
+        self.client.force_authenticate(user=self.friend)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.url, data={'cursor': 'channel:not-a-uuid:1'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, data={'file_type': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_streamed_export_finishes_request(self):
+        """
+        Tests that the ASGI handler closes streamed exports once they're sent, which sends the request_finished signal
+        that returns the request's database connection.
+        """
+        request = APIRequestFactory().get(self.url)
+        force_authenticate(request, user=self.user)
+        response = UserViewSet.as_view({'get': 'export'})(request, pk=self.user.id)
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        receiver = mock.Mock()
+        # Closing the connection would end the test's transaction, as with the test client
+        request_finished.disconnect(close_old_connections)
+        request_finished.connect(receiver)
+        try:
+            async_to_sync(StreamingASGIHandler().send_response)(response, send)
+        finally:
+            request_finished.disconnect(receiver)
+            request_finished.connect(close_old_connections)
+
+        receiver.assert_called_once()
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        self.assertEqual(len(body.decode().splitlines()), 5)
+
+
+@override_settings(MESSAGE_PURGE={'RETENTION_DAYS': 60, 'BATCH_SIZE': 2, 'BATCH_DELAY': 0})
+class MessagePurgeTests(APITestCase):
+    """Contains tests for the batched message purges."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='purge_user', email='purge_user@example.com')
+        cls.channel = Channel.objects.create(name='purge channel', language='DE', level='BE',
+                                             message_retention_days=30)
+        cls.other_channel = Channel.objects.create(name='other purge channel', language='DE', level='BE')
+        Membership.objects.create(user=cls.user, channel=cls.channel, role=ChannelRole.ADMIN)
+        cls.chat = FriendChat.objects.create()
+        cls.chat.users.add(cls.user)
+
+        now = timezone.now()
+        create_message_partitions(*(now - datetime.timedelta(days=days) for days in (1, 40, 80)))
+        for days in (1, 40):
+            ChannelChatMessage.objects.create(author=cls.user, channel=cls.channel, content=f'channel {days}',
+                                              timestamp=now - datetime.timedelta(days=days))
+        for days in (40, 80):
+            ChannelChatMessage.objects.create(author=cls.user, channel=cls.other_channel,
+                                              content=f'other channel {days}',
+                                              timestamp=now - datetime.timedelta(days=days))
+            FriendChatMessage.objects.create(author=cls.user, chat=cls.chat, content=f'friend chat {days}',
+                                             timestamp=now - datetime.timedelta(days=days))
+
+    def test_delete_in_batches(self):
+        """
+        Tests that all the rows of the queryset are deleted, a batch at a time, and that progress is reported after
+        each batch.
+        """
+        progress = []
+        deleted = delete_in_batches(ChannelChatMessage.objects.all(), progress=progress.append)
+
+        self.assertEqual(deleted, 4)
+        self.assertEqual(progress, [2, 4, 4])
+        self.assertFalse(ChannelChatMessage.objects.exists())
+        self.assertEqual(FriendChatMessage.objects.count(), 2)
+
+    def test_expired_messages_are_purged(self):
+        """
+        Tests that messages are deleted once they're older than their channel's retention period, or the global one if
+        their chat doesn't have its own.
+        """
+        self.assertEqual(purge_expired_messages(), 3)
+
+        self.assertEqual(set(ChannelChatMessage.objects.values_list('content', flat=True)),
+                         {'channel 1', 'other channel 40'})
+        self.assertEqual(set(FriendChatMessage.objects.values_list('content', flat=True)), {'friend chat 40'})
+
+    def test_zero_retention_period_keeps_messages(self):
+        """
+        Tests that channel admins can't set a retention period of 0 days, and that one saved without validation keeps
+        the channel's messages forever instead of deleting them all.
+        """
+        self.client.force_authenticate(user=self.user)
+        response = self.client.patch(reverse('channel-detail', kwargs={'pk': self.channel.id}),
+                                     data={'message_retention_days': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        Channel.objects.filter(id=self.channel.id).update(message_retention_days=0)
+        purge_expired_messages()
+        self.assertEqual(ChannelChatMessage.objects.filter(channel=self.channel).count(), 2)
+
+    def test_channel_delete_purges_messages(self):
+        """
+        Tests that deleting a channel hides it and deletes its memberships right away, and deletes all of its messages
+        and then the channel in the purge thread, once the request's transaction is committed.
+        """
+        self.client.force_authenticate(user=self.user)
+        url = reverse('channel-detail', kwargs={'pk': self.channel.id})
+        # Run the purge in the test's thread, which has the test's transaction
+        with mock.patch.object(purge_executor, 'submit', side_effect=lambda run, function, *args: function(*args)), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(url)
+
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+            self.assertFalse(Membership.objects.filter(channel_id=self.channel.id).exists())
+            self.assertTrue(Channel.all_objects.filter(id=self.channel.id).exists())
+
+        self.assertFalse(Channel.all_objects.filter(id=self.channel.id).exists())
+        self.assertFalse(ChannelChatMessage.objects.filter(channel_id=self.channel.id).exists())
+        self.assertEqual(ChannelChatMessage.objects.filter(channel=self.other_channel).count(), 2)
+
+    def test_interrupted_channel_delete_is_finished(self):
+        """
+        Tests that a deleted channel and its messages stay hidden if its purge doesn't run (e.g. because the worker
+        stopped), that its name can't be reused until it's purged, and that purging the deleted channels deletes it and
+        its messages.
+        """
+        self.client.force_authenticate(user=self.user)
+        with mock.patch.object(purge_executor, 'submit'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('channel-detail', kwargs={'pk': self.channel.id}))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        response = self.client.get(reverse('channel-list'), {'memberships__user': self.user.id})
+        self.assertNotIn(str(self.channel.id), [channel['id'] for channel in response.data['results']])
+        response = self.client.get(reverse('channelchatmessage-list'), {'channel': self.channel.id})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse('channel-list'),
+                                    data={'name': self.channel.name, 'language': 'DE', 'level': 'BE'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(purge_deleted_channels(), 1)
+        self.assertFalse(Channel.all_objects.filter(id=self.channel.id).exists())
+        self.assertFalse(ChannelChatMessage.objects.filter(channel_id=self.channel.id).exists())
+        self.assertEqual(ChannelChatMessage.objects.filter(channel=self.other_channel).count(), 2)
+
+
+class PresenceStoreTests(SimpleTestCase):
+    """Contains tests for the in-memory presence store."""
+
+    def setUp(self):
+        self.store = InMemoryPresenceStore(timeout=60)
+
+    def test_transitions(self):
+        """
+        Tests that users only come online with their first connection and go offline with their last one.
+        """
+        self.assertTrue(self.store.touch('user', 'connection 1', ['chat']))
+        self.assertFalse(self.store.touch('user', 'connection 2', ['chat']))
+        self.assertFalse(self.store.touch('user', 'connection 1', ['chat']))
+        self.assertEqual(self.store.get_online_counts(['chat']), {'chat': 1})
+
+        self.assertFalse(self.store.remove('user', 'connection 1', ['chat']))
+        self.assertTrue(self.store.remove('user', 'connection 2', ['chat']))
+        self.assertEqual(self.store.get_online_counts(['chat']), {'chat': 0})
+
+    def test_connections_expire_without_heartbeats(self):
+        """
+        Tests that connections which don't send heartbeats within the timeout are considered gone.
+        """
+        with mock.patch('chats.presence.time.monotonic', return_value=1000):
+            self.store.touch('user', 'connection', ['chat'])
+            self.store.touch('other user', 'other connection', ['chat'])
+        with mock.patch('chats.presence.time.monotonic', return_value=1050):
+            self.store.touch('other user', 'other connection', ['chat'])
+        with mock.patch('chats.presence.time.monotonic', return_value=1070):
+            self.assertEqual(self.store.get_online_counts(['chat']), {'chat': 1})
+            # The user comes back online with their next heartbeat
+            self.assertTrue(self.store.touch('user', 'connection', ['chat']))
+
+
+class EphemeralEventTests(SimpleTestCase):
+    """Contains tests for the validation and throttling of ephemeral chat events."""
+
+    def test_build_event(self):
+        """
+        Tests that only known event types with valid fields are accepted.
+        """
+        self.assertEqual(build_event({'type': 'read', 'chat_id': 'chat', 'sequence': 3}, 'user'),
+                         {'type': 'read', 'chat_id': 'chat', 'user_id': 'user', 'sequence': 3})
+        self.assertIsNone(build_event({'type': 'read', 'chat_id': 'chat', 'sequence': '3'}, 'user'))
+        self.assertIsNone(build_event({'type': 'chat_message', 'chat_id': 'chat'}, 'user'))
+
+    def test_group_throttle(self):
+        """
+        Tests that repeated typing events and read receipts for already read messages are dropped.
+        """
+        throttle = GroupThrottle()
+        typing = build_event({'type': 'typing', 'chat_id': 'chat'}, 'user')
+        self.assertTrue(throttle.allow(typing))
+        self.assertFalse(throttle.allow(typing))
+        self.assertTrue(throttle.allow(build_event({'type': 'typing', 'chat_id': 'chat'}, 'other user')))
+
+        self.assertTrue(throttle.allow(build_event({'type': 'read', 'chat_id': 'chat', 'sequence': 5}, 'user')))
+        self.assertFalse(throttle.allow(build_event({'type': 'read', 'chat_id': 'chat', 'sequence': 4}, 'user')))
+
+
+class ChatConsumerTests(APITestCase):
+    """Contains tests for the handling of the client's messages by the chat consumer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='consumer_user', email='consumer_user@example.com')
+        cls.channel = Channel.objects.create(name='consumer channel', language='DE', level='BE')
+        cls.other_channel = Channel.objects.create(name='other consumer channel', language='DE', level='BE')
+        Membership.objects.create(user=cls.user, channel=cls.channel, role=ChannelRole.USER)
+
+    def setUp(self):
+        self.consumer = ChatConsumer()
+        self.consumer.scope = {'user': self.user}
+        self.consumer.channel_name = 'consumer'
+        self.consumer.channel_layer = mock.Mock(group_add=mock.AsyncMock(), group_send=mock.AsyncMock())
+
+    def test_join_chat(self):
+        """
+        Tests that the consumer only joins the chats that the user is a member of when the client asks it to, and that
+        it then relays the chat's ephemeral events.
+        """
+        for chat_id in (str(self.channel.id), str(self.other_channel.id), 'not a chat ID'):
+            self.consumer.receive_json({'type': 'join_chat', 'chat_id': chat_id})
+
+        self.assertEqual(self.consumer.chat_ids, [str(self.channel.id)])
+        self.consumer.channel_layer.group_add.assert_called_once_with(str(self.channel.id), 'consumer')
+
+        async_to_sync(self.consumer.receive_ephemeral_event)({'type': 'typing', 'chat_id': str(self.channel.id)})
+        self.consumer.channel_layer.group_send.assert_called_once()
+
+    def test_received_text_is_decoded_once(self):
+        """
+        Tests that the text of the messages received from the client is only decoded when they're dispatched.
+        """
+        with mock.patch.object(self.consumer, 'decode_json', wraps=self.consumer.decode_json) as decode_json, \
+                mock.patch.object(self.consumer, 'receive_json') as receive_json:
+            async_to_sync(self.consumer.dispatch)({'type': 'websocket.receive', 'text': '{"type": "heartbeat"}'})
+
+        decode_json.assert_called_once()
+        receive_json.assert_called_once_with({'type': 'heartbeat'})
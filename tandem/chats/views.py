@@ -1,26 +1,36 @@
 from django.contrib.auth import get_user_model
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, inline_serializer, \
     OpenApiResponse
 from dry_rest_permissions.generics import DRYPermissions
 from rest_framework import viewsets, status, mixins, fields
+from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from chats.compiled_serializers import CompiledChannelChatMessageSerializer, CompiledFriendChatMessageSerializer
+from chats.consumers import send_chats_join
+from chats.friends import are_friends, invalidate_friend_ids
 
 from chats.filters import ChannelChatMessageFilter, FriendChatMessageFilter, FriendChatFilter
 from chats.models import FriendChat, FriendChatMessage, ChannelChatMessage
 from chats.serializers import FriendChatSerializer, ChannelChatMessageSerializer, \
-    FriendChatMessageSerializer
+    FriendChatMessageSerializer, FriendChatBulkCreateSerializer
 
 
 @extend_schema_view(
     list=extend_schema(
         description="Returns a list of user chats.",
         parameters=[
-            OpenApiParameter('users', type=OpenApiTypes.UUID, required=True,
+            OpenApiParameter('users', type=OpenApiTypes.UUID,
                              description="The ID of a user to filter by. The session's user must be the same as the "
-                                         "specified user, unless they're a superuser.", )
+                                         "specified user, unless they're a superuser. Required if 'pair' isn't "
+                                         "specified.", ),
+            OpenApiParameter('pair', type=OpenApiTypes.UUID,
+                             description="The ID of a user. Returns the session user's chat with them, if it "
+                                         "exists.", )
         ]
     ),
     retrieve=extend_schema(
@@ -40,7 +50,24 @@ from chats.serializers import FriendChatSerializer, ChannelChatMessageSerializer
                                  response=inline_serializer(name="friend_chat_create_not_found", fields={
                                      "detail": fields.CharField()
                                  }))
-        })
+        }),
+    bulk_create=extend_schema(
+        description="Creates a chat between the session's user and each of the specified users in a single request.",
+        request=FriendChatBulkCreateSerializer,
+        responses={
+            201: inline_serializer(name="friend_chat_bulk_create_response", fields={
+                "created": fields.ListField(child=inline_serializer(name="friend_chat_bulk_create_item", fields={
+                    "id": fields.UUIDField(),
+                    "url": fields.URLField(),
+                    "user": fields.UUIDField(),
+                })),
+                "skipped": fields.ListField(child=fields.UUIDField(),
+                                            help_text="IDs of the users who already had a chat with the session's "
+                                                      "user, or of the session's user themselves."),
+            }),
+            400: OpenApiResponse(description="The user list is empty or too long, or some users weren't found.")
+        }
+    )
 )
 class FriendChatViewSet(mixins.ListModelMixin,
                         mixins.CreateModelMixin,
@@ -74,16 +101,18 @@ class FriendChatViewSet(mixins.ListModelMixin,
                                            "user."},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        # Check that a chat with the two users doesn't exist already
-        if FriendChat.objects.filter(users=request.user).filter(users=other_user).exists():
-            return Response(data={"error": "A chat for this pair of users already exists."},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-        response = super(FriendChatViewSet, self).create(request, *args, **kwargs)
-        chat = FriendChat.objects.get(id=response.data['id'])
-        chat.users.add(request.user)
-        chat.users.add(other_user)
-        chat.save()
+        # Check that a chat with the two users doesn't exist already, in the session user's cached friends and then
+        # with the chats' user pair key. The key's unique index also rejects chats created concurrently.
+        user_pair = FriendChat.get_user_pair(request.user.id, other_user.id)
+        duplicate_error = {"error": "A chat for this pair of users already exists."}
+        if are_friends(request.user.id, other_user.id) or FriendChat.objects.filter(user_pair=user_pair).exists():
+            return Response(data=duplicate_error, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                chat = FriendChat.objects.create(user_pair=user_pair)
+        except IntegrityError:
+            return Response(data=duplicate_error, status=status.HTTP_400_BAD_REQUEST)
+        chat.users.add(request.user, other_user)
 
         first_message = FriendChatMessage(
             author=request.user,
@@ -93,8 +122,73 @@ class FriendChatViewSet(mixins.ListModelMixin,
         first_message.save()
 
         serialized_chat = FriendChatSerializer(chat, context={"request": request})
-        response.data = serialized_chat.data
-        return response
+        headers = self.get_success_headers(serialized_chat.data)
+        return Response(serialized_chat.data, status=status.HTTP_201_CREATED, headers=headers)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    @transaction.atomic
+    def bulk_create(self, request):
+        """ Creates a friend chat between the session's user and each of the users in the 'users' array, with a 'Chat
+        created' first message, in a single transaction. Users who already have a chat with the session's user are
+        skipped. The open WebSocket connections of all the chats' users are then told to join the chats' groups. """
+        serializer = FriendChatBulkCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data['users']
+
+        user_pairs = {user_id: FriendChat.get_user_pair(request.user.id, user_id) for user_id in user_ids}
+        existing_pairs = set(FriendChat.objects.filter(user_pair__in=user_pairs.values())
+                             .values_list('user_pair', flat=True))
+        existing_ids = {user_id for user_id, user_pair in user_pairs.items() if user_pair in existing_pairs}
+        existing_ids.add(request.user.id)
+        new_ids = [user_id for user_id in user_ids if user_id not in existing_ids]
+
+        try:
+            with transaction.atomic():
+                chats = FriendChat.objects.bulk_create([FriendChat(user_pair=user_pairs[user_id])
+                                                        for user_id in new_ids])
+        except IntegrityError:
+            # Another request created one of the chats in the meantime
+            return Response(data={"error": "Some of the chats already exist."}, status=status.HTTP_400_BAD_REQUEST)
+        ChatUser = FriendChat.users.through
+        ChatUser.objects.bulk_create([ChatUser(friendchat_id=chat.id, customuser_id=user_id)
+                                      for chat, other_user_id in zip(chats, new_ids)
+                                      for user_id in (request.user.id, other_user_id)])
+        # The chats are new, so their first message is also the first of their sequence
+        FriendChatMessage.objects.bulk_create([FriendChatMessage(author=request.user, chat=chat, content="Chat created",
+                                                                 sequence=1) for chat in chats])
+
+        if chats:
+            # The users were added in bulk, without sending the signals that remove their friends from the cache
+            invalidate_friend_ids([request.user.id, *new_ids])
+            chat_ids_by_user = {request.user.id: [chat.id for chat in chats]}
+            chat_ids_by_user.update({user_id: [chat.id] for chat, user_id in zip(chats, new_ids)})
+            transaction.on_commit(lambda: send_chats_join(chat_ids_by_user))
+
+        return Response(data={
+            "created": [{
+                "id": chat.id,
+                "url": reverse('friendchat-detail', kwargs={'pk': chat.id}, request=request),
+                "user": user_id
+            } for chat, user_id in zip(chats, new_ids)],
+            "skipped": [user_id for user_id in user_ids if user_id in existing_ids]
+        }, status=status.HTTP_201_CREATED)
+
+
+class CompiledMessageListMixin:
+    """
+    Lists messages with the viewset's compiled serializer, which renders the rows of a .values() queryset into the
+    same output as the viewset's serializer class, without creating model instances or field objects.
+    """
+
+    compiled_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.compiled_serializer_class(self.get_serializer_context())
+        queryset = serializer.get_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(queryset))
 
 
 @extend_schema_view(
@@ -102,12 +196,21 @@ class FriendChatViewSet(mixins.ListModelMixin,
         parameters=[
             OpenApiParameter('chat', type=OpenApiTypes.UUID, required=True,
                              description="The ID of the chat that the messages belong to. The session's user must be "
-                                         "one of the chat's users, unless they're a superuser.", )
+                                         "one of the chat's users, unless they're a superuser.", ),
+            OpenApiParameter('since', type=OpenApiTypes.DATETIME,
+                             description="Returns only the messages sent at or after this time."),
+            OpenApiParameter('until', type=OpenApiTypes.DATETIME,
+                             description="Returns only the messages sent before this time."),
+            OpenApiParameter('after_sequence', type=OpenApiTypes.INT,
+                             description="Returns only the messages after the one with this sequence number."),
+            OpenApiParameter('before_sequence', type=OpenApiTypes.INT,
+                             description="Returns only the messages before the one with this sequence number."),
         ]),
     retrieve=extend_schema(
         description="Returns the details of the specified user chat message."
     ))
-class FriendChatMessageViewSet(mixins.ListModelMixin,
+class FriendChatMessageViewSet(CompiledMessageListMixin,
+                               mixins.ListModelMixin,
                                mixins.RetrieveModelMixin,
                                viewsets.GenericViewSet):
     """
@@ -119,6 +222,7 @@ class FriendChatMessageViewSet(mixins.ListModelMixin,
 
     queryset = FriendChatMessage.objects.all()
     serializer_class = FriendChatMessageSerializer
+    compiled_serializer_class = CompiledFriendChatMessageSerializer
     filterset_class = FriendChatMessageFilter
     permission_classes = [DRYPermissions]
 
@@ -128,12 +232,21 @@ class FriendChatMessageViewSet(mixins.ListModelMixin,
         parameters=[
             OpenApiParameter('channel', type=OpenApiTypes.UUID, required=True,
                              description="The ID of the channel that the messages belong to. The session's user must "
-                                         "have a membership in the specified channel, unless they're a superuser.", )
+                                         "have a membership in the specified channel, unless they're a superuser.", ),
+            OpenApiParameter('since', type=OpenApiTypes.DATETIME,
+                             description="Returns only the messages sent at or after this time."),
+            OpenApiParameter('until', type=OpenApiTypes.DATETIME,
+                             description="Returns only the messages sent before this time."),
+            OpenApiParameter('after_sequence', type=OpenApiTypes.INT,
+                             description="Returns only the messages after the one with this sequence number."),
+            OpenApiParameter('before_sequence', type=OpenApiTypes.INT,
+                             description="Returns only the messages before the one with this sequence number."),
         ]),
     retrieve=extend_schema(
         description="Returns the details of the specified channel chat message."
     ))
-class ChannelChatMessageViewSet(mixins.ListModelMixin,
+class ChannelChatMessageViewSet(CompiledMessageListMixin,
+                                mixins.ListModelMixin,
                                 mixins.RetrieveModelMixin,
                                 viewsets.GenericViewSet):
     """
@@ -145,5 +258,6 @@ class ChannelChatMessageViewSet(mixins.ListModelMixin,
 
     queryset = ChannelChatMessage.objects.all()
     serializer_class = ChannelChatMessageSerializer
+    compiled_serializer_class = CompiledChannelChatMessageSerializer
     filterset_class = ChannelChatMessageFilter
     permission_classes = [DRYPermissions]
@@ -0,0 +1,69 @@
+import asyncio
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from tandem.channel_layers import ShardedRedisChannelLayer
+
+
+class Command(BaseCommand):
+    help = 'Measures the group_send throughput of the sharded channel layer with an increasing number of Redis shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('hosts', nargs='+',
+                            help="Redis hosts to use as shards, as 'redis://host:port' URLs. Run a local stand-in for "
+                                 "each one, e.g. 'docker run -p 6380:6379 -d redis:6'.")
+        parser.add_argument('--shard-counts', nargs='+', type=int, default=[1, 2, 4],
+                            help='Numbers of shards to benchmark. Each one takes the first N hosts.')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Number of simulated API workers, each one with its own channel layer instance.')
+        parser.add_argument('--groups', type=int, default=1000, help='Number of groups (chats) to send messages to.')
+        parser.add_argument('--messages', type=int, default=20000, help='Number of messages sent in each run.')
+        parser.add_argument('--concurrency', type=int, default=200, help='Number of concurrent senders.')
+
+    def handle(self, *args, **options):
+        for shard_count in options['shard_counts']:
+            if shard_count > len(options['hosts']):
+                self.stdout.write(self.style.WARNING(
+                    f'Skipping {shard_count} shards, as only {len(options["hosts"])} hosts were provided.'))
+                continue
+
+            elapsed = asyncio.run(self.run(options['hosts'][:shard_count], options))
+            self.stdout.write(self.style.SUCCESS(
+                f'{shard_count} shard(s): {options["messages"] / elapsed:.0f} messages/s ({elapsed:.2f}s)'))
+
+    @staticmethod
+    async def run(hosts, options):
+        """ Subscribes a channel from one of the simulated workers to each group, then sends messages to the groups from
+        concurrent senders. Returns the time taken to send all the messages. """
+        # Each channel layer instance has its own client prefix, so the channels of different workers are spread across
+        # the shards, as they are in a deployment with several API processes.
+        layers = [ShardedRedisChannelLayer(hosts=hosts, capacity=options['messages'])
+                  for _ in range(options['workers'])]
+        groups = [str(uuid.uuid4()) for _ in range(options['groups'])]
+        subscriptions = []
+        for i, group in enumerate(groups):
+            layer = layers[i % len(layers)]
+            channel_name = await layer.new_channel()
+            await layer.group_add(group, channel_name)
+            subscriptions.append((layer, group, channel_name))
+
+        queue = asyncio.Queue()
+        for i in range(options['messages']):
+            queue.put_nowait(groups[i % len(groups)])
+
+        async def sender(layer):
+            while not queue.empty():
+                await layer.group_send(queue.get_nowait(), {'type': 'chat_message', 'message': 'benchmark'})
+
+        start = time.perf_counter()
+        await asyncio.gather(*(sender(layers[i % len(layers)]) for i in range(options['concurrency'])))
+        elapsed = time.perf_counter() - start
+
+        for layer, group, channel_name in subscriptions:
+            await layer.group_discard(group, channel_name)
+        await layers[0].flush()
+        for layer in layers:
+            await layer.close_pools()
+        return elapsed
@@ -0,0 +1,69 @@
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.reverse import reverse
+
+from communities.models import Channel, ChannelRole, Membership
+
+# Query parameters of each run: the lean representation, and the one with all the memberships
+RUNS = [
+    ('lean', {}),
+    ('expanded', {'expand': 'memberships'}),
+]
+
+
+class Command(BaseCommand):
+    help = 'Measures the payload size and latency of a page of the channel list, with the lean representation and ' \
+           'with the channels\' memberships expanded. Creates temporary channels and users with the configured ' \
+           'database, which are rolled back afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channels', type=int, default=10, help='Number of channels in the page.')
+        parser.add_argument('--members', type=int, default=1000, help='Number of members of each channel.')
+        parser.add_argument('--requests', type=int, default=20, help='Number of requests of each run.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            suffix = uuid.uuid4().hex[:8]
+            users = get_user_model().objects.bulk_create([
+                get_user_model()(username=f'benchmark-{suffix}-{i}', email=f'benchmark-{suffix}-{i}@example.com',
+                                 description='Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 4)
+                for i in range(options['members'])
+            ])
+            # The memberships are created in bulk, so the channels' counters are set directly
+            channels = Channel.objects.bulk_create([
+                Channel(name=f'benchmark-{suffix}-{i}', language='EN', level='BE', member_count=len(users),
+                        admin_ids=[str(users[0].id)])
+                for i in range(options['channels'])
+            ])
+            Membership.objects.bulk_create([
+                Membership(user=user, channel=channel, role=ChannelRole.ADMIN if user == users[0] else ChannelRole.USER)
+                for channel in channels for user in users
+            ], batch_size=5000)
+
+            client = Client()
+            client.force_login(users[0])
+            for name, params in RUNS:
+                self.run(client, name, {**params, 'search': f'benchmark-{suffix}', 'size': options['channels']},
+                         options['requests'])
+
+            transaction.set_rollback(True)
+
+    def run(self, client, name, params, requests):
+        url = reverse('channel-list')
+        latencies = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = client.get(url, params)
+                latencies.append(time.perf_counter() - start)
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(self.style.SUCCESS(
+            f'{name}: {len(response.content) / 1024:.1f} KiB per page, latency p50 {quantiles[49] * 1000:.2f}ms, '
+            f'p99 {quantiles[98] * 1000:.2f}ms ({len(queries) / requests:.1f} queries each)'))
@@ -0,0 +1,60 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
+
+from tandem.postgresql_pool.base import DatabaseWrapper as PooledDatabaseWrapper, get_pool_stats
+
+
+class Command(BaseCommand):
+    help = 'Compares the cost of short-lived database connections with and without the connection pool under a burst ' \
+           'of concurrent clients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to benchmark.')
+        parser.add_argument('--threads', type=int, default=16, help='Number of concurrent clients.')
+        parser.add_argument('--iterations', type=int, default=200,
+                            help="Number of 'requests' made by each client. Each one connects, runs a query and "
+                                 "closes the connection, like a request or a database_sync_to_async() call does.")
+
+    def handle(self, *args, **options):
+        settings_dict = connections[options['database']].settings_dict
+        for name, wrapper_class in (('Direct connections', PostgresDatabaseWrapper),
+                                    ('Pooled connections', PooledDatabaseWrapper)):
+            elapsed, connect_time = self.run(wrapper_class, settings_dict, options)
+            total = options['threads'] * options['iterations']
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: {total / elapsed:.0f} requests/s, {connect_time / total * 1000:.2f}ms connecting per request'))
+
+        for stats in get_pool_stats():
+            self.stdout.write(f'Pool stats: {stats}')
+
+    @staticmethod
+    def run(wrapper_class, settings_dict, options):
+        """ Runs the clients, and returns the total elapsed time and the time spent connecting. """
+        connect_times = []
+        lock = threading.Lock()
+
+        def client():
+            wrapper = wrapper_class({**settings_dict, 'CONN_MAX_AGE': 0}, options['database'])
+            connect_time = 0
+            for _ in range(options['iterations']):
+                start = time.perf_counter()
+                wrapper.ensure_connection()
+                connect_time += time.perf_counter() - start
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                wrapper.close()
+            with lock:
+                connect_times.append(connect_time)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            futures = [executor.submit(client) for _ in range(options['threads'])]
+        for future in futures:
+            # Re-raise any error raised by the clients
+            future.result()
+        return time.perf_counter() - start, sum(connect_times)
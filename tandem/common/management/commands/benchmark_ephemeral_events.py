@@ -0,0 +1,87 @@
+import asyncio
+import statistics
+import time
+import uuid
+
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from chats.consumers import ChatConsumer
+from communities.models import Channel, Membership
+
+
+class Command(BaseCommand):
+    help = 'Measures the round-trip latency of chat messages with and without a concurrent load of typing events. ' \
+           'Uses in-process WebSocket connections with the configured database and channel layer, and creates a ' \
+           'temporary channel and users, which are deleted afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=50, help='Number of connections sending typing events.')
+        parser.add_argument('--messages', type=int, default=200, help='Number of messages sent in each run.')
+        parser.add_argument('--events-per-second', type=int, default=500,
+                            help='Total rate of the typing events sent by the connections in the loaded run.')
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        channel = Channel.objects.create(name=f'benchmark-{suffix}', language='EN', level='BE')
+        users = [get_user_model().objects.create_user(username=f'benchmark-{suffix}-{i}',
+                                                      email=f'benchmark-{suffix}-{i}@example.com')
+                 for i in range(options['connections'] + 1)]
+        Membership.objects.bulk_create([Membership(user=user, channel=channel) for user in users])
+        try:
+            for rate in (0, options['events_per_second']):
+                latencies = asyncio.run(self.run(channel, users, rate, options))
+                quantiles = statistics.quantiles(latencies, n=100)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{rate} typing events/s: message latency p50 {quantiles[49] * 1000:.2f}ms, '
+                    f'p95 {quantiles[94] * 1000:.2f}ms, p99 {quantiles[98] * 1000:.2f}ms'))
+        finally:
+            channel.delete()
+            get_user_model().objects.filter(id__in=[user.id for user in users]).delete()
+
+    @staticmethod
+    async def run(channel, users, rate, options):
+        """ Connects all the users, then sends messages one at a time from the first one while the rest send typing
+        events at the given total rate. Returns the time taken by each message to come back to its sender. """
+        communicators = []
+        for user in users:
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chats/')
+            communicator.scope['user'] = user
+            await communicator.connect()
+            communicators.append(communicator)
+        sender, *typists = communicators
+        chat_id = str(channel.id)
+        running = True
+
+        async def type_events(communicator):
+            interval = len(typists) / rate
+            while running:
+                await communicator.send_json_to({'type': 'typing', 'chat_id': chat_id})
+                await asyncio.sleep(interval)
+
+        async def drain(communicator):
+            # Discard the events received by the typists. Timing out on receive_from() would stop their consumers.
+            while running:
+                while not communicator.output_queue.empty():
+                    communicator.output_queue.get_nowait()
+                await asyncio.sleep(0.05)
+
+        tasks = [asyncio.create_task(drain(communicator)) for communicator in typists]
+        if rate:
+            tasks += [asyncio.create_task(type_events(communicator)) for communicator in typists]
+
+        latencies = []
+        for i in range(options['messages']):
+            start = time.perf_counter()
+            await sender.send_json_to({'type': 'chat_message', 'chat_id': chat_id, 'chat_type': 'channels',
+                                       'content': f'Benchmark message {i}'})
+            while 'message' not in await sender.receive_json_from(timeout=10):
+                pass
+            latencies.append(time.perf_counter() - start)
+
+        running = False
+        await asyncio.gather(*tasks)
+        for communicator in communicators:
+            await communicator.disconnect()
+        return latencies
@@ -0,0 +1,58 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+
+
+class Command(BaseCommand):
+    help = 'Measures the throughput and latency of logins with each of the configured password hashers, under a ' \
+           'burst of concurrent clients. Creates a temporary user, which is deleted afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help='Number of logins made with each hasher.')
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help='Number of concurrent clients, like the sync threads of the API workers.')
+
+    def handle(self, *args, **options):
+        password = uuid.uuid4().hex
+        suffix = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create_user(username=f'benchmark-{suffix}',
+                                                    email=f'benchmark-{suffix}@example.com')
+        self.stdout.write(f'{settings.PASSWORD_HASHING["CONCURRENCY"]} hashing slots, '
+                          f'{options["concurrency"]} concurrent clients')
+        try:
+            for hasher in settings.PASSWORD_HASHERS:
+                # Only use the benchmarked hasher, so that the password isn't rehashed with another one on login
+                with override_settings(PASSWORD_HASHERS=[hasher]):
+                    user.password = make_password(password)
+                    user.save(update_fields=['password'])
+                    self.run(hasher, user.username, password, options)
+        finally:
+            user.delete()
+
+    def run(self, hasher, username, password, options):
+        def log_in(_):
+            start = time.perf_counter()
+            try:
+                if authenticate(username=username, password=password) is None:
+                    raise RuntimeError('The login failed.')
+                return time.perf_counter() - start
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            start = time.perf_counter()
+            latencies = list(executor.map(log_in, range(options['logins'])))
+            elapsed = time.perf_counter() - start
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(self.style.SUCCESS(
+            f'{hasher}: {options["logins"] / elapsed:.1f} logins/s, latency p50 {quantiles[49] * 1000:.0f}ms, '
+            f'p99 {quantiles[98] * 1000:.0f}ms'))
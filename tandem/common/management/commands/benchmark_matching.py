@@ -0,0 +1,59 @@
+import random
+import statistics
+import sys
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from common.models import AvailableLanguage, ProficiencyLevel
+from users.matching import LEARNING_LEVELS, MatchingIndex
+
+
+class Command(BaseCommand):
+    help = 'Measures the time taken to find the language exchange partners of a user, with a matching index of ' \
+           'randomly generated users. Doesn\'t use the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000, help='Number of users in the index.')
+        parser.add_argument('--queries', type=int, default=1000, help='Number of users whose partners are found.')
+        parser.add_argument('--page-size', type=int, default=10, help='Number of partners fetched for each user.')
+
+    def handle(self, *args, **options):
+        user_ids = [uuid.uuid4() for _ in range(options['users'])]
+        rows = list(self.generate_languages(user_ids))
+        index = MatchingIndex()
+        start = time.perf_counter()
+        index.load(rows)
+        self.stdout.write(f'Loaded {len(user_ids)} users in {time.perf_counter() - start:.2f}s, '
+                          f'{sum(sys.getsizeof(bitset) for bitset in index.bitsets.values()) / 2 ** 20:.1f} MiB of '
+                          f'bitsets')
+
+        latencies, counts = [], []
+        for user_id in random.sample(user_ids, min(options['queries'], len(user_ids))):
+            start = time.perf_counter()
+            matches = index.find_matches(user_id)
+            counts.append(matches.count())
+            matches[:options['page_size']]
+            latencies.append(time.perf_counter() - start)
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(self.style.SUCCESS(
+            f'Partners found for {len(latencies)} users: latency p50 {quantiles[49] * 1000:.2f}ms, '
+            f'p99 {quantiles[98] * 1000:.2f}ms, {statistics.mean(counts):.0f} partners per user on average'))
+
+        updated_ids = user_ids[:1000]
+        start = time.perf_counter()
+        for user_id in updated_ids:
+            index.set_languages(user_id, [(random.choice(AvailableLanguage.values), ProficiencyLevel.NATIVE)])
+        self.stdout.write(f'Language updates: {(time.perf_counter() - start) / len(updated_ids) * 1000:.2f}ms each on '
+                          f'average')
+
+    @staticmethod
+    def generate_languages(user_ids):
+        """ Yields a native language and one or two learning languages for each user. """
+        for user_id in user_ids:
+            native, *learning = random.sample(AvailableLanguage.values, random.randint(2, 3))
+            yield user_id, native, ProficiencyLevel.NATIVE
+            for language in learning:
+                yield user_id, language, random.choice(LEARNING_LEVELS)
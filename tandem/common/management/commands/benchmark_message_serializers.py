@@ -0,0 +1,57 @@
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from chats.compiled_serializers import CompiledChannelChatMessageSerializer
+from chats.models import ChannelChatMessage
+from chats.serializers import ChannelChatMessageSerializer
+from communities.models import Channel
+
+
+class Command(BaseCommand):
+    help = 'Measures the number of channel chat messages serialized per second by the DRF serializer and by the ' \
+           'compiled one used by the message list views. The rows are fetched once, so only the serialization is ' \
+           'measured. Creates a temporary channel with messages with the configured database, which are rolled back ' \
+           'afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000, help='Number of messages serialized in each run.')
+        parser.add_argument('--authors', type=int, default=10, help='Number of authors of the messages.')
+        parser.add_argument('--runs', type=int, default=20, help='Number of runs of each serializer.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            suffix = uuid.uuid4().hex[:8]
+            authors = get_user_model().objects.bulk_create([
+                get_user_model()(username=f'benchmark-{suffix}-{i}', email=f'benchmark-{suffix}-{i}@example.com')
+                for i in range(options['authors'])
+            ])
+            channel = Channel.objects.create(name=f'benchmark-{suffix}', language='EN', level='BE')
+            ChannelChatMessage.objects.bulk_create([
+                ChannelChatMessage(author=authors[i % len(authors)], channel=channel, content=f'Message {i}',
+                                   sequence=i + 1)
+                for i in range(options['messages'])
+            ], batch_size=5000)
+
+            context = {'request': APIRequestFactory().get('/')}
+            queryset = channel.messages.select_related('author')
+            messages = list(queryset)
+            self.run('DRF serializer', options['runs'], len(messages),
+                     lambda: ChannelChatMessageSerializer(messages, many=True, context=context).data)
+
+            compiled = CompiledChannelChatMessageSerializer(context)
+            rows = list(compiled.get_values(queryset))
+            self.run('Compiled serializer', options['runs'], len(rows), lambda: compiled.serialize(rows))
+
+            transaction.set_rollback(True)
+
+    def run(self, name, runs, count, serialize):
+        start = time.perf_counter()
+        for _ in range(runs):
+            serialize()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'{name}: {count * runs / elapsed:,.0f} rows per second'))
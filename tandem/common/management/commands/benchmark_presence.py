@@ -0,0 +1,68 @@
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from chats.presence import InMemoryPresenceStore, RedisPresenceStore
+
+
+class Command(BaseCommand):
+    help = 'Measures the cost of presence heartbeats with a large number of simulated WebSocket connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--location',
+                            help="URL of the Redis server to benchmark, e.g. 'redis://localhost:6379/15'. Its keys "
+                                 "with the benchmark's prefix are deleted afterwards. If not provided, the in-memory "
+                                 "store is benchmarked.")
+        parser.add_argument('--connections', type=int, default=100000, help='Number of simulated connections.')
+        parser.add_argument('--chats', type=int, default=10000, help='Number of chats that the users belong to.')
+        parser.add_argument('--chats-per-user', type=int, default=5, help='Number of chats of each user.')
+        parser.add_argument('--heartbeats', type=int, default=50000, help='Number of heartbeats sent in the run.')
+        parser.add_argument('--threads', type=int, default=32,
+                            help='Number of concurrent senders, like the sync threads of the API workers.')
+        parser.add_argument('--timeout', type=int, default=60, help='Presence timeout of the store, in seconds.')
+
+    def handle(self, *args, **options):
+        if options['location']:
+            store = RedisPresenceStore(timeout=options['timeout'], location=options['location'],
+                                       key_prefix=f'presence-benchmark-{uuid.uuid4()}')
+        else:
+            store = InMemoryPresenceStore(timeout=options['timeout'])
+
+        chat_ids = [str(uuid.uuid4()) for _ in range(options['chats'])]
+        connections = [(str(uuid.uuid4()), f'channel-{i}', random.sample(chat_ids, options['chats_per_user']))
+                       for i in range(options['connections'])]
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            start = time.perf_counter()
+            list(executor.map(lambda connection: store.touch(*connection), connections))
+            self.stdout.write(f'Registered {len(connections)} connections in {time.perf_counter() - start:.2f}s')
+
+            def heartbeat(connection):
+                start = time.perf_counter()
+                store.touch(*connection)
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            latencies = list(executor.map(heartbeat, random.choices(connections, k=options['heartbeats'])))
+            elapsed = time.perf_counter() - start
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["heartbeats"] / elapsed:.0f} heartbeats/s, latency p50 {quantiles[49] * 1000:.2f}ms, '
+            f'p99 {quantiles[98] * 1000:.2f}ms'))
+        # Each connection sends a heartbeat per interval, so this is the rate that the store must sustain
+        self.stdout.write(f'Required rate for {options["connections"]} connections: '
+                          f'{options["connections"] / store.heartbeat_interval:.0f} heartbeats/s')
+
+        start = time.perf_counter()
+        store.get_online_counts(chat_ids[:100])
+        self.stdout.write(f'Online counts of 100 chats fetched in {(time.perf_counter() - start) * 1000:.2f}ms')
+
+        if isinstance(store, RedisPresenceStore):
+            keys = list(store.client.scan_iter(match=f'{store.key_prefix}:*', count=1000))
+            for i in range(0, len(keys), 1000):
+                store.client.delete(*keys[i:i + 1000])
@@ -0,0 +1,56 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from tandem.ratelimit import InMemoryRateLimiter, RedisRateLimiter
+
+
+class Command(BaseCommand):
+    help = 'Measures the overhead of rate limit checks with the in-memory and Redis backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--location',
+                            help="URL of the Redis server to benchmark, e.g. 'redis://localhost:6379/15'. If not "
+                                 "provided, only the in-memory backend is benchmarked.")
+        parser.add_argument('--checks', type=int, default=20000, help='Number of checks made with each backend.')
+        parser.add_argument('--clients', type=int, default=1000, help='Number of distinct clients (buckets).')
+        parser.add_argument('--threads', nargs='+', type=int, default=[1, 8],
+                            help='Numbers of concurrent threads making checks.')
+        parser.add_argument('--rate', default='100/s', help='Rate limit applied to the clients.')
+
+    def handle(self, *args, **options):
+        limiters = [InMemoryRateLimiter()]
+        if options['location']:
+            limiters.append(RedisRateLimiter(location=options['location'],
+                                             key_prefix=f'ratelimit-benchmark-{uuid.uuid4()}'))
+
+        with override_settings(RATE_LIMITS={'benchmark': options['rate']}):
+            for limiter in limiters:
+                for threads in options['threads']:
+                    self.run(limiter, threads, options)
+
+        for limiter in limiters:
+            if isinstance(limiter, RedisRateLimiter):
+                keys = list(limiter.client.scan_iter(match=f'{limiter.key_prefix}:*', count=1000))
+                for i in range(0, len(keys), 1000):
+                    limiter.client.delete(*keys[i:i + 1000])
+
+    def run(self, limiter, threads, options):
+        def check(i):
+            start = time.perf_counter()
+            limiter.check('benchmark', f'client:{i % options["clients"]}')
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            latencies = list(executor.map(check, range(options['checks'])))
+        elapsed = time.perf_counter() - start
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(self.style.SUCCESS(
+            f'{type(limiter).__name__}, {threads} thread(s): {options["checks"] / elapsed:.0f} checks/s, '
+            f'p50 {quantiles[49] * 1e6:.1f}us, p99 {quantiles[98] * 1e6:.1f}us'))
@@ -0,0 +1,57 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from common.models import AvailableLanguage, ProficiencyLevel
+from communities.recommendations import ChannelRecommender, LEVELS
+from users.matching import LEARNING_LEVELS
+
+
+class Command(BaseCommand):
+    help = 'Measures the time taken to score and rank all channels for a user, with a channel recommender of ' \
+           'randomly generated channels. Doesn\'t use the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channels', type=int, default=100000, help='Number of channels in the recommender.')
+        parser.add_argument('--queries', type=int, default=1000, help='Number of users whose channels are ranked.')
+        parser.add_argument('--page-size', type=int, default=10, help='Number of channels fetched for each user.')
+
+    def handle(self, *args, **options):
+        channel_ids = [uuid.uuid4() for _ in range(options['channels'])]
+        channels = [(channel_id, random.choice(AvailableLanguage.values), random.choice(LEVELS))
+                    for channel_id in channel_ids]
+        member_counts = {channel_id: int(random.paretovariate(1)) for channel_id in channel_ids}
+        message_counts = {channel_id: int(random.expovariate(0.01)) for channel_id in channel_ids}
+        recommender = ChannelRecommender()
+        start = time.perf_counter()
+        recommender.load(channels, member_counts, message_counts)
+        recommender.built = time.monotonic()
+        self.stdout.write(f'Loaded {len(channel_ids)} channels in {time.perf_counter() - start:.2f}s, '
+                          f'{recommender.features.nbytes / 2 ** 20:.1f} MiB of features')
+
+        latencies = []
+        for _ in range(options['queries']):
+            native, *learning = random.sample(AvailableLanguage.values, random.randint(2, 3))
+            languages = [(native, ProficiencyLevel.NATIVE)] + [(language, random.choice(LEARNING_LEVELS))
+                                                                for language in learning]
+            exclude_ids = random.sample(channel_ids, min(20, len(channel_ids)))
+            start = time.perf_counter()
+            recommendations = recommender.recommend(languages, exclude_ids=exclude_ids)
+            recommendations.count()
+            recommendations[:options['page_size']]
+            latencies.append(time.perf_counter() - start)
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(self.style.SUCCESS(
+            f'Channels ranked for {len(latencies)} users: latency p50 {quantiles[49] * 1000:.2f}ms, '
+            f'p99 {quantiles[98] * 1000:.2f}ms'))
+
+        updated_ids = channel_ids[:1000]
+        start = time.perf_counter()
+        for channel_id in updated_ids:
+            recommender.set_channel(channel_id, random.choice(AvailableLanguage.values), random.choice(LEVELS))
+        self.stdout.write(f'Channel updates: {(time.perf_counter() - start) / len(updated_ids) * 1000:.3f}ms each on '
+                          f'average')
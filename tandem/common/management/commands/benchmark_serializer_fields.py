@@ -0,0 +1,50 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+from rest_framework.test import APIRequestFactory
+
+from chats.serializers import FriendChatSerializer
+from communities.serializers import ChannelSerializer, ChannelListSerializer
+from users.serializers import UserSerializer
+
+SERIALIZER_CLASSES = [ChannelSerializer, ChannelListSerializer, FriendChatSerializer, UserSerializer]
+
+
+class Command(BaseCommand):
+    help = 'Measures the time and memory taken to build the fields of the serializers with nested representations, ' \
+           'which is done once for each request that uses them. Doesn\'t use the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=2000, help='Number of serializers built of each class.')
+
+    def handle(self, *args, **options):
+        context = {'request': APIRequestFactory().get('/')}
+        for serializer_class in SERIALIZER_CLASSES:
+            # Build the fields once first, so that imports and caches don't count
+            self.build_fields(serializer_class, context)
+
+            start = time.perf_counter()
+            for _ in range(options['runs']):
+                self.build_fields(serializer_class, context)
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            self.build_fields(serializer_class, context)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{serializer_class.__name__}: {elapsed / options["runs"] * 1000:.3f}ms per request, '
+                f'{peak / 1024:.1f} KiB peak memory'))
+
+    def build_fields(self, serializer_class, context):
+        """ Binds the serializer's fields and the fields of its nested serializers, as rendering a response does. """
+        pending = [serializer_class(context=context)]
+        while pending:
+            serializer = pending.pop()
+            for field in serializer.fields.values():
+                field = getattr(field, 'child', field)
+                if isinstance(field, serializers.BaseSerializer):
+                    pending.append(field)
@@ -0,0 +1,104 @@
+import asyncio
+import statistics
+import time
+import uuid
+
+from channels.auth import AuthMiddlewareStack
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from tandem.backends import get_user_cache_key
+
+# Session and authentication backends of each run. The first one is the setup without caching.
+RUNS = [
+    ('db', 'django.contrib.auth.backends.ModelBackend'),
+    ('db', 'tandem.backends.CachedModelBackend'),
+    ('cached_db', 'tandem.backends.CachedModelBackend'),
+    ('cache', 'tandem.backends.CachedModelBackend'),
+    ('signed_cookies', 'tandem.backends.CachedModelBackend'),
+]
+
+
+class AuthenticatedConsumer(AsyncWebsocketConsumer):
+    """ Accepts the connections of authenticated users, and does nothing else. """
+
+    async def connect(self):
+        if self.scope['user'].is_authenticated:
+            await self.accept()
+        else:
+            await self.close()
+
+
+class Command(BaseCommand):
+    help = 'Measures the latency of authenticated requests and WebSocket connections with each session and ' \
+           'authentication backend, using the configured database and cache. Creates a temporary user, which is ' \
+           'deleted afterwards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Number of requests and connections of each run.')
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create_user(username=f'benchmark-{suffix}',
+                                                    email=f'benchmark-{suffix}@example.com')
+        try:
+            for session_backend, auth_backend in RUNS:
+                with override_settings(SESSION_ENGINE=f'django.contrib.sessions.backends.{session_backend}',
+                                       AUTHENTICATION_BACKENDS=[auth_backend]):
+                    cache.delete(get_user_cache_key(user.id))
+                    client = Client()
+                    client.force_login(user)
+                    request_latencies, queries = self.run_requests(client, options['requests'])
+                    connect_latencies = asyncio.run(
+                        self.run_connections(client.cookies[settings.SESSION_COOKIE_NAME].value, options['requests']))
+
+                self.stdout.write(self.style.SUCCESS(
+                    f'{session_backend} sessions, {auth_backend.rsplit(".", 1)[-1]}: '
+                    f'request p50 {self.quantile(request_latencies, 49)}, p99 {self.quantile(request_latencies, 98)} '
+                    f'({queries / options["requests"]:.1f} queries each), '
+                    f'WebSocket connect p50 {self.quantile(connect_latencies, 49)}, '
+                    f'p99 {self.quantile(connect_latencies, 98)}'))
+        finally:
+            user.delete()
+
+    @staticmethod
+    def quantile(latencies, index):
+        return f'{statistics.quantiles(latencies, n=100)[index] * 1000:.2f}ms'
+
+    @staticmethod
+    def run_requests(client, requests):
+        """ Fetches the session info with the client's session. Returns the latency of each request and the total
+        number of queries made. """
+        latencies = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = client.get('/api/session_info/')
+                latencies.append(time.perf_counter() - start)
+                if response.json()['id'] is None:
+                    raise RuntimeError('The request was not authenticated.')
+        return latencies, len(queries)
+
+    @staticmethod
+    async def run_connections(session_key, connections):
+        """ Opens WebSocket connections with the session, one at a time. Returns the time taken by each one to be
+        accepted. """
+        application = AuthMiddlewareStack(AuthenticatedConsumer.as_asgi())
+        headers = [(b'cookie', f'{settings.SESSION_COOKIE_NAME}={session_key}'.encode())]
+        latencies = []
+        for _ in range(connections):
+            communicator = WebsocketCommunicator(application, '/ws/benchmark/', headers=headers)
+            start = time.perf_counter()
+            connected, _ = await communicator.connect()
+            latencies.append(time.perf_counter() - start)
+            if not connected:
+                raise RuntimeError('The connection was not authenticated.')
+            await communicator.disconnect()
+        return latencies
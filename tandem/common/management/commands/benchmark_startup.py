@@ -0,0 +1,68 @@
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+PROFILES = ['development', 'production']
+
+# Packages whose import time is reported separately
+PACKAGES = ['PIL', 'drf_spectacular', 'django_extensions', 'faker']
+
+# Modules imported by a worker before serving its first request
+STARTUP_MODULES = ['tandem.asgi', 'tandem.urls']
+
+
+class Command(BaseCommand):
+    help = 'Measures the time taken by a new worker process to import the ASGI application and the URL configuration ' \
+           'with each application profile (see APP_PROFILE), and the part of it spent importing some optional ' \
+           'packages. Each run is a new Python process, started with the current settings module.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10, help='Number of processes started with each profile.')
+
+    def handle(self, *args, **options):
+        for profile in PROFILES:
+            totals, packages = [], defaultdict(list)
+            for _ in range(options['runs']):
+                import_times = self.get_import_times(profile)
+                totals.append(sum(import_times[module] for module in STARTUP_MODULES))
+                for package in PACKAGES:
+                    packages[package].append(import_times[package])
+
+            package_times = ', '.join(f'{package} {statistics.median(times) / 1000:.1f}ms'
+                                      for package, times in packages.items())
+            self.stdout.write(self.style.SUCCESS(
+                f'{profile}: startup imports min {min(totals) / 1000:.1f}ms, '
+                f'p50 {statistics.median(totals) / 1000:.1f}ms ({package_times})'))
+
+    def get_import_times(self, profile):
+        """ Starts a new process with the given profile, and returns the time spent importing each of the startup
+        modules and the reported packages, in microseconds. """
+        env = {**os.environ, 'APP_PROFILE': profile, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {", ".join(STARTUP_MODULES)}'],
+                                env=env, capture_output=True, text=True, check=True, cwd=settings.BASE_DIR)
+
+        # Each line is 'import time: <self> | <cumulative> | <module>', with the module indented under the one that
+        # imported it, and listed after it. Reading them backwards, each module's importers come before it, and the
+        # time of a package is taken from the modules of it which weren't imported by another one of its modules.
+        import_times = defaultdict(int)
+        importers = []
+        for line in reversed(result.stderr.splitlines()):
+            if not line.startswith('import time:') or line.endswith('imported package'):
+                continue
+            _, cumulative, module = line[len('import time:'):].split('|')
+            depth = len(module) - len(module.lstrip())
+            module = module.strip()
+            package = module.split('.')[0]
+            while importers and importers[-1][0] >= depth:
+                importers.pop()
+            if module in STARTUP_MODULES and not importers:
+                import_times[module] += int(cumulative)
+            elif package in PACKAGES and all(importer.split('.')[0] != package for _, importer in importers):
+                import_times[package] += int(cumulative)
+            importers.append((depth, module))
+        return import_times
@@ -0,0 +1,71 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin
+from urllib.request import build_opener, HTTPCookieProcessor, Request
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Sends concurrent HTTP requests to a running API instance and reports its throughput and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="URL to request, e.g. 'http://127.0.0.1:8000/api/channels/'.")
+        parser.add_argument('--requests', type=int, default=2000, help='Total number of requests to send.')
+        parser.add_argument('--concurrency', type=int, default=32, help='Number of concurrent clients.')
+        parser.add_argument('--method', default='GET', help='HTTP method of the requests.')
+        parser.add_argument('--data', help='JSON body of the requests.')
+        parser.add_argument('--username', help='Log in as this user before sending the requests.')
+        parser.add_argument('--password', default='password', help="Password of the user set with '--username'.")
+
+    def handle(self, *args, **options):
+        opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        if options['username']:
+            login_url = urljoin(options['url'], '/api/login/')
+            opener.open(self.build_request(login_url, 'POST', json.dumps({
+                'username': options['username'],
+                'password': options['password'],
+            })))
+
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def send(_):
+            request = self.build_request(options['url'], options['method'], options['data'])
+            start = time.perf_counter()
+            try:
+                with opener.open(request) as response:
+                    response.read()
+            except HTTPError as e:
+                with lock:
+                    errors.append(str(e.code))
+            except URLError as e:
+                with lock:
+                    errors.append(str(e.reason))
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(send, range(options['requests'])))
+        elapsed = time.perf_counter() - start
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["requests"]} requests in {elapsed:.2f}s: {options["requests"] / elapsed:.1f} requests/s, '
+            f'latency p50 {quantiles[49] * 1000:.1f}ms, p95 {quantiles[94] * 1000:.1f}ms, '
+            f'p99 {quantiles[98] * 1000:.1f}ms'))
+        if errors:
+            self.stdout.write(self.style.WARNING(
+                f'{len(errors)} requests failed: {", ".join(sorted(set(errors)))}.'))
+
+    @staticmethod
+    def build_request(url, method, data):
+        return Request(url, method=method, data=data.encode() if data else None,
+                       headers={'Content-Type': 'application/json'})
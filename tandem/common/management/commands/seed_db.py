@@ -118,14 +118,12 @@ class Command(BaseCommand):
                 chat = None
                 try:
                     # Check if a chat exists for the two users, and create it if it doesn't
-                    chat = FriendChat.objects.filter(users=user).get(users=friend)
+                    chat = FriendChat.objects.get(user_pair=FriendChat.get_user_pair(user.id, friend.id))
 
                 except FriendChat.DoesNotExist:
-                    chat = FriendChat()
-                    chat.save()
-                    chat.users.add(friend)
-                    chat.users.add(user)
+                    chat = FriendChat(user_pair=FriendChat.get_user_pair(user.id, friend.id))
                     chat.save()
+                    chat.users.add(friend, user)
 
                 finally:
                     for i in range(10):
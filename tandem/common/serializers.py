@@ -4,6 +4,9 @@ from rest_framework.validators import UniqueTogetherValidator
 
 from communities.models import Channel, ChannelRole, Membership
 
+# Maximum number of objects that can be created in a single bulk creation request
+BULK_CREATE_MAX_SIZE = 100
+
 
 class MembershipSerializer(serializers.ModelSerializer):
     """
@@ -42,4 +45,21 @@ class MembershipSerializer(serializers.ModelSerializer):
                 queryset=Membership.objects.all(),
                 fields=['user', 'channel']
             )
-        ]
\ No newline at end of file
+        ]
+
+
+class MembershipBulkCreateSerializer(serializers.Serializer):
+    """
+    Validates the data of bulk membership creation requests: the IDs of the channels to join, and optionally the ID of
+    the user to create the memberships for (the session's user by default). All channels are fetched in one query.
+    """
+
+    user = serializers.PrimaryKeyRelatedField(queryset=get_user_model().objects.all(), required=False)
+    channels = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=BULK_CREATE_MAX_SIZE)
+
+    def validate_channels(self, value):
+        channel_ids = set(value)
+        found_ids = set(Channel.objects.filter(id__in=channel_ids).values_list('id', flat=True))
+        if missing_ids := channel_ids - found_ids:
+            raise serializers.ValidationError(f"Channels not found: {', '.join(sorted(map(str, missing_ids)))}.")
+        return sorted(channel_ids)
@@ -1,3 +1,39 @@
-from django.shortcuts import render
+from drf_spectacular.utils import extend_schema, OpenApiResponse
+from rest_framework import permissions, status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
 
-# Create your views here.
+from tandem.postgresql_pool.base import get_pool_stats
+from tandem.ratelimit import get_rate_limiter
+
+
+@extend_schema(
+    responses={
+        200: OpenApiResponse(description="List of the worker's connection pools and their stats."),
+    },
+)
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def get_db_pool_stats(request):
+    """
+    Returns the stats of the database connection pools of the worker process that handles the request, including their
+    size, number of connections in use and waiting checkouts, and cumulative counts of created connections, waits,
+    timeouts and failed health checks.
+    """
+    return Response(get_pool_stats(), status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    responses={
+        200: OpenApiResponse(description="The worker's rate limiter backend and its stats."),
+    },
+)
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def get_rate_limit_stats(request):
+    """
+    Returns the stats of the rate limiter of the worker process that handles the request: the cumulative counts of
+    allowed and rejected requests for each scope and, for the Redis backend, of the checks that fell back to the
+    worker's memory because Redis couldn't be reached.
+    """
+    return Response(get_rate_limiter().get_stats(), status=status.HTTP_200_OK)
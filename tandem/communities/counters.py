@@ -0,0 +1,67 @@
+"""
+Denormalized membership summaries of channels: their number of members (Channel.member_count) and the IDs of their
+admins and moderators (Channel.admin_ids and Channel.moderator_ids), which let clients show them without fetching the
+channels' memberships. They're updated in the same transaction as the memberships (see tandem.signals), and can be
+recomputed for all channels with the 'repair_channel_counters' command. Permission checks still use the request's
+authorization context, which is loaded from the user's memberships.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from communities.models import Channel, ChannelRole, Membership
+
+ROLE_FIELDS = {ChannelRole.ADMIN: 'admin_ids', ChannelRole.MOD: 'moderator_ids'}
+COUNTER_FIELDS = ['member_count', *ROLE_FIELDS.values()]
+
+
+def add_members(channel_id, count):
+    """ Adds the count (which may be negative) to the channel's number of members. """
+    Channel.objects.filter(id=channel_id).update(member_count=F('member_count') + count)
+
+
+def get_role_ids(channel_ids):
+    """ Returns the admin and moderator IDs of each of the channels, from their memberships. """
+    role_ids = defaultdict(lambda: {field: [] for field in ROLE_FIELDS.values()})
+    memberships = Membership.objects.filter(channel_id__in=channel_ids, role__in=ROLE_FIELDS) \
+        .order_by('channel_id', 'user_id').values_list('channel_id', 'user_id', 'role')
+    for channel_id, user_id, role in memberships:
+        role_ids[channel_id][ROLE_FIELDS[role]].append(str(user_id))
+    return role_ids
+
+
+def update_role_ids(channel_id):
+    """ Sets the channel's admin and moderator IDs from its memberships. The channel is locked first, so that the role
+    changes of concurrent transactions are applied one after another. Opens a transaction if it isn't called inside one
+    (e.g. when memberships are saved from the shell or the 'seed_db' command). """
+    with transaction.atomic():
+        channel = Channel.objects.select_for_update().filter(id=channel_id).only('id').first()
+        if channel is not None:
+            Channel.objects.filter(id=channel.id).update(**get_role_ids([channel.id])[channel.id])
+
+
+def repair_channel_counters(batch_size=1000):
+    """ Recomputes the member counts and the admin and moderator IDs of all channels from their memberships, and saves
+    the ones that were wrong. Each batch of channels is locked while it's repaired. Returns the number of channels
+    repaired. """
+    repaired = 0
+    channel_ids = list(Channel.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(channel_ids), batch_size):
+        batch_ids = channel_ids[start:start + batch_size]
+        with transaction.atomic():
+            channels = list(Channel.objects.select_for_update().filter(id__in=batch_ids).order_by('id')
+                            .only('id', *COUNTER_FIELDS))
+            member_counts = dict(Membership.objects.filter(channel_id__in=batch_ids).order_by()
+                                 .values_list('channel_id').annotate(count=Count('id')))
+            role_ids = get_role_ids(batch_ids)
+            wrong_channels = []
+            for channel in channels:
+                expected = {'member_count': member_counts.get(channel.id, 0), **role_ids[channel.id]}
+                if any(getattr(channel, field) != value for field, value in expected.items()):
+                    for field, value in expected.items():
+                        setattr(channel, field, value)
+                    wrong_channels.append(channel)
+            Channel.objects.bulk_update(wrong_channels, COUNTER_FIELDS)
+        repaired += len(wrong_channels)
+    return repaired
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from communities.counters import repair_channel_counters
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the member counts and the admin and moderator IDs of all channels from their memberships, ' \
+           'fixing any that have drifted (e.g. after memberships were changed outside of the app).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of channels repaired at a time.')
+
+    def handle(self, *args, **options):
+        repaired = repair_channel_counters(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Repaired the counters of {repaired} channels'))
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.2 on 2026-10-19 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communities', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='message_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
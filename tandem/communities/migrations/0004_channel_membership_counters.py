@@ -0,0 +1,51 @@
+"""
+Adds the member counts and the admin and moderator IDs of channels, and computes them from the existing memberships.
+"""
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+ROLE_FIELDS = {'A': 'admin_ids', 'M': 'moderator_ids'}
+BATCH_SIZE = 1000
+
+
+def backfill_counters(apps, schema_editor):
+    Channel = apps.get_model('communities', 'Channel')
+    Membership = apps.get_model('communities', 'Membership')
+
+    member_counts = dict(Membership.objects.order_by().values_list('channel_id').annotate(count=Count('id')))
+    role_ids = defaultdict(lambda: {field: [] for field in ROLE_FIELDS.values()})
+    for channel_id, user_id, role in Membership.objects.filter(role__in=ROLE_FIELDS) \
+            .order_by('channel_id', 'user_id').values_list('channel_id', 'user_id', 'role'):
+        role_ids[channel_id][ROLE_FIELDS[role]].append(str(user_id))
+
+    channels = [Channel(id=channel_id, member_count=member_counts.get(channel_id, 0), **role_ids[channel_id])
+                for channel_id in Channel.objects.values_list('id', flat=True)]
+    Channel.objects.bulk_update(channels, ['member_count', 'admin_ids', 'moderator_ids'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communities', '0003_channel_message_retention_days'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='admin_ids',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='moderator_ids',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.0.2 on 2026-10-19 13:03
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communities', '0004_channel_membership_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='channel',
+            name='message_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.2 on 2026-10-19 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communities', '0005_channel_message_retention_days_min'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
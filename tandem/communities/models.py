@@ -1,17 +1,27 @@
 import uuid
 from django.conf import settings
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from dry_rest_permissions.generics import authenticated_users, allow_staff_or_superuser
+from rest_framework.reverse import reverse
 
 from chats.models import AbstractChatMessage
 from common.models import AvailableLanguage, ProficiencyLevel
+from tandem.authorization import get_authorization_context
 
 
 def upload_to(instance, filename):
     return f'channels/{instance.id}.{filename.split(".")[-1]}'
 
 
+class ChannelManager(models.Manager):
+    """ Default manager of channels, which leaves out the channels that have been deleted but not purged yet. """
+
+    def get_queryset(self):
+        return super(ChannelManager, self).get_queryset().filter(deleted_at__isnull=True)
+
+
 class Channel(models.Model):
 
     @staticmethod
@@ -42,13 +52,13 @@ class Channel(models.Model):
     @allow_staff_or_superuser
     def has_object_update_permission(self, request):
         """ Allow only staff and channel admins/moderators to update a channel. """
-        return self.memberships.filter(user=request.user, role__in=[ChannelRole.MOD, ChannelRole.ADMIN]).exists()
+        return get_authorization_context(request).has_channel_role(self.id, [ChannelRole.MOD, ChannelRole.ADMIN])
 
     @authenticated_users
     @allow_staff_or_superuser
     def has_object_destroy_permission(self, request):
         """ Allow only staff and channel admins to delete a channel. """
-        return self.memberships.filter(user=request.user, role=ChannelRole.ADMIN).exists()
+        return get_authorization_context(request).has_channel_role(self.id, [ChannelRole.ADMIN])
 
     def __str__(self):
         return self.name
@@ -68,6 +78,20 @@ class Channel(models.Model):
         choices=ProficiencyLevel.choices
     )
     image = models.ImageField(upload_to=upload_to, blank=True)
+    # Number of days that the channel's messages are kept. If null, the global retention period is used.
+    message_retention_days = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(1)])
+    # Denormalized summary of the channel's memberships for clients: its number of members and the IDs of its admins
+    # and moderators, kept up to date as memberships change (see communities.counters)
+    member_count = models.PositiveIntegerField(default=0, editable=False)
+    admin_ids = models.JSONField(default=list, editable=False)
+    moderator_ids = models.JSONField(default=list, editable=False)
+    # Time at which the channel was deleted. Deleted channels are hidden until they're purged along with their messages
+    # (see chats.purge)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ChannelManager()
+    # Includes the deleted channels
+    all_objects = models.Manager()
 
 
 class ChannelRole(models.TextChoices):
@@ -95,9 +119,15 @@ class Membership(models.Model):
     def has_create_permission(request):
         """ Allow users to create memberships only for themselves (except for staff, who can create memberships for any
         user). """
-        from users.serializers import UserSerializer
-        serializer = UserSerializer(request.user, context={'request': request})
-        return request.data.get('user') == serializer.data.get('url')
+        return request.data.get('user') == reverse('customuser-detail', kwargs={'pk': request.user.id}, request=request)
+
+    @staticmethod
+    @authenticated_users
+    @allow_staff_or_superuser
+    def has_bulk_create_permission(request):
+        """ Allow users to create memberships in bulk only for themselves (except for staff, who can create memberships
+        for any user). """
+        return str(request.data.get('user', request.user.id)) == str(request.user.id)
 
     @staticmethod
     @authenticated_users
@@ -110,15 +140,15 @@ class Membership(models.Model):
     @allow_staff_or_superuser
     def has_object_update_permission(self, request):
         """ Allow only staff and channel admins/moderators to update a membership. """
-        return self.channel.memberships.filter(user=request.user,
-                                               role__in=[ChannelRole.MOD, ChannelRole.ADMIN]).exists()
+        return get_authorization_context(request).has_channel_role(self.channel_id,
+                                                                   [ChannelRole.MOD, ChannelRole.ADMIN])
 
     @authenticated_users
     @allow_staff_or_superuser
     def has_object_destroy_permission(self, request):
         """ Allow only staff, channel admins/moderators and a user to delete a membership for that user. """
-        return request.user == self.user or self.channel.memberships.filter(
-            user=request.user, role__in=[ChannelRole.MOD, ChannelRole.ADMIN]).exists()
+        return request.user.id == self.user_id or get_authorization_context(request).has_channel_role(
+            self.channel_id, [ChannelRole.MOD, ChannelRole.ADMIN])
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(
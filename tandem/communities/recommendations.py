@@ -0,0 +1,203 @@
+"""
+Channel recommendations for the discover endpoint. Channels are scored for a user by their language, the distance
+between their level and the user's level in that language, their number of members and their recent activity.
+
+The features of all channels are kept in NumPy arrays in the memory of each worker process, so that all of them can be
+scored for each request with a few vectorized operations. The arrays are updated by the worker's model signals as
+channels, memberships and messages are created and deleted, and are rebuilt from the database every REBUILD_INTERVAL
+seconds, which picks up the changes made by the other workers.
+"""
+import threading
+import time
+
+import numpy as np
+from django.db.models import Count
+from django.utils import timezone
+
+from chats.models import ChannelChatMessage
+from common.models import AvailableLanguage, ProficiencyLevel
+from communities.models import Channel
+
+# Seconds between the rebuilds of the feature matrix
+REBUILD_INTERVAL = 300
+
+# Days of messages counted as the channels' recent activity
+ACTIVITY_DAYS = 7
+
+# Weights of each feature in the score of a channel
+LEVEL_WEIGHT = 0.5
+MEMBERS_WEIGHT = 0.25
+ACTIVITY_WEIGHT = 0.25
+
+# Multipliers of the score of channels in the user's native languages and in languages they don't speak, which are
+# recommended after the ones in the languages they're learning
+NATIVE_LANGUAGE_FACTOR = 0.3
+OTHER_LANGUAGE_FACTOR = 0.1
+
+LANGUAGES = AvailableLanguage.values
+# Levels in ascending order, so that their distance is the difference of their positions
+LEVELS = [ProficiencyLevel.BEGINNER, ProficiencyLevel.INTERMEDIATE, ProficiencyLevel.ADVANCED, ProficiencyLevel.NATIVE]
+
+# Columns of the feature matrix
+LANGUAGE, LEVEL, MEMBERS, ACTIVITY = range(4)
+
+
+class Recommendations:
+    """ Ranked list of recommended channel IDs, which can be paginated like a queryset. Only the channels up to the end
+    of the slice that is accessed are sorted. """
+
+    def __init__(self, channel_ids, scores):
+        self.channel_ids = channel_ids
+        self.scores = scores
+        self.candidates = np.flatnonzero(scores > 0)
+
+    def count(self):
+        return len(self.candidates)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None:
+            raise TypeError('Recommendations only support slicing.')
+        start, stop, _ = item.indices(len(self.candidates))
+        if start >= stop:
+            return []
+        scores = self.scores[self.candidates]
+        # Partition the candidates so that the best 'stop' ones come first, and then sort only those
+        top = np.argpartition(-scores, stop - 1)[:stop] if stop < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [self.channel_ids[slot] for slot in self.candidates[top[start:stop]]]
+
+
+class ChannelRecommender:
+    """ Keeps the feature matrix of all channels, with one row per channel, in the order of 'channel_ids'. The matrix
+    may have extra empty rows at the end, for new channels. Builds itself from the database on first use. Thread
+    safe. """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.channel_ids = []
+        self.slots = {}
+        self.features = np.zeros((0, 4), dtype=np.float32)
+        self.built = 0
+
+    def load(self, channels, member_counts, message_counts):
+        """ Replaces the feature matrix with the given channels, as (ID, language, level) tuples, and their member and
+        recent message counts, as dictionaries by channel ID. """
+        channel_ids = []
+        features = np.zeros((len(channels), 4), dtype=np.float32)
+        for slot, (channel_id, language, level) in enumerate(channels):
+            channel_ids.append(channel_id)
+            features[slot] = (LANGUAGES.index(language), LEVELS.index(level), member_counts.get(channel_id, 0),
+                              message_counts.get(channel_id, 0))
+        with self.lock:
+            self.channel_ids = channel_ids
+            self.slots = {channel_id: slot for slot, channel_id in enumerate(channel_ids)}
+            self.features = features
+
+    def build(self):
+        """ Loads the features of all channels from the database. """
+        since = timezone.now() - timezone.timedelta(days=ACTIVITY_DAYS)
+        rows = list(Channel.objects.order_by().values_list('id', 'language', 'level', 'member_count'))
+        channels = [(channel_id, language, level) for channel_id, language, level, _ in rows]
+        member_counts = {channel_id: member_count for channel_id, _, _, member_count in rows}
+        message_counts = dict(ChannelChatMessage.objects.filter(timestamp__gte=since).order_by()
+                              .values_list('channel_id').annotate(count=Count('id')))
+        self.load(channels, member_counts, message_counts)
+        self.built = time.monotonic()
+
+    def ensure_ready(self):
+        with self.lock:
+            if not self.built or time.monotonic() - self.built > REBUILD_INTERVAL:
+                self.build()
+
+    def set_channel(self, channel_id, language, level):
+        """ Adds a channel to the matrix, or updates its language and level. """
+        with self.lock:
+            slot = self.slots.get(channel_id)
+            if slot is None:
+                slot = self.slots[channel_id] = len(self.channel_ids)
+                self.channel_ids.append(channel_id)
+                if slot == len(self.features):
+                    # Double the capacity of the matrix, so that it isn't copied for each new channel
+                    features = np.zeros((max(2 * slot, 16), 4), dtype=np.float32)
+                    features[:slot] = self.features
+                    self.features = features
+                else:
+                    self.features[slot] = 0
+            self.features[slot, LANGUAGE] = LANGUAGES.index(language)
+            self.features[slot, LEVEL] = LEVELS.index(level)
+
+    def remove_channel(self, channel_id):
+        """ Removes a channel from the recommendations. Its row is kept, with a language that matches no user, until
+        the next rebuild. """
+        with self.lock:
+            slot = self.slots.get(channel_id)
+            if slot is not None:
+                self.features[slot, LANGUAGE] = -1
+
+    def add_count(self, channel_id, column, value):
+        """ Adds the value to the member count or recent activity of a channel. """
+        with self.lock:
+            slot = self.slots.get(channel_id)
+            if slot is not None:
+                self.features[slot, column] = max(self.features[slot, column] + value, 0)
+
+    def recommend(self, languages, exclude_ids=(), language_filter=None, level_filter=None):
+        """ Returns the channels recommended for a user with the given (language, level) pairs, excluding the given
+        channels. If filters are given, only channels in those languages and levels are recommended. """
+        # The excluded IDs may be a lazy queryset, which must not query the database while the lock is held
+        exclude_ids = set(exclude_ids)
+        self.ensure_ready()
+        with self.lock:
+            # The list of IDs is only appended to until it's replaced by a rebuild, so it isn't copied
+            channel_ids = self.channel_ids
+            features = self.features[:len(channel_ids)]
+            excluded_slots = [self.slots[channel_id] for channel_id in exclude_ids if channel_id in self.slots]
+
+        # The factor and the user's level (NaN if they don't speak it) of each language. The extra last element is
+        # looked up by removed channels, which have language -1.
+        language_factors = np.full(len(LANGUAGES) + 1, OTHER_LANGUAGE_FACTOR, dtype=np.float32)
+        user_levels = np.full(len(LANGUAGES) + 1, np.nan, dtype=np.float32)
+        for language, level in languages:
+            language_factors[LANGUAGES.index(language)] = NATIVE_LANGUAGE_FACTOR \
+                if level == ProficiencyLevel.NATIVE else 1
+            user_levels[LANGUAGES.index(language)] = LEVELS.index(level)
+        if language_filter:
+            allowed = np.zeros(len(LANGUAGES) + 1, dtype=bool)
+            allowed[[LANGUAGES.index(language) for language in language_filter]] = True
+            language_factors[~allowed] = 0
+        language_factors[-1] = 0
+
+        channel_languages = features[:, LANGUAGE].astype(np.intp)
+        level_distance = np.nan_to_num(np.abs(features[:, LEVEL] - user_levels[channel_languages]), nan=len(LEVELS))
+        members = np.log1p(features[:, MEMBERS])
+        activity = np.log1p(features[:, ACTIVITY])
+        scores = language_factors[channel_languages] * (
+            LEVEL_WEIGHT / (1 + level_distance)
+            + MEMBERS_WEIGHT * members / max(members.max(initial=0), 1)
+            + ACTIVITY_WEIGHT * activity / max(activity.max(initial=0), 1)
+        )
+        if level_filter:
+            scores[~np.isin(features[:, LEVEL], [LEVELS.index(level) for level in level_filter])] = 0
+        scores[excluded_slots] = 0
+        return Recommendations(channel_ids, scores)
+
+
+_recommender = None
+_recommender_lock = threading.Lock()
+
+
+def get_recommender():
+    """ Returns the channel recommender of the process. """
+    global _recommender
+    with _recommender_lock:
+        if _recommender is None:
+            _recommender = ChannelRecommender()
+        return _recommender
+
+
+def get_built_recommender():
+    """ Returns the channel recommender of the process if its features have been loaded, or None otherwise. """
+    return _recommender if _recommender is not None and _recommender.built else None
@@ -2,50 +2,27 @@ from django.contrib.auth import get_user_model
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 from rest_framework.reverse import reverse
-from rest_framework.utils.field_mapping import get_nested_relation_kwargs
+from rest_framework.validators import UniqueValidator
 
 from chats.serializers import ChannelChatMessageSerializer
 from communities.models import Channel, Membership
+from tandem.authorization import get_authorization_context
 
 
-class ChannelSerializer(serializers.HyperlinkedModelSerializer):
+class ChannelListSerializer(serializers.HyperlinkedModelSerializer):
     """
-    Channel serializer class.
+    Lean channel serializer class, used in channel lists. Includes the channel's member counts and the IDs of its admins
+    and moderators instead of its memberships, which can be fetched separately from 'membershipsUrl'.
     """
 
     def to_representation(self, instance):
-        ret = super(ChannelSerializer, self).to_representation(instance)
+        ret = super(ChannelListSerializer, self).to_representation(instance)
         ret['messageUrl'] = self.context['request'].build_absolute_uri(
             str(reverse('channelchatmessage-list')) + '?channel=' + str(instance.id))
+        ret['membershipsUrl'] = reverse('channel-memberships', kwargs={'pk': instance.id},
+                                        request=self.context['request'])
         return ret
 
-    def build_nested_field(self, field_name, relation_info, nested_depth):
-        """
-        Create nested fields for forward and reverse relationships.
-        Source: https://stackoverflow.com/a/50633184
-        """
-
-        class ChannelMembershipUserSerializer(serializers.HyperlinkedModelSerializer):
-            class Meta:
-                model = get_user_model()
-                depth = nested_depth - 1
-                fields = ['id', 'url', 'username', 'description', 'image']
-
-        class ChannelMembershipSerializer(serializers.HyperlinkedModelSerializer):
-            user = ChannelMembershipUserSerializer(read_only=True)
-
-            class Meta:
-                model = relation_info.related_model
-                depth = nested_depth - 1
-                fields = ['id', 'url', 'user', 'role']
-
-        if field_name == 'memberships':
-            field_class = ChannelMembershipSerializer
-
-        field_kwargs = get_nested_relation_kwargs(relation_info)
-
-        return field_class, field_kwargs
-
     messages = serializers.SerializerMethodField(method_name='get_messages')
     image = serializers.ImageField(required=False)
 
@@ -54,8 +31,8 @@ class ChannelSerializer(serializers.HyperlinkedModelSerializer):
         # If the user is admin or a member of the channel, get only the latest message for the channel. Else, return an
         # empty queryset.
         user = self.context['request'].user
-        if user.is_staff or Membership.objects.filter(user=user, channel=instance).exists():
-            queryset = instance.messages.order_by('-timestamp')[:1]
+        if user.is_staff or get_authorization_context(self.context['request']).is_channel_member(instance.id):
+            queryset = instance.messages.order_by('-timestamp', '-sequence')[:1]
         else:
             queryset = instance.messages.none()
         return ChannelChatMessageSerializer(queryset, many=True, read_only=True,
@@ -63,6 +40,50 @@ class ChannelSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = Channel
+        fields = [
+            'url',
+            'id',
+            'name',
+            'description',
+            'language',
+            'level',
+            'image',
+            'messages',
+            'member_count',
+            'admin_ids',
+            'moderator_ids'
+        ]
+        # Names stay taken by deleted channels until they're purged
+        extra_kwargs = {'name': {'validators': [UniqueValidator(
+            queryset=Channel.all_objects.all(), message='channel with this name already exists.')]}}
+
+
+class ChannelMemberSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Serializer of the memberships of a channel, with their users' details. Used by the channel memberships endpoint
+    and by ChannelSerializer.
+    """
+
+    class MemberUserSerializer(serializers.HyperlinkedModelSerializer):
+        class Meta:
+            model = get_user_model()
+            fields = ['id', 'url', 'username', 'description', 'image']
+
+    user = MemberUserSerializer(read_only=True)
+
+    class Meta:
+        model = Membership
+        fields = ['id', 'url', 'user', 'role']
+
+
+class ChannelSerializer(ChannelListSerializer):
+    """
+    Channel serializer class. Includes all of the channel's memberships.
+    """
+
+    memberships = ChannelMemberSerializer(many=True, read_only=True)
+
+    class Meta(ChannelListSerializer.Meta):
         fields = [
             'url',
             'id',
@@ -72,6 +93,9 @@ class ChannelSerializer(serializers.HyperlinkedModelSerializer):
             'level',
             'memberships',
             'image',
-            'messages'
+            'messages',
+            'message_retention_days',
+            'member_count',
+            'admin_ids',
+            'moderator_ids'
         ]
-        depth = 2
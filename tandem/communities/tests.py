@@ -1,9 +1,16 @@
+from unittest import mock
+
 from django.contrib.auth import get_user_model
 from django.db.models import Q
+from django.test import TransactionTestCase
+from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient, APITestCase
 
-from communities.models import Channel
+from communities import recommendations
+from communities.counters import repair_channel_counters
+from communities.models import Channel, Membership, ChannelRole
+from users.models import UserLanguage
 
 
 class UserCrudTests(APITestCase):
@@ -95,3 +102,300 @@ class UserCrudTests(APITestCase):
         self.assertEqual(1, len(response.data['memberships']))
         self.assertIn(str(self.user.id), response.data['memberships'][0]['user'])
         self.assertEqual('Administrator', response.data['memberships'][0]['role'])
+
+
+class MembershipBulkCreateTests(APITestCase):
+    """Contains tests for the bulk membership creation endpoint."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='bulk_membership_user',
+                                                        email='bulk_membership@example.com', password='password')
+        cls.other_user = get_user_model().objects.create_user(username='other_bulk_membership_user',
+                                                              email='other_bulk_membership@example.com')
+        cls.channels = [Channel.objects.create(name=f'bulk membership channel {i}', language='DE', level='BE')
+                        for i in range(3)]
+        Membership.objects.create(user=cls.user, channel=cls.channels[0], role=ChannelRole.ADMIN)
+
+    def setUp(self):
+        super(MembershipBulkCreateTests, self).setUp()
+        self.client.force_authenticate(user=self.user)
+
+    def test_bulk_create_skips_existing_memberships(self):
+        """
+        Tests that user memberships are created in the channels that the user wasn't a member of, and that the existing
+        memberships are left unchanged.
+        """
+        url = reverse('membership-bulk-create')
+        channel_ids = [str(channel.id) for channel in self.channels]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data={'channels': channel_ids}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual({str(membership['channel']) for membership in response.data['created']}, set(channel_ids[1:]))
+        self.assertEqual([str(channel_id) for channel_id in response.data['skipped']], channel_ids[:1])
+        self.assertEqual(dict(Membership.objects.filter(user=self.user).values_list('channel_id', 'role')), {
+            self.channels[0].id: ChannelRole.ADMIN,
+            self.channels[1].id: ChannelRole.USER,
+            self.channels[2].id: ChannelRole.USER,
+        })
+
+    def test_bulk_create_for_another_user_is_forbidden(self):
+        """
+        Tests that users can't create memberships in bulk for other users.
+        """
+        url = reverse('membership-bulk-create')
+        response = self.client.post(url, data={'user': str(self.other_user.id),
+                                               'channels': [str(self.channels[1].id)]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Membership.objects.filter(user=self.other_user).exists())
+
+
+class ChannelRecommendationTests(APITestCase):
+    """Contains tests for the channel recommendations of the discover endpoint."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='recommendation_user',
+                                                        email='recommendation@example.com')
+        UserLanguage.objects.create(user=cls.user, language='ES', level='NA')
+        UserLanguage.objects.create(user=cls.user, language='EN', level='BE')
+        other_user = get_user_model().objects.create_user(username='other_recommendation_user',
+                                                          email='other_recommendation@example.com')
+
+        cls.best_channel = Channel.objects.create(name='English for beginners', language='EN', level='BE')
+        Membership.objects.create(user=other_user, channel=cls.best_channel, role=ChannelRole.ADMIN)
+        cls.advanced_channel = Channel.objects.create(name='Advanced English', language='EN', level='AD')
+        cls.native_channel = Channel.objects.create(name='Spanish', language='ES', level='NA')
+        cls.other_channel = Channel.objects.create(name='German', language='DE', level='BE')
+        cls.member_channel = Channel.objects.create(name='English', language='EN', level='BE')
+        Membership.objects.create(user=cls.user, channel=cls.member_channel, role=ChannelRole.ADMIN)
+
+    def setUp(self):
+        super(ChannelRecommendationTests, self).setUp()
+        self.client.force_authenticate(user=self.user)
+        recommendations._recommender = None
+
+    def get_recommended_ids(self, params=None):
+        response = self.client.get(reverse('channel-discover'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [channel['id'] for channel in response.data['results']]
+
+    def test_channels_are_ranked(self):
+        """
+        Tests that channels in the languages the user is learning are recommended first, closest to the user's level
+        and with the most members first, followed by channels in their native languages and in other languages, and
+        that the channels the user is a member of are excluded.
+        """
+        self.assertEqual(self.get_recommended_ids(), [str(channel.id) for channel in (
+            self.best_channel, self.advanced_channel, self.native_channel, self.other_channel)])
+        self.assertEqual(self.get_recommended_ids({'language': ['EN', 'DE'], 'level': 'BE'}),
+                         [str(self.best_channel.id), str(self.other_channel.id)])
+
+    def test_recommender_is_updated(self):
+        """
+        Tests that the recommender is updated when channels are created, modified or deleted.
+        """
+        self.get_recommended_ids()
+        with self.captureOnCommitCallbacks(execute=True):
+            new_channel = Channel.objects.create(name='English for beginners 2', language='EN', level='BE')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.advanced_channel.language = 'ES'
+            self.advanced_channel.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.native_channel.delete()
+
+        self.assertEqual(self.get_recommended_ids(), [str(channel.id) for channel in (
+            self.best_channel, new_channel, self.advanced_channel, self.other_channel)])
+
+    def test_excluded_channels_are_read_before_locking(self):
+        """
+        Tests that the channels to exclude are read before the recommender is locked, so that other requests don't
+        wait for the query that fetches them.
+        """
+        recommender = recommendations.get_recommender()
+        recommender.ensure_ready()
+        events = []
+
+        def get_exclude_ids():
+            events.append('read')
+            yield self.member_channel.id
+
+        lock = mock.MagicMock()
+        lock.__enter__.side_effect = lambda: events.append('lock')
+        with mock.patch.object(recommender, 'lock', lock):
+            recommender.recommend([], exclude_ids=get_exclude_ids())
+        self.assertEqual(events[0], 'read')
+
+    def test_invalid_filter_is_rejected(self):
+        """
+        Tests that discover requests with invalid filters are rejected.
+        """
+        response = self.client.get(reverse('channel-discover'), {'language': 'XX'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ChannelCounterTests(APITestCase):
+    """Contains tests for the member counts and the admin and moderator IDs of channels."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.member, cls.other_user = [
+            get_user_model().objects.create_user(username=f'counter_user_{i}', email=f'counter_{i}@example.com')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        super(ChannelCounterTests, self).setUp()
+        self.client.force_authenticate(user=self.admin)
+
+    def get_counters(self, channel_id):
+        channel = Channel.objects.get(id=channel_id)
+        return channel.member_count, channel.admin_ids, channel.moderator_ids
+
+    def test_counters_follow_memberships(self):
+        """
+        Tests that the counters of a channel are updated when it's created and when its memberships are created,
+        updated and deleted, and that the permissions to update the channel follow the roles of its members.
+        """
+        response = self.client.post(reverse('channel-list'), data={'name': 'counter channel', 'language': 'DE',
+                                                                   'level': 'BE'}, format='json')
+        channel_id = response.data['id']
+        self.assertEqual((response.data['member_count'], response.data['admin_ids']), (1, [str(self.admin.id)]))
+        self.assertEqual(self.get_counters(channel_id), (1, [str(self.admin.id)], []))
+
+        self.client.force_authenticate(user=self.member)
+        response = self.client.post(reverse('membership-list'), data={
+            'user': 'http://testserver' + reverse('customuser-detail', kwargs={'pk': self.member.id}),
+            'channel': 'http://testserver' + reverse('channel-detail', kwargs={'pk': channel_id}),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        membership_url = reverse('membership-detail', kwargs={'pk': response.data['id']})
+        self.assertEqual(self.get_counters(channel_id), (2, [str(self.admin.id)], []))
+        response = self.client.patch(reverse('channel-detail', kwargs={'pk': channel_id}),
+                                     data={'description': 'Updated'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        self.client.patch(membership_url, data={'role': ChannelRole.MOD}, format='json')
+        self.assertEqual(self.get_counters(channel_id), (2, [str(self.admin.id)], [str(self.member.id)]))
+
+        self.client.force_authenticate(user=self.member)
+        response = self.client.patch(reverse('channel-detail', kwargs={'pk': channel_id}),
+                                     data={'description': 'Updated'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.delete(membership_url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_counters(channel_id), (1, [str(self.admin.id)], []))
+
+        self.client.force_authenticate(user=self.other_user)
+        self.client.post(reverse('membership-bulk-create'), data={'channels': [channel_id]}, format='json')
+        self.assertEqual(self.get_counters(channel_id), (2, [str(self.admin.id)], []))
+
+    def test_repair_channel_counters(self):
+        """
+        Tests that the counters that don't match the channels' memberships are repaired.
+        """
+        channel = Channel.objects.create(name='repaired channel', language='DE', level='BE')
+        Membership.objects.create(user=self.admin, channel=channel, role=ChannelRole.ADMIN)
+        Membership.objects.create(user=self.member, channel=channel, role=ChannelRole.MOD)
+        correct_channel = Channel.objects.create(name='correct channel', language='DE', level='BE')
+        Membership.objects.create(user=self.admin, channel=correct_channel, role=ChannelRole.USER)
+        Channel.objects.filter(id=channel.id).update(member_count=5, admin_ids=[], moderator_ids=[])
+
+        self.assertEqual(repair_channel_counters(batch_size=1), 1)
+        self.assertEqual(self.get_counters(channel.id), (2, [str(self.admin.id)], [str(self.member.id)]))
+        self.assertEqual(self.get_counters(correct_channel.id), (1, [], []))
+
+
+class ChannelCounterAutocommitTests(TransactionTestCase):
+    """Contains tests for the channel counters of memberships saved outside of a transaction."""
+
+    def test_roles_saved_in_autocommit_mode(self):
+        """
+        Tests that admin and moderator memberships can be saved and deleted outside of a transaction, as the
+        'seed_db' command does, and that the channel's admin and moderator IDs are updated.
+        """
+        admin, moderator = [get_user_model().objects.create_user(username=f'autocommit_user_{i}',
+                                                                 email=f'autocommit_{i}@example.com')
+                            for i in range(2)]
+        channel = Channel.objects.create(name='autocommit channel', language='DE', level='BE')
+        Membership.objects.create(user=admin, channel=channel, role=ChannelRole.ADMIN)
+        membership = Membership.objects.create(user=moderator, channel=channel, role=ChannelRole.MOD)
+        channel.refresh_from_db()
+        self.assertEqual((channel.admin_ids, channel.moderator_ids), ([str(admin.id)], [str(moderator.id)]))
+
+        membership.delete()
+        channel.refresh_from_db()
+        self.assertEqual(channel.moderator_ids, [])
+
+
+class ChannelListRepresentationTests(APITestCase):
+    """Contains tests for the lean channel list representation and the channel memberships endpoint."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, *cls.members = [
+            get_user_model().objects.create_user(username=f'representation_user_{i}',
+                                                 email=f'representation_{i}@example.com')
+            for i in range(3)
+        ]
+        cls.channel = Channel.objects.create(name='representation channel', language='DE', level='BE')
+        Membership.objects.create(user=cls.members[0], channel=cls.channel, role=ChannelRole.USER)
+        Membership.objects.create(user=cls.admin, channel=cls.channel, role=ChannelRole.ADMIN)
+        Membership.objects.create(user=cls.members[1], channel=cls.channel, role=ChannelRole.MOD)
+
+    def setUp(self):
+        super(ChannelListRepresentationTests, self).setUp()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_list_is_lean_unless_expanded(self):
+        """
+        Tests that channel lists leave out the channels' memberships and link to them instead, unless they're expanded.
+        """
+        url = reverse('channel-list')
+        channel = self.client.get(url, {'search': 'representation'}).data['results'][0]
+        self.assertNotIn('memberships', channel)
+        self.assertEqual(channel['member_count'], 3)
+        self.assertEqual(channel['moderator_ids'], [str(self.members[1].id)])
+        self.assertEqual(channel['membershipsUrl'], 'http://testserver' + reverse('channel-memberships',
+                                                                                  kwargs={'pk': self.channel.id}))
+
+        channel = self.client.get(url, {'search': 'representation', 'expand': 'memberships'}).data['results'][0]
+        self.assertEqual(len(channel['memberships']), 3)
+
+    def test_memberships_endpoint(self):
+        """
+        Tests that the memberships endpoint returns pages of the channel's memberships, with admins first and then
+        moderators.
+        """
+        url = reverse('channel-memberships', kwargs={'pk': self.channel.id})
+        response = self.client.get(url, {'size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([membership['user']['id'] for membership in response.data['results']],
+                         [str(self.admin.id), str(self.members[1].id)])
+        self.assertEqual(response.data['results'][0]['user']['username'], self.admin.username)
+
+        response = self.client.get(url, {'size': 2, 'page': 2})
+        self.assertEqual([membership['user']['id'] for membership in response.data['results']],
+                         [str(self.members[0].id)])
+
+    def test_detail_memberships_match_memberships_endpoint(self):
+        """
+        Tests that the channel's details include its memberships with the same representation as the memberships
+        endpoint.
+        """
+        channel = self.client.get(reverse('channel-detail', kwargs={'pk': self.channel.id})).data
+        memberships = self.client.get(reverse('channel-memberships', kwargs={'pk': self.channel.id})).data['results']
+        self.assertEqual(sorted(channel['memberships'], key=lambda membership: membership['id']),
+                         sorted(memberships, key=lambda membership: membership['id']))
@@ -1,15 +1,25 @@
+from django.db import transaction, IntegrityError
 from drf_spectacular.types import OpenApiTypes
-from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter
+from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter, inline_serializer, \
+    OpenApiResponse
 from dry_rest_permissions.generics import DRYPermissions
-from rest_framework import viewsets, parsers, mixins
+from rest_framework import viewsets, parsers, mixins, fields, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
 
+from chats.consumers import send_chats_join
 from chats.models import ChannelChatMessage
+from chats.purge import schedule_channel_deletion
 from chats.serializers import ChannelChatMessageSerializer
-from common.serializers import MembershipSerializer
+from common.serializers import MembershipSerializer, MembershipBulkCreateSerializer
+from communities.counters import add_members
 from communities.filters import ChannelFilter
-from communities.models import Channel, Membership
-from communities.serializers import ChannelSerializer
+from communities.models import Channel, Membership, ChannelRole
+from communities.recommendations import get_recommender
+from communities.serializers import ChannelSerializer, ChannelListSerializer, ChannelMemberSerializer
+from users.models import UserLanguage
 
 
 @extend_schema_view(
@@ -18,7 +28,10 @@ from communities.serializers import ChannelSerializer
         parameters=[
             OpenApiParameter('memberships__user', type=OpenApiTypes.UUID, required=True,
                              description="The ID of a user to filter the list by. Used to fetch the chat list for "
-                                         "the session's user.", )
+                                         "the session's user.", ),
+            OpenApiParameter('expand', type=OpenApiTypes.STR, enum=['memberships'],
+                             description="Set to 'memberships' to include all of the channels' memberships. Otherwise, "
+                                         "they can be fetched from each channel's 'membershipsUrl'.", )
         ]
     ),
     retrieve=extend_schema(
@@ -28,14 +41,27 @@ from communities.serializers import ChannelSerializer
         description="Modifies the details of the specified channel.",
     ),
     destroy=extend_schema(
-        description="Deletes the specified channel."
+        description="Deletes the specified channel. The channel and its memberships are removed right away, and its "
+                    "messages are deleted in the background.",
+        responses={202: OpenApiResponse(description="The channel was deleted, and its messages are being deleted.")}
     ),
     discover=extend_schema(
         parameters=[
             OpenApiParameter('language', type=OpenApiTypes.UUID, many=True,
                              description="One or multiple languages to filter channels by.  Available values : "
-                                         "DE, EN, ES, FR, IT", )
+                                         "DE, EN, ES, FR, IT", ),
+            OpenApiParameter('level', type=OpenApiTypes.STR, many=True,
+                             description="One or multiple levels to filter channels by.  Available values : "
+                                         "BE, IN, AD, NA", ),
+            OpenApiParameter('expand', type=OpenApiTypes.STR, enum=['memberships'],
+                             description="Set to 'memberships' to include all of the channels' memberships. Otherwise, "
+                                         "they can be fetched from each channel's 'membershipsUrl'.", )
         ]
+    ),
+    memberships=extend_schema(
+        description="Returns a page of the memberships of the specified channel, with their users' details. Admins "
+                    "are listed first, followed by moderators and then by the rest of the members.",
+        responses=ChannelMemberSerializer(many=True)
     )
 )
 class ChannelViewSet(viewsets.ModelViewSet):
@@ -51,10 +77,28 @@ class ChannelViewSet(viewsets.ModelViewSet):
     parser_classes = [parsers.JSONParser, parsers.MultiPartParser]
     filterset_class = ChannelFilter
     permission_classes = [DRYPermissions]
+    throttle_scopes = {'discover': 'discover'}
 
     # Disable PUT method, as it's not currently supported due to nested serializer fields
     http_method_names = ['get', 'post', 'patch', 'delete', 'head']
 
+    def expands_memberships(self):
+        """ Returns whether the channels' memberships are included in the response. They're only left out of channel
+        lists, unless the 'expand' parameter is set to 'memberships'. """
+        return self.action not in ('list', 'discover') or self.request.query_params.get('expand') == 'memberships'
+
+    def get_serializer_class(self):
+        if self.action == 'memberships':
+            return ChannelMemberSerializer
+        return ChannelSerializer if self.expands_memberships() else ChannelListSerializer
+
+    def get_queryset(self):
+        queryset = super(ChannelViewSet, self).get_queryset()
+        if self.action in ('list', 'discover') and self.expands_memberships():
+            queryset = queryset.prefetch_related('memberships__user')
+        return queryset
+
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
         """ Creates a channel and an associated admin membership for the session's user. """
         response = super(ChannelViewSet, self).create(request, *args, **kwargs)
@@ -68,6 +112,9 @@ class ChannelViewSet(viewsets.ModelViewSet):
         membership.save()
         serialized_membership = MembershipSerializer(membership, context={'request': request})
         response.data['memberships'].append(serialized_membership.data)
+        # The admin is the new channel's only member
+        response.data['member_count'] = 1
+        response.data['admin_ids'] = [str(request.user.id)]
 
         message = ChannelChatMessage(
             author=request.user,
@@ -79,12 +126,48 @@ class ChannelViewSet(viewsets.ModelViewSet):
         response.data['messages'].append(serialized_message.data)
         return response
 
+    def destroy(self, request, *args, **kwargs):
+        """ Responds with 202 instead of 204, as the channel's messages are deleted after the response is sent. """
+        self.perform_destroy(self.get_object())
+        return Response(status=status.HTTP_202_ACCEPTED)
+
+    def perform_destroy(self, instance):
+        """ Marks the channel as deleted, and deletes its messages in batches and then the channel in the worker's purge
+        thread, so that the request doesn't wait for them. """
+        schedule_channel_deletion(instance)
+
+    @action(detail=True, methods=['get'])
+    def memberships(self, request, pk=None):
+        """ Returns a page of the channel's memberships, with their users. """
+        channel = self.get_object()
+        queryset = channel.memberships.select_related('user').order_by('role', 'id')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=['get'])
     def discover(self, request):
-        """ Returns a list of random channels which the user is not a member of. """
-        # Exclude channels that the session's user is a member of from the queryset and order it randomly.
-        self.queryset = self.Meta.model.objects.exclude(memberships__user=request.user).order_by('?')
-        return self.list(self, request)
+        """ Returns a page of recommended channels which the user is not a member of, ranked by the channel
+        recommender. Searches fall back to a list of random channels. """
+        filterset = self.filterset_class(request.query_params, queryset=self.queryset, request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        if filterset.form.cleaned_data.get('search'):
+            # Exclude channels that the session's user is a member of from the queryset and order it randomly.
+            self.queryset = self.Meta.model.objects.exclude(memberships__user=request.user).order_by('?')
+            return self.list(self, request)
+
+        languages = UserLanguage.objects.filter(user=request.user).values_list('language', 'level')
+        channel_ids = Membership.objects.filter(user=request.user).values_list('channel_id', flat=True)
+        recommendations = get_recommender().recommend(languages, exclude_ids=channel_ids,
+                                                      language_filter=filterset.form.cleaned_data.get('language'),
+                                                      level_filter=filterset.form.cleaned_data.get('level'))
+        page = self.paginate_queryset(recommendations)
+        channels = self.get_queryset().in_bulk(page)
+        # Channels deleted since the recommender was updated are skipped
+        serializer = self.get_serializer([channels[channel_id] for channel_id in page if channel_id in channels],
+                                         many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 @extend_schema_view(
@@ -99,6 +182,22 @@ class ChannelViewSet(viewsets.ModelViewSet):
     ),
     destroy=extend_schema(
         description="Deletes the specified membership."
+    ),
+    bulk_create=extend_schema(
+        description="Creates memberships in several channels for a user in a single request.",
+        request=MembershipBulkCreateSerializer,
+        responses={
+            201: inline_serializer(name="membership_bulk_create_response", fields={
+                "created": fields.ListField(child=inline_serializer(name="membership_bulk_create_item", fields={
+                    "id": fields.UUIDField(),
+                    "url": fields.URLField(),
+                    "channel": fields.UUIDField(),
+                })),
+                "skipped": fields.ListField(child=fields.UUIDField(),
+                                            help_text="IDs of the channels that the user was already a member of."),
+            }),
+            400: OpenApiResponse(description="The channel list is empty or too long, or some channels weren't found.")
+        }
     )
 )
 class MembershipViewSet(mixins.RetrieveModelMixin,
@@ -117,3 +216,52 @@ class MembershipViewSet(mixins.RetrieveModelMixin,
     serializer_class = MembershipSerializer
     http_method_names = ['get', 'post', 'patch', 'delete', 'head']
     permission_classes = [DRYPermissions]
+
+    # Memberships are changed in a transaction along with their channel's counters (see communities.counters)
+    @transaction.atomic
+    def perform_create(self, serializer):
+        super(MembershipViewSet, self).perform_create(serializer)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        super(MembershipViewSet, self).perform_update(serializer)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        super(MembershipViewSet, self).perform_destroy(instance)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """ Creates user memberships in all the channels in the 'channels' array, in a single transaction. Channels that
+        the user is already a member of are skipped. The user's open WebSocket connections are then told to join the
+        channels' groups. """
+        serializer = MembershipBulkCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data.get('user', request.user)
+        channel_ids = serializer.validated_data['channels']
+
+        existing_ids = set(Membership.objects.filter(user=user, channel_id__in=channel_ids)
+                           .values_list('channel_id', flat=True))
+        memberships = [Membership(user=user, channel_id=channel_id, role=ChannelRole.USER)
+                       for channel_id in channel_ids if channel_id not in existing_ids]
+        try:
+            with transaction.atomic():
+                Membership.objects.bulk_create(memberships)
+                # The memberships were created in bulk, without sending the signals that update the channels' counters
+                for membership in memberships:
+                    add_members(membership.channel_id, 1)
+                if memberships:
+                    transaction.on_commit(lambda: send_chats_join({user.id: [m.channel_id for m in memberships]}))
+        except IntegrityError:
+            # Another request created one of the memberships in the meantime
+            return Response(data={"error": "Some of the memberships already exist."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(data={
+            "created": [{
+                "id": membership.id,
+                "url": reverse('membership-detail', kwargs={'pk': membership.id}, request=request),
+                "channel": membership.channel_id
+            } for membership in memberships],
+            "skipped": [channel_id for channel_id in channel_ids if channel_id in existing_ids]
+        }, status=status.HTTP_201_CREATED)
@@ -0,0 +1,17 @@
+"""
+Gunicorn configuration for serving tandem.asgi with several Uvicorn worker processes, which is the supported way of
+using more than one core in production. Run from the project's root with `gunicorn tandem.asgi:application`.
+
+Settings are read from the following environment variables:
+    - WEB_CONCURRENCY: number of worker processes. Defaults to the number of available cores.
+    - ASGI_THREADS: size of each worker's sync thread pool (see tandem.settings).
+    - DB_CONN_MAX_AGE: lifetime of persistent database connections, in seconds (see tandem.settings).
+"""
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# Give WebSocket connections some time to close on restarts before killing the worker
+graceful_timeout = 30
@@ -7,23 +7,52 @@ For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 """
 
+import asyncio
 import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import django
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
-from django.core.asgi import get_asgi_application
+from django.conf import settings
+
+from tandem.handlers import StreamingASGIHandler
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tandem.settings')
 # Initialize Django ASGI application early to ensure the AppRegistry
-# is populated before importing code that may import ORM models.
-django_asgi_app = get_asgi_application()
+# is populated before importing code that may import ORM models. Same as get_asgi_application(), but with the handler
+# that streams responses from the sync thread.
+django.setup(set_prefix=False)
+django_asgi_app = StreamingASGIHandler()
 
 from chats.urls import websocket_urlpatterns
 
-application = ProtocolTypeRouter({
+
+class SyncThreadPoolMiddleware:
+    """
+    Sets a thread pool of settings.ASGI_THREADS threads as the default executor of the worker's event loop, which runs
+    the synchronous code that isn't thread sensitive (e.g. the chat consumers' handlers). The pool's threads are
+    long-lived, so they keep their database connections open between calls.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.loops = weakref.WeakSet()
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        if loop not in self.loops:
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=settings.ASGI_THREADS, thread_name_prefix='asgi'))
+            self.loops.add(loop)
+        return await self.app(scope, receive, send)
+
+
+application = SyncThreadPoolMiddleware(ProtocolTypeRouter({
     # Django's ASGI application to handle traditional HTTP requests
     "http": django_asgi_app,
 
     # WebSocket chat handler
     "websocket": AuthMiddlewareStack(URLRouter(websocket_urlpatterns)),
-})
+}))
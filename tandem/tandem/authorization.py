@@ -0,0 +1,59 @@
+import uuid
+
+from django.utils.functional import cached_property
+
+
+class AuthorizationContext:
+    """
+    Authorization data of a request's user: the roles of their channel memberships and the IDs of their friend chats.
+    Each of them is loaded with a single query the first time it's needed, and then used to answer every permission
+    check made during the request, instead of querying the database in each of them.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def channel_roles(self):
+        """ Dictionary with the IDs of the channels that the user is a member of as keys and their roles as values. """
+        if not self.user.is_authenticated:
+            return {}
+        from communities.models import Membership
+        return dict(Membership.objects.filter(user=self.user).values_list('channel_id', 'role'))
+
+    @cached_property
+    def friend_chat_ids(self):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(self.user.friend_chats.values_list('id', flat=True))
+
+    def is_channel_member(self, channel_id):
+        return to_uuid(channel_id) in self.channel_roles
+
+    def has_channel_role(self, channel_id, roles):
+        """ Returns whether the user is a member of the channel with one of the given roles. """
+        return self.channel_roles.get(to_uuid(channel_id)) in roles
+
+    def is_friend_chat_member(self, chat_id):
+        return to_uuid(chat_id) in self.friend_chat_ids
+
+
+def to_uuid(value):
+    """ Converts the value to a UUID, if it's a valid one. Returns None otherwise. """
+    if isinstance(value, uuid.UUID):
+        return value
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def get_authorization_context(request):
+    """ Returns the authorization context of the request's user, creating it on the first call. The context is stored in
+    the underlying Django request, so it's shared by the DRF requests of nested views and by the serializers. """
+    django_request = getattr(request, '_request', request)
+    context = getattr(django_request, 'authorization_context', None)
+    if context is None or context.user != request.user:
+        context = AuthorizationContext(request.user)
+        django_request.authorization_context = context
+    return context
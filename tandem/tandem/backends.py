@@ -0,0 +1,33 @@
+"""
+Authentication backend that keeps the session users in the cache, so that authenticating a request or a WebSocket
+connection doesn't need a database query to fetch its user. Users are removed from the cache when they're saved or
+deleted (see tandem.signals).
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+def get_user_cache_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    """ Django's model backend, with the users fetched by get_user() kept in the cache for settings.USER_CACHE_TIMEOUT
+    seconds. Used by Django's and Channels' authentication middleware to get the session's user. Users are fetched from
+    the primary database, as a user read from a replica that lags behind could be cached after the change that removed
+    it from the cache. """
+
+    def get_user(self, user_id):
+        key = get_user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            UserModel = get_user_model()
+            try:
+                user = UserModel._default_manager.db_manager(DEFAULT_DB_ALIAS).get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
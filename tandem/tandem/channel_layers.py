@@ -0,0 +1,35 @@
+import hashlib
+
+from channels_redis.core import RedisChannelLayer
+
+
+def jump_consistent_hash(key, buckets):
+    """
+    Maps a 64-bit integer key to one of the given number of buckets. When the number of buckets grows from N to N + 1,
+    only ~1/(N + 1) of the keys are moved, and all of them are moved to the new bucket.
+    Source: Lamping & Veach, "A Fast, Minimal Memory, Consistent Hash Algorithm" (https://arxiv.org/abs/1406.2294)
+    """
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """
+    Redis channel layer which distributes groups and channels across all the configured hosts (shards) using jump
+    consistent hashing, instead of the CRC-based modulo hashing used by channels_redis. This keeps most groups (chat
+    IDs) on the same shard when shards are added, so scaling the layer out doesn't reshuffle every group.
+
+    All workers must be configured with the same list of hosts, in the same order.
+    """
+
+    def consistent_hash(self, value):
+        if self.ring_size == 1:
+            return 0
+        if isinstance(value, str):
+            value = value.encode('utf8')
+        key = int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+        return jump_consistent_hash(key, self.ring_size)
@@ -0,0 +1,22 @@
+"""
+API exception handling. The application's own exceptions, which aren't tied to DRF so that they can be raised by code
+that runs outside of the API (e.g. the password hashers), are turned into the API errors that they correspond to.
+"""
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.views import exception_handler as drf_exception_handler
+
+from tandem.hashers import HashingUnavailable
+
+
+class ServiceUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The server is busy, please try again later.'
+    default_code = 'hashing_unavailable'
+
+
+def exception_handler(exc, context):
+    """ DRF's exception handler, which also responds with a 503 when a password can't be hashed in time. """
+    if isinstance(exc, HashingUnavailable):
+        exc = ServiceUnavailable()
+    return drf_exception_handler(exc, context)
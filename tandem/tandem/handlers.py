@@ -0,0 +1,38 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    Django's ASGI handler, with streaming responses iterated in the request's sync thread, as Django 4.2 does. Django
+    4.0 iterates them in the event loop, which blocks it while each part is generated, and doesn't allow database
+    queries (e.g. the ones of the message export).
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super(StreamingASGIHandler, self).send_response(response, send)
+
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+
+        # The request's thread is the one that ran the view, so it has the same database connection
+        get_next_part = sync_to_async(next, thread_sensitive=True)
+        try:
+            parts = iter(response)
+            while (part := await get_next_part(parts, None)) is not None:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            # Closes the response's iterator and sends the request_finished signal, which returns the request's
+            # database connection, also if the client disconnects before the response is sent
+            await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,89 @@
+"""
+Password hashers whose work runs in a bounded number of slots per worker process, so that a burst of logins can't take
+up every thread of the worker and starve the rest of its requests (e.g. chat messages). Hashing fails with
+HashingUnavailable if no slot is freed within settings.PASSWORD_HASHING['TIMEOUT'] seconds, which the API responds to
+with a 503 (see tandem.exceptions).
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+
+_hashing_slots = None
+_hashing_slots_lock = threading.Lock()
+# Whether the current thread holds a slot. Hashers call each other's methods (e.g. PBKDF2's verify() calls encode()),
+# which must not wait for a second slot.
+_local = threading.local()
+
+
+class HashingUnavailable(Exception):
+    """ Raised when a password can't be hashed because all the hashing slots are taken. """
+
+
+def get_hashing_slots():
+    global _hashing_slots
+    with _hashing_slots_lock:
+        if _hashing_slots is None:
+            _hashing_slots = threading.BoundedSemaphore(settings.PASSWORD_HASHING['CONCURRENCY'])
+        return _hashing_slots
+
+
+@contextmanager
+def hashing_slot():
+    """ Waits for a free hashing slot and holds it while the enclosed code runs. Raises HashingUnavailable if no slot is
+    freed in time. """
+    if getattr(_local, 'holds_slot', False):
+        yield
+        return
+
+    slots = get_hashing_slots()
+    if not slots.acquire(timeout=settings.PASSWORD_HASHING['TIMEOUT']):
+        raise HashingUnavailable()
+    _local.holds_slot = True
+    try:
+        yield
+    finally:
+        _local.holds_slot = False
+        slots.release()
+
+
+class BoundedHasherMixin:
+    """ Runs the hasher's expensive operations in a hashing slot. """
+
+    def encode(self, *args, **kwargs):
+        with hashing_slot():
+            return super(BoundedHasherMixin, self).encode(*args, **kwargs)
+
+    def verify(self, *args, **kwargs):
+        with hashing_slot():
+            return super(BoundedHasherMixin, self).verify(*args, **kwargs)
+
+    def harden_runtime(self, *args, **kwargs):
+        with hashing_slot():
+            return super(BoundedHasherMixin, self).harden_runtime(*args, **kwargs)
+
+
+class TunedArgon2PasswordHasher(BoundedHasherMixin, Argon2PasswordHasher):
+    """
+    Argon2 hasher whose parameters are taken from settings.PASSWORD_HASHING['ARGON2']. Django's defaults use 100 MiB of
+    memory and 8 lanes per hash, which is more than a worker can afford for each concurrent login. Hashes made with
+    other parameters are updated the next time their user logs in.
+    """
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_HASHING['ARGON2']['TIME_COST']
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_HASHING['ARGON2']['MEMORY_COST']
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_HASHING['ARGON2']['PARALLELISM']
+
+
+class BoundedPBKDF2PasswordHasher(BoundedHasherMixin, PBKDF2PasswordHasher):
+    """ Django's default PBKDF2 hasher, running in a hashing slot. Hashes made with it can still be verified after
+    switching to Argon2, and are then updated to Argon2. """
@@ -0,0 +1,18 @@
+import os
+import time
+import uuid
+
+
+def uuid7():
+    """
+    Returns a version 7 UUID: a 48-bit Unix timestamp in milliseconds followed by 74 random bits. UUIDs generated later
+    sort after earlier ones, so inserting them appends to the end of the primary key index instead of hitting random
+    pages, while they stay compatible with any UUID field.
+    Source: RFC 9562, section 5.7 (https://www.rfc-editor.org/rfc/rfc9562#section-5.7)
+    """
+    timestamp = time.time_ns() // 1_000_000
+    value = (timestamp & 0xFFFFFFFFFFFF) << 80 | int.from_bytes(os.urandom(10), 'big')
+    # Set the version (7) and variant (0b10) bits
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
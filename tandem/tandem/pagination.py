@@ -1,5 +1,5 @@
 from django.core.paginator import EmptyPage
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.response import Response
 
 
@@ -26,3 +26,13 @@ class CustomPagination(PageNumberPagination):
             'nextPageNumber': next_page,
             'previousPageNumber': previous_page
         })
+
+
+class KeysetPagination(CursorPagination):
+    """ Cursor (keyset) pagination by ID, used for lists that can grow without bound. Each page is fetched by seeking
+    past the last ID of the previous one, so its cost doesn't grow with its position. Enables the page size query param
+    to allow the client to control the number of records fetched. """
+
+    ordering = 'id'
+    page_size_query_param = 'size'
+    max_page_size = 100
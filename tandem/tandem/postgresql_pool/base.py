@@ -0,0 +1,100 @@
+"""
+PostgreSQL database backend which keeps connections in a per-process pool instead of opening a new connection for each
+request or database_sync_to_async() call. Django "closes" connections as usual (CONN_MAX_AGE should be 0), which
+returns them to the pool.
+
+The pool is configured with the POOL key of the database's settings:
+    - MAX_SIZE: maximum number of connections opened by each process. Defaults to 20.
+    - TIMEOUT: seconds to wait for a free connection when the pool is saturated before raising an error. Defaults to 10.
+    - MAX_IDLE: seconds after which idle connections are closed. Defaults to 300.
+    - HEALTH_CHECK_INTERVAL: connections that have been idle for longer than this are checked with a 'SELECT 1' before
+      being reused. Defaults to 30.
+"""
+import threading
+
+import psycopg2.extensions
+from django.db.backends.postgresql import base, creation
+
+from tandem.postgresql_pool.pool import ConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, settings_dict, connect):
+    """ Returns the pool for a database alias and set of connection parameters, creating it if needed. Parameters are
+    part of the key, as connections to other databases (e.g. the 'postgres' or test databases) can't be shared. """
+    key = (alias, repr(sorted(conn_params.items())))
+    with _pools_lock:
+        if key not in _pools:
+            options = settings_dict.get('POOL', {})
+            _pools[key] = ConnectionPool(
+                connect=connect,
+                ping=ping,
+                reset=reset,
+                max_size=options.get('MAX_SIZE', 20),
+                timeout=options.get('TIMEOUT', 10),
+                max_idle=options.get('MAX_IDLE', 300),
+                health_check_interval=options.get('HEALTH_CHECK_INTERVAL', 30),
+            )
+        return _pools[key]
+
+
+def get_pool_stats():
+    """ Returns the stats of all the pools of the current process, by database alias and name. """
+    with _pools_lock:
+        pools = list(_pools.items())
+    return [{'alias': alias, **pool.stats()} for (alias, _), pool in pools]
+
+
+def close_pools(alias):
+    """ Closes the idle connections of all the pools for a database alias. """
+    with _pools_lock:
+        pools = [pool for (pool_alias, _), pool in _pools.items() if pool_alias == alias]
+    for pool in pools:
+        pool.close()
+
+
+def ping(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def reset(connection):
+    """ Rolls back any open transaction and restores autocommit before a connection is reused. """
+    if connection.closed:
+        raise psycopg2.InterfaceError('Connection already closed.')
+    if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    connection.autocommit = True
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Pooled connections would prevent the test database from being dropped
+        close_pools(self.connection.alias)
+        super(DatabaseCreation, self)._destroy_test_db(test_database_name, verbosity)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        # Pooled connections to the source database would prevent it from being used as a template
+        close_pools(self.connection.alias)
+        super(DatabaseCreation, self)._clone_test_db(suffix, verbosity, keepdb)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, conn_params, self.settings_dict,
+                        connect=lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        connection = pool.get()
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        self.pool = pool
+        return connection
+
+    def _close(self):
+        """ Returns the connection to the pool instead of closing it. Connections which raised errors are discarded, as
+        well as those closed inside an atomic block, as Django keeps a reference to them until the block exits. """
+        if self.connection is not None:
+            self.pool.put(self.connection, discard=self.errors_occurred or self.in_atomic_block)
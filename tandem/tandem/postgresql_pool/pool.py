@@ -0,0 +1,181 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """ Raised when no connection could be checked out of the pool before the timeout expired. """
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections. Connections are created lazily up to max_size, and checkouts wait for
+    up to `timeout` seconds when the pool is saturated.
+
+    Idle connections are pinged with `ping` before being handed out if they have been idle for longer than
+    `health_check_interval` seconds, and closed once they have been idle for longer than `max_idle` seconds. Returned
+    connections are cleaned up with `reset`, and discarded if it fails.
+    """
+
+    def __init__(self, connect, ping, reset, max_size=20, timeout=10, max_idle=300, health_check_interval=30):
+        self.connect = connect
+        self.ping = ping
+        self.reset = reset
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+
+        # Idle connections, as (connection, returned_at) tuples. The most recently used connection is reused first, so
+        # that the rest can go idle and be closed when traffic decreases.
+        self._idle = deque()
+        self._size = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+        self._pid = os.getpid()
+
+        self.metrics = {
+            'connections_created': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'peak_in_use': 0,
+        }
+
+    def get(self):
+        """ Checks out a connection from the pool, creating it if none are idle and the pool isn't full. """
+        self._check_pid()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection, returned_at = self._reserve(deadline)
+            if connection is None:
+                try:
+                    connection = self.connect()
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+                with self._condition:
+                    self.metrics['connections_created'] += 1
+                return connection
+
+            if time.monotonic() - returned_at < self.health_check_interval or self._is_healthy(connection):
+                return connection
+
+            with self._condition:
+                self.metrics['health_check_failures'] += 1
+            self._discard(connection)
+
+    def put(self, connection, discard=False):
+        """ Returns a connection to the pool. Broken connections, or connections flagged with `discard`, are closed. """
+        if self._pid != os.getpid():
+            # The connection was checked out from the parent process' pool, so it can't be reused here.
+            return
+        if not discard:
+            try:
+                self.reset(connection)
+            except Exception:
+                discard = True
+
+        if discard:
+            self._discard(connection)
+        else:
+            with self._condition:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+
+    def close(self):
+        """ Closes all idle connections. Connections that are currently checked out are closed when returned. """
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        """ Returns the pool's current state and its cumulative metrics. """
+        with self._condition:
+            in_use = self._size - len(self._idle)
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': in_use,
+                'waiting': self._waiting,
+                'saturation': in_use / self.max_size,
+                **self.metrics,
+            }
+
+    def _reserve(self, deadline):
+        """ Returns an idle connection and the time it was returned at, or (None, None) after reserving a slot for a
+        new connection. Waits until one of them is available, or raises PoolTimeout if the deadline is reached. """
+        with self._condition:
+            while True:
+                self._close_expired()
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    connection, returned_at = None, None
+                    self._size += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics['timeouts'] += 1
+                    logger.warning('Database connection pool exhausted: %s connections in use.', self._size)
+                    raise PoolTimeout(f'Could not get a database connection within {self.timeout} seconds.')
+                self.metrics['waits'] += 1
+                self._waiting += 1
+                self._condition.wait(remaining)
+                self._waiting -= 1
+
+            self.metrics['checkouts'] += 1
+            self.metrics['peak_in_use'] = max(self.metrics['peak_in_use'], self._size - len(self._idle))
+            return connection, returned_at
+
+    def _close_expired(self):
+        """ Closes the connections that have been idle for too long. Must be called with the lock held. """
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.max_idle:
+            connection, _ = self._idle.popleft()
+            self._size -= 1
+            self.metrics['connections_closed'] += 1
+            self._close_connection(connection)
+
+    def _is_healthy(self, connection):
+        try:
+            self.ping(connection)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        self._close_connection(connection)
+        with self._condition:
+            self._size -= 1
+            self.metrics['connections_closed'] += 1
+            self._condition.notify()
+
+    @staticmethod
+    def _close_connection(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _check_pid(self):
+        """ Drops the connections inherited from a parent process, as they can't be shared between processes. """
+        if self._pid != os.getpid():
+            with self._condition:
+                if self._pid != os.getpid():
+                    self._idle.clear()
+                    self._size = 0
+                    self._pid = os.getpid()
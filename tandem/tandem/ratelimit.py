@@ -0,0 +1,164 @@
+"""
+Token bucket rate limiting for the REST API and the chat WebSocket. Limits are set per scope (an endpoint or a WebSocket
+message type) in settings.RATE_LIMITS, as '<requests>/<period>' strings, e.g. '10/m': each client can make up to 10
+requests in a burst, and gets a new one every 6 seconds.
+
+Buckets are kept in Redis, so that the limits apply across all workers, and in the worker's memory if Redis can't be
+reached, so that an outage of the limiter doesn't take down the API with it.
+"""
+import functools
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate):
+    """ Parses a '<requests>/<period>' string. Returns the bucket's capacity and its refill rate in tokens per second.
+    """
+    requests, period = rate.split('/')
+    return int(requests), int(requests) / PERIODS[period[0]]
+
+
+class BaseRateLimiter:
+    """ Base class of rate limiters. Keeps per-process metrics of the checks made for each scope. """
+
+    def __init__(self, **kwargs):
+        self.metrics = Counter()
+        self.metrics_lock = threading.Lock()
+
+    def check(self, scope, key):
+        """ Takes a token from the client's bucket for the scope. Returns whether the request is allowed, and if it
+        isn't, the number of seconds until it would be. Scopes without a configured limit are always allowed. """
+        rate = settings.RATE_LIMITS.get(scope)
+        if rate is None:
+            return True, 0
+        capacity, refill_rate = parse_rate(rate)
+        allowed, retry_after = self.consume(f'{scope}:{key}', capacity, refill_rate)
+        with self.metrics_lock:
+            self.metrics[(scope, 'allowed' if allowed else 'rejected')] += 1
+        return allowed, retry_after
+
+    def consume(self, key, capacity, refill_rate):
+        raise NotImplementedError
+
+    def get_stats(self):
+        """ Returns the number of allowed and rejected checks of each scope since the process started. """
+        with self.metrics_lock:
+            scopes = {}
+            for (scope, result), count in self.metrics.items():
+                if scope is not None:
+                    scopes.setdefault(scope, {'allowed': 0, 'rejected': 0})[result] = count
+            return {'backend': type(self).__name__, 'scopes': scopes}
+
+
+class InMemoryRateLimiter(BaseRateLimiter):
+    """ Rate limiter that keeps the buckets in the memory of the current process, so each worker enforces the limits on
+    its own. Keeps up to 'max_keys' buckets, dropping the least recently used ones. """
+
+    def __init__(self, max_keys=100000, **kwargs):
+        super(InMemoryRateLimiter, self).__init__(**kwargs)
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / refill_rate
+
+
+# Refills and takes a token from the bucket in a single atomic step, using the Redis server's clock so that the workers'
+# clocks don't need to be in sync. Buckets expire once they would be full again.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * refill_rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / refill_rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / refill_rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RedisRateLimiter(BaseRateLimiter):
+    """ Rate limiter that keeps the buckets in Redis, shared by all workers. Each check takes a single round trip. If
+    Redis can't be reached, the check is made against the worker's in-memory buckets instead. """
+
+    def __init__(self, location='redis://localhost:6379/0', key_prefix='ratelimit', timeout=0.1, **kwargs):
+        super(RedisRateLimiter, self).__init__(**kwargs)
+        self.client = redis.Redis.from_url(location, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.key_prefix = key_prefix
+        self.fallback = InMemoryRateLimiter()
+
+    def consume(self, key, capacity, refill_rate):
+        try:
+            allowed, retry_after = self.script(keys=[f'{self.key_prefix}:{key}'], args=[capacity, refill_rate])
+        except redis.RedisError:
+            with self.metrics_lock:
+                self.metrics[(None, 'fallback')] += 1
+            return self.fallback.consume(key, capacity, refill_rate)
+        return bool(allowed), float(retry_after)
+
+    def get_stats(self):
+        stats = super(RedisRateLimiter, self).get_stats()
+        with self.metrics_lock:
+            stats['fallback_checks'] = self.metrics[(None, 'fallback')]
+        return stats
+
+
+@functools.lru_cache(maxsize=None)
+def get_rate_limiter():
+    """ Returns the rate limiter configured in settings.RATE_LIMITER, which is shared by the whole process. """
+    options = {key.lower(): value for key, value in settings.RATE_LIMITER.items()}
+    return import_string(options.pop('backend'))(**options)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles the requests to views with a rate limit scope, which is taken from the view's 'throttle_scope' attribute,
+    or from its 'throttle_scopes' dictionary by action for viewsets. Requests are identified by user, or by IP address
+    for anonymous users. Rejected requests get a 429 response with a Retry-After header.
+    """
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None:
+            scope = getattr(view, 'throttle_scopes', {}).get(getattr(view, 'action', None))
+        if scope is None:
+            return True
+
+        key = f'user:{request.user.id}' if request.user.is_authenticated else f'ip:{self.get_ident(request)}'
+        allowed, self.retry_after = get_rate_limiter().check(scope, key)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
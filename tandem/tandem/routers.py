@@ -0,0 +1,113 @@
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+# Apps whose models are always read from the primary database: sessions and permissions must be up to date, and
+# sessions are written on most requests anyway.
+PRIMARY_ONLY_APPS = {'sessions', 'auth', 'contenttypes', 'admin'}
+
+
+class RoutingState:
+    """ Routing information for the current request or consumer call. """
+
+    def __init__(self, user_id=None, use_primary=False):
+        self.user_id = user_id
+        self.use_primary = use_primary
+        # Whether the user is pinned to the primary database. Loaded lazily from the cache on the first read.
+        self.pinned = None
+        # Whether the pin has been set or renewed by a write in this context
+        self.wrote = False
+
+
+_routing_state = contextvars.ContextVar('routing_state', default=None)
+
+
+@contextmanager
+def routing_context(user_id=None, use_primary=False):
+    """ Sets the user on whose behalf the enclosed queries are made, and whether all of them must be sent to the primary
+    database (e.g. because they're part of a request that writes data). """
+    token = _routing_state.set(RoutingState(user_id, use_primary))
+    try:
+        yield
+    finally:
+        _routing_state.reset(token)
+
+
+def get_pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+class ReplicaRoutingMiddleware:
+    """ Sets the routing context for each request: requests with unsafe methods are sent to the primary database, and
+    the session's user is used to check whether they're pinned to it. Must be placed after AuthenticationMiddleware. """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = getattr(request, 'user', None)
+        user_id = user.id if user is not None and user.is_authenticated else None
+        with routing_context(user_id=user_id, use_primary=request.method not in SAFE_METHODS):
+            return self.get_response(request)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to the primary database, and reads to a random replica from settings.REPLICA_DATABASES. Reads are sent
+    to the primary database instead if any of these is true:
+        - There are no replicas.
+        - The query is made inside a transaction, or as part of a request with an unsafe method.
+        - The model belongs to one of the PRIMARY_ONLY_APPS.
+        - The user has written data in the last settings.REPLICA_PIN_SECONDS seconds, so that they can read their own
+          writes even if the replicas lag behind. The pins are kept in the cache, which must be shared by all workers.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.REPLICA_DATABASES
+        if not replicas or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+
+        state = _routing_state.get()
+        if state is not None:
+            if state.use_primary:
+                return DEFAULT_DB_ALIAS
+            if state.user_id is not None:
+                if state.pinned is None:
+                    state.pinned = bool(cache.get(get_pin_key(state.user_id)))
+                if state.pinned:
+                    return DEFAULT_DB_ALIAS
+
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if not settings.REPLICA_DATABASES:
+            # There's nothing to pin the user to
+            return DEFAULT_DB_ALIAS
+
+        state = _routing_state.get()
+        if state is not None and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            # Send the rest of the queries of this request to the primary database, and pin the user to it for the next
+            # few seconds
+            state.use_primary = True
+            if state.user_id is not None and not state.wrote:
+                cache.set(get_pin_key(state.user_id), True, settings.REPLICA_PIN_SECONDS)
+                state.pinned = True
+                state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary database through replication
+        return db not in settings.REPLICA_DATABASES
@@ -28,6 +28,10 @@ DEBUG = os.environ.get('DEBUG') if os.environ.get('DEBUG') is not None else Fals
 ALLOWED_HOSTS = ['*']
 USE_X_FORWARDED_HOST = True
 
+# Application profile: 'development' (the default) or 'production'. The production profile leaves out the apps that are
+# only used in development (see DEVELOPMENT_APPS) and the OpenAPI schema views, so that workers start faster.
+APP_PROFILE = os.environ.get('APP_PROFILE', 'development')
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -55,6 +59,10 @@ INSTALLED_APPS = [
     'chats',
 ]
 
+DEVELOPMENT_APPS = ['django_extensions', 'drf_spectacular']
+if APP_PROFILE == 'production':
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in DEVELOPMENT_APPS]
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -62,6 +70,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tandem.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,13 +100,69 @@ WSGI_APPLICATION = 'tandem.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # Use the pooled PostgreSQL backend unless DB_POOL is set to 0
+        'ENGINE': ('tandem.postgresql_pool' if os.environ.get('DB_POOL', '1') != '0'
+                   else 'django.db.backends.postgresql'),
         'NAME': os.environ.get('POSTGRES_DB'),
         'USER': os.environ.get('POSTGRES_USER'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': 'db',
         'PORT': 5432,
+        # Keep connections open between requests instead of reconnecting every time. Under ASGI, connections are only
+        # reused by long-lived threads, such as those of the sync thread pool that runs the chat consumers. With the
+        # pooled backend, this should be 0, so that connections are returned to the pool at the end of each request.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        # Connection pool settings for the pooled backend (see tandem.postgresql_pool.base). Each worker process has
+        # its own pool, so MAX_SIZE times WEB_CONCURRENCY must stay below the server's max_connections.
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_SIZE', 20)),
+            'TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'MAX_IDLE': 300,
+            'HEALTH_CHECK_INTERVAL': 30,
+        },
+    }
+}
+
+# Read replicas, as a comma-separated list of hosts. They use the same credentials as the primary database, and list and
+# detail queries are routed to them by tandem.routers.PrimaryReplicaRouter.
+REPLICA_DATABASES = []
+replica_hosts = [host.strip() for host in os.environ.get('DATABASE_REPLICAS', '').split(',') if host.strip()]
+for index, replica_host in enumerate(replica_hosts):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'TEST': {'MIRROR': 'default'},
     }
+    REPLICA_DATABASES.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['tandem.routers.PrimaryReplicaRouter']
+
+# Number of seconds during which a user's reads are sent to the primary database after they write data, so that they
+# can read their own writes even if the replicas lag behind.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+# Password hashing
+# https://docs.djangoproject.com/en/4.0/topics/auth/passwords/
+# The first hasher is used for new passwords, and the rest to verify existing ones, which are updated to the first one
+# when their user logs in. Set PASSWORD_HASHER to 'pbkdf2' to keep using Django's default hasher.
+
+PASSWORD_HASHERS = [
+    'tandem.hashers.TunedArgon2PasswordHasher',
+    'tandem.hashers.BoundedPBKDF2PasswordHasher',
+]
+if os.environ.get('PASSWORD_HASHER', 'argon2') == 'pbkdf2':
+    PASSWORD_HASHERS.reverse()
+
+# Maximum number of passwords hashed at once by each worker process, and seconds that a request waits for its turn
+# before getting a 503 response. Argon2 uses MEMORY_COST KiB of memory for each hash.
+PASSWORD_HASHING = {
+    'CONCURRENCY': int(os.environ.get('PASSWORD_HASHING_CONCURRENCY', os.cpu_count() or 1)),
+    'TIMEOUT': float(os.environ.get('PASSWORD_HASHING_TIMEOUT', 5)),
+    'ARGON2': {
+        'TIME_COST': int(os.environ.get('ARGON2_TIME_COST', 2)),
+        'MEMORY_COST': int(os.environ.get('ARGON2_MEMORY_COST', 19456)),
+        'PARALLELISM': int(os.environ.get('ARGON2_PARALLELISM', 1)),
+    },
 }
 
 # Password validation
@@ -143,22 +208,93 @@ MEDIA_URL = 'api/media/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Must be shared by all workers, as it's used to pin users to the primary database after they write data.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', 'redis://redis:6379/1'),
+    }
+}
+
+# Message retention and purging (see chats.purge). Messages older than RETENTION_DAYS days are deleted by the
+# 'purge_messages' command, unless their channel has its own retention period. If it's 0, messages are kept forever.
+# Purges delete BATCH_SIZE messages at a time, pausing for BATCH_DELAY seconds between batches.
+MESSAGE_PURGE = {
+    'RETENTION_DAYS': int(os.environ.get('MESSAGE_RETENTION_DAYS', 0)),
+    'BATCH_SIZE': int(os.environ.get('MESSAGE_PURGE_BATCH_SIZE', 1000)),
+    'BATCH_DELAY': float(os.environ.get('MESSAGE_PURGE_BATCH_DELAY', 0.05)),
+}
+
 # Authentication settings
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Session users are kept in the cache for USER_CACHE_TIMEOUT seconds, so that authenticating a request or a WebSocket
+# connection doesn't query the database for the user. Note that changing the backend logs out all users.
+AUTHENTICATION_BACKENDS = ['tandem.backends.CachedModelBackend']
+USER_CACHE_TIMEOUT = int(os.environ.get('USER_CACHE_TIMEOUT', 300))
+
+# The IDs of each user's friends are kept in the cache for FRIENDS_CACHE_TIMEOUT seconds (see chats.friends)
+FRIENDS_CACHE_TIMEOUT = int(os.environ.get('FRIENDS_CACHE_TIMEOUT', 3600))
+
+# Session storage: 'cached_db' (the default) reads sessions from the cache and writes them to both the cache and the
+# database, 'cache' only keeps them in the cache, 'signed_cookies' keeps them in the client's cookies, and 'db' only
+# keeps them in the database. Expired sessions must be deleted periodically with the 'clearsessions' command when
+# they're kept in the database.
+# https://docs.djangoproject.com/en/4.0/topics/http/sessions/#configuring-sessions
+SESSION_ENGINE = f'django.contrib.sessions.backends.{os.environ.get("SESSION_BACKEND", "cached_db")}'
+
 # Django Channels settings
 
 ASGI_APPLICATION = 'tandem.asgi.application'
 
+# Size of the thread pool used by each ASGI worker process to run synchronous code, such as the chat consumers'
+# handlers.
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', min(32, (os.cpu_count() or 1) + 4)))
+
+# Comma-separated list of Redis hosts ('host:port' or 'redis://' URLs) used by the channel layer. Groups are sharded
+# across all of them, so every worker must use the same list, in the same order.
+REDIS_HOSTS = [
+    host.strip() if '://' in host else (host.strip().split(':')[0], int(host.strip().split(':')[1]))
+    for host in os.environ.get('REDIS_HOSTS', 'redis:6379').split(',') if host.strip()
+]
+
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': 'tandem.channel_layers.ShardedRedisChannelLayer',
         'CONFIG': {
-            "hosts": [('redis', 6379)],
+            "hosts": REDIS_HOSTS,
         },
     },
 }
 
+# Store of the users' presence on the chat WebSocket. Must be shared by all workers. Connections that don't send a
+# heartbeat within TIMEOUT seconds are considered gone.
+PRESENCE = {
+    'BACKEND': 'chats.presence.RedisPresenceStore',
+    'LOCATION': os.environ.get('PRESENCE_URL', 'redis://redis:6379/2'),
+    'TIMEOUT': int(os.environ.get('PRESENCE_TIMEOUT', 60)),
+}
+
+# Rate limits of the REST endpoints and WebSocket message types, as '<requests>/<period>' strings, where the period is
+# one of 's', 'm', 'h' or 'd'. The buckets are kept in Redis, and in each worker's memory if it can't be reached.
+RATE_LIMITER = {
+    'BACKEND': 'tandem.ratelimit.RedisRateLimiter',
+    'LOCATION': os.environ.get('RATE_LIMIT_URL', 'redis://redis:6379/3'),
+}
+
+RATE_LIMITS = {
+    'login': os.environ.get('RATE_LIMIT_LOGIN', '10/m'),
+    'set_password': os.environ.get('RATE_LIMIT_SET_PASSWORD', '5/m'),
+    'user_create': os.environ.get('RATE_LIMIT_USER_CREATE', '5/h'),
+    'discover': os.environ.get('RATE_LIMIT_DISCOVER', '30/m'),
+    'export': os.environ.get('RATE_LIMIT_EXPORT', '20/h'),
+    'ws.chat_message': os.environ.get('RATE_LIMIT_CHAT_MESSAGE', '10/s'),
+    'ws.join_chat': os.environ.get('RATE_LIMIT_JOIN_CHAT', '10/s'),
+}
+
 # CORS settings
 
 CORS_ALLOWED_ORIGINS = [
@@ -183,10 +319,14 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'tandem.ratelimit.TokenBucketThrottle',
+    ],
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'EXCEPTION_HANDLER': 'tandem.exceptions.exception_handler',
 }
 
 SPECTACULAR_SETTINGS = {
@@ -1,9 +1,17 @@
-from PIL import Image
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 
-from communities.models import Channel
-from users.models import CustomUser
+from chats.friends import invalidate_friend_ids
+from chats.models import ChannelChatMessage, FriendChat
+from communities.counters import add_members, update_role_ids, ROLE_FIELDS
+from communities.models import Channel, Membership
+from communities.recommendations import get_built_recommender, MEMBERS, ACTIVITY
+from tandem.backends import get_user_cache_key
+from users.matching import get_built_matching_index
+from users.models import CustomUser, UserLanguage
 
 
 @receiver(post_save, sender=Channel)
@@ -14,6 +22,148 @@ def optimize_image(sender, instance, **kwargs):
     Sources: https://stackoverflow.com/a/13211834, https://stackoverflow.com/a/70686579
     """
     if instance.image:
+        # Pillow is only imported when an image is saved, so that it isn't loaded when the workers start
+        from PIL import Image
+
         with Image.open(instance.image.path) as image:
             image.thumbnail((400, 400), Image.LANCZOS)
             image.save(instance.image.path, optimize=True, quality=85)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Removes the user from the authentication backend's cache once the change is committed, so that their next request
+    fetches the updated user.
+    """
+    key = get_user_cache_key(instance.id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def get_friend_chat_user_ids(chat_ids):
+    ChatUser = FriendChat.users.through
+    return set(ChatUser.objects.filter(friendchat_id__in=chat_ids).values_list('customuser_id', flat=True))
+
+
+@receiver(m2m_changed, sender=FriendChat.users.through)
+def invalidate_friends_on_chat_users_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Removes the friend sets of the users of the changed chats from the cache. Clears are handled before they're made,
+    while the chats' users can still be fetched.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # The chats of a user were changed
+        chat_ids = pk_set if pk_set is not None else instance.friend_chats.values_list('id', flat=True)
+        user_ids = get_friend_chat_user_ids(chat_ids) | {instance.id}
+    else:
+        user_ids = get_friend_chat_user_ids([instance.id]) | (pk_set or set())
+    invalidate_friend_ids(user_ids)
+
+
+@receiver(m2m_changed, sender=FriendChat.users.through)
+def update_friend_chat_user_pair(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Sets the user pair key of the changed chats from their current users. Raises an IntegrityError if another chat
+    already has the same pair of users.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear') or (reverse and pk_set is None):
+        return
+    chat_ids = pk_set if reverse else {instance.id}
+    users = {chat_id: [] for chat_id in chat_ids}
+    for chat_id, user_id in FriendChat.users.through.objects.filter(friendchat_id__in=chat_ids) \
+            .values_list('friendchat_id', 'customuser_id'):
+        users[chat_id].append(user_id)
+    for chat_id, user_ids in users.items():
+        user_pair = FriendChat.get_user_pair(*user_ids) if len(user_ids) == 2 else None
+        FriendChat.objects.filter(id=chat_id).exclude(user_pair=user_pair).update(user_pair=user_pair)
+
+
+@receiver(pre_delete, sender=FriendChat)
+def invalidate_friends_on_chat_delete(sender, instance, **kwargs):
+    """ Removes the friend sets of the users of a deleted chat from the cache. """
+    invalidate_friend_ids(get_friend_chat_user_ids([instance.id]))
+
+
+@receiver(post_save, sender=Membership)
+def update_channel_counters_on_membership_save(sender, instance, created, **kwargs):
+    """ Updates the member count and the admin and moderator IDs of the membership's channel. The role of an updated
+    membership may have changed, so the channel's role IDs are always updated in that case. """
+    if created:
+        add_members(instance.channel_id, 1)
+    if not created or instance.role in ROLE_FIELDS:
+        update_role_ids(instance.channel_id)
+
+
+@receiver(post_delete, sender=Membership)
+def update_channel_counters_on_membership_delete(sender, instance, **kwargs):
+    """ Updates the member count and the admin and moderator IDs of the membership's channel. """
+    add_members(instance.channel_id, -1)
+    if instance.role in ROLE_FIELDS:
+        update_role_ids(instance.channel_id)
+
+
+@receiver(post_save, sender=UserLanguage)
+@receiver(post_delete, sender=UserLanguage)
+def update_matching_index(sender, instance, **kwargs):
+    """
+    Marks the user's languages as changed, so that all workers reload them into their matching index, and reloads them
+    into the current worker's index once the change is committed.
+    """
+    user_id = instance.user_id
+    CustomUser.objects.filter(id=user_id).update(languages_updated_at=timezone.now())
+
+    def reload_user():
+        index = get_built_matching_index()
+        if index is not None:
+            index.reload_users([user_id])
+
+    transaction.on_commit(reload_user)
+
+
+def update_recommender(update):
+    """ Applies an update to the current worker's channel recommender once the change is committed, if it's built. """
+
+    def apply_update():
+        recommender = get_built_recommender()
+        if recommender is not None:
+            update(recommender)
+
+    transaction.on_commit(apply_update)
+
+
+@receiver(post_save, sender=Channel)
+def add_recommended_channel(sender, instance, **kwargs):
+    """ Adds a new or updated channel to the channel recommender, or removes it if it was marked as deleted. """
+    if instance.deleted_at is not None:
+        update_recommender(lambda recommender: recommender.remove_channel(instance.id))
+    else:
+        update_recommender(lambda recommender: recommender.set_channel(instance.id, instance.language, instance.level))
+
+
+@receiver(post_delete, sender=Channel)
+def remove_recommended_channel(sender, instance, **kwargs):
+    """ Removes a deleted channel from the channel recommender. """
+    update_recommender(lambda recommender: recommender.remove_channel(instance.id))
+
+
+@receiver(post_save, sender=Membership)
+def add_recommended_channel_member(sender, instance, created, **kwargs):
+    """ Adds a new member to the member count of the channel in the channel recommender. """
+    if created:
+        update_recommender(lambda recommender: recommender.add_count(instance.channel_id, MEMBERS, 1))
+
+
+@receiver(post_delete, sender=Membership)
+def remove_recommended_channel_member(sender, instance, **kwargs):
+    """ Removes a deleted member from the member count of the channel in the channel recommender. """
+    update_recommender(lambda recommender: recommender.add_count(instance.channel_id, MEMBERS, -1))
+
+
+@receiver(post_save, sender=ChannelChatMessage)
+def update_recommended_channel_activity(sender, instance, created, **kwargs):
+    """ Adds a new message to the recent activity of the channel in the channel recommender. """
+    if created:
+        update_recommender(lambda recommender: recommender.add_count(instance.channel_id, ACTIVITY, 1))
@@ -0,0 +1,374 @@
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from chats.models import ChannelChatMessage
+from communities.models import Channel, ChannelRole, Membership
+from tandem import hashers
+from tandem.authorization import get_authorization_context
+from tandem.backends import CachedModelBackend
+from tandem.channel_layers import ShardedRedisChannelLayer
+from tandem.postgresql_pool.pool import ConnectionPool, PoolTimeout
+from tandem.ratelimit import InMemoryRateLimiter
+from tandem.routers import PrimaryReplicaRouter, get_pin_key, routing_context
+
+
+class ShardedChannelLayerTests(SimpleTestCase):
+    """Contains tests for the sharded channel layer's group hashing."""
+
+    group_names = [str(uuid.uuid4()) for _ in range(4000)]
+
+    @staticmethod
+    def get_layer(shard_count):
+        return ShardedRedisChannelLayer(hosts=[f'redis://localhost:{6379 + i}' for i in range(shard_count)])
+
+    def test_groups_are_balanced_across_shards(self):
+        """
+        Tests that groups are spread evenly across four shards.
+        """
+        layer = self.get_layer(4)
+        counts = Counter(layer.consistent_hash(name) for name in self.group_names)
+
+        self.assertEqual(sorted(counts.keys()), [0, 1, 2, 3])
+        for count in counts.values():
+            self.assertAlmostEqual(count, len(self.group_names) / 4, delta=len(self.group_names) * 0.05)
+
+    def test_adding_a_shard_only_moves_groups_to_the_new_shard(self):
+        """
+        Tests that, when a shard is added, groups either keep their shard or move to the new one, and that roughly
+        1/N of them are moved.
+        """
+        old_layer = self.get_layer(3)
+        new_layer = self.get_layer(4)
+        moved = 0
+        for name in self.group_names:
+            old_index, new_index = old_layer.consistent_hash(name), new_layer.consistent_hash(name)
+            if old_index != new_index:
+                self.assertEqual(new_index, 3)
+                moved += 1
+
+        self.assertAlmostEqual(moved, len(self.group_names) / 4, delta=len(self.group_names) * 0.05)
+
+
+class FakeConnection:
+    """Stand-in for a DB-API connection, used to test the connection pool without a database."""
+
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Contains tests for the database connection pool."""
+
+    @staticmethod
+    def ping(connection):
+        if not connection.healthy:
+            raise ConnectionError()
+
+    def get_pool(self, **kwargs):
+        return ConnectionPool(connect=FakeConnection, ping=self.ping, reset=lambda connection: None, **kwargs)
+
+    def test_returned_connections_are_reused(self):
+        """
+        Tests that a connection returned to the pool is handed out again instead of opening a new one.
+        """
+        pool = self.get_pool()
+        connection = pool.get()
+        pool.put(connection)
+
+        self.assertIs(pool.get(), connection)
+        self.assertEqual(pool.stats()['connections_created'], 1)
+
+    def test_checkout_times_out_when_pool_is_saturated(self):
+        """
+        Tests that checkouts wait for a free connection and fail after the timeout when all connections are in use.
+        """
+        pool = self.get_pool(max_size=2, timeout=0.05)
+        pool.get()
+        pool.get()
+
+        with self.assertRaises(PoolTimeout):
+            pool.get()
+        stats = pool.stats()
+        self.assertEqual(stats['saturation'], 1)
+        self.assertEqual(stats['timeouts'], 1)
+
+    def test_unhealthy_idle_connections_are_replaced(self):
+        """
+        Tests that idle connections which fail the health check are closed and replaced with new ones.
+        """
+        pool = self.get_pool(health_check_interval=0)
+        connection = pool.get()
+        pool.put(connection)
+        connection.healthy = False
+
+        new_connection = pool.get()
+        self.assertIsNot(new_connection, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['health_check_failures'], 1)
+        self.assertEqual(pool.stats()['size'], 1)
+
+
+@override_settings(REPLICA_DATABASES=['replica_0', 'replica_1'],
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    """Contains tests for the routing of queries between the primary database and the replicas."""
+
+    router = PrimaryReplicaRouter()
+    user_id = uuid.uuid4()
+
+    def setUp(self):
+        super(PrimaryReplicaRouterTests, self).setUp()
+        cache.clear()
+
+    def test_reads_are_sent_to_replicas(self):
+        """
+        Tests that reads made as part of a safe request are sent to the replicas, except for those of primary-only
+        models such as sessions.
+        """
+        with routing_context(user_id=self.user_id):
+            self.assertIn(self.router.db_for_read(ChannelChatMessage), ['replica_0', 'replica_1'])
+            self.assertEqual(self.router.db_for_read(Session), 'default')
+
+    def test_reads_of_unsafe_requests_are_sent_to_primary(self):
+        """
+        Tests that all reads made as part of an unsafe request (e.g. POST) are sent to the primary database.
+        """
+        with routing_context(user_id=self.user_id, use_primary=True):
+            self.assertEqual(self.router.db_for_read(ChannelChatMessage), 'default')
+
+    def test_user_reads_own_writes_from_primary(self):
+        """
+        Tests that, after a user writes data, their reads are sent to the primary database, both for the rest of the
+        request and in their following requests, while other users keep reading from the replicas.
+        """
+        with routing_context(user_id=self.user_id):
+            self.assertEqual(self.router.db_for_write(Membership), 'default')
+            self.assertEqual(self.router.db_for_read(Membership), 'default')
+
+        with routing_context(user_id=self.user_id):
+            self.assertEqual(self.router.db_for_read(ChannelChatMessage), 'default')
+
+        with routing_context(user_id=uuid.uuid4()):
+            self.assertIn(self.router.db_for_read(ChannelChatMessage), ['replica_0', 'replica_1'])
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_writes_without_replicas_dont_pin_users(self):
+        """
+        Tests that users aren't pinned to the primary database when they write data if there are no replicas.
+        """
+        with routing_context(user_id=self.user_id):
+            self.assertEqual(self.router.db_for_write(Membership), 'default')
+        self.assertIsNone(cache.get(get_pin_key(self.user_id)))
+
+
+class AuthorizationContextTests(TestCase):
+    """Contains tests for the request-scoped authorization context."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='authorization_user',
+                                                        email='authorization@example.com', password='password')
+        cls.channels = [Channel.objects.create(name=f'authorization channel {i}', language='DE', level='BE')
+                        for i in range(3)]
+        Membership.objects.create(user=cls.user, channel=cls.channels[0], role=ChannelRole.ADMIN)
+        Membership.objects.create(user=cls.user, channel=cls.channels[1], role=ChannelRole.USER)
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_permission_checks_share_one_query(self):
+        """
+        Tests that the memberships are loaded once per request, and then used to answer every check.
+        """
+        with self.assertNumQueries(1):
+            self.assertTrue(self.channels[0].has_object_update_permission(self.request))
+            self.assertTrue(self.channels[0].has_object_destroy_permission(self.request))
+            self.assertFalse(self.channels[1].has_object_update_permission(self.request))
+            self.assertFalse(self.channels[2].has_object_update_permission(self.request))
+            self.assertTrue(get_authorization_context(self.request).is_channel_member(str(self.channels[1].id)))
+
+    def test_context_is_reset_when_the_user_changes(self):
+        """
+        Tests that a context isn't reused for a different user.
+        """
+        context = get_authorization_context(self.request)
+        self.request.user = get_user_model().objects.create_user(username='other_authorization_user',
+                                                                 email='other_authorization@example.com')
+
+        self.assertIsNot(get_authorization_context(self.request), context)
+        self.assertFalse(get_authorization_context(self.request).is_channel_member(self.channels[0].id))
+
+
+@override_settings(RATE_LIMITS={'test': '2/m', 'login': '2/m'})
+class RateLimiterTests(APITestCase):
+    """Contains tests for the token bucket rate limiter."""
+
+    client = APIClient()
+
+    def setUp(self):
+        self.limiter = InMemoryRateLimiter()
+
+    def test_bucket_allows_bursts_and_refills(self):
+        """
+        Tests that each client can make a burst of requests up to the limit, and then has to wait for the bucket to
+        refill.
+        """
+        with mock.patch('tandem.ratelimit.time.monotonic', return_value=1000):
+            self.assertTrue(self.limiter.check('test', 'client')[0])
+            self.assertTrue(self.limiter.check('test', 'client')[0])
+            allowed, retry_after = self.limiter.check('test', 'client')
+            self.assertFalse(allowed)
+            self.assertAlmostEqual(retry_after, 30)
+            # Other clients and scopes without a limit are unaffected
+            self.assertTrue(self.limiter.check('test', 'other client')[0])
+            self.assertTrue(self.limiter.check('unlimited', 'client')[0])
+        with mock.patch('tandem.ratelimit.time.monotonic', return_value=1030):
+            self.assertTrue(self.limiter.check('test', 'client')[0])
+
+        self.assertEqual(self.limiter.get_stats()['scopes']['test'], {'allowed': 4, 'rejected': 1})
+
+    def test_login_is_throttled(self):
+        """
+        Tests that login attempts over the limit get a 429 response with a Retry-After header.
+        """
+        with mock.patch('tandem.ratelimit.get_rate_limiter', return_value=self.limiter):
+            for _ in range(2):
+                response = self.client.post('/api/login/', data={'username': 'nobody', 'password': 'wrong'},
+                                            format='json')
+                self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            response = self.client.post('/api/login/', data={'username': 'nobody', 'password': 'wrong'},
+                                        format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+
+class PasswordHasherTests(TestCase):
+    """Contains tests for the bounded password hashers."""
+
+    def setUp(self):
+        # Slots are created on first use, with the concurrency in the settings at the time
+        hashers._hashing_slots = None
+
+    def tearDown(self):
+        hashers._hashing_slots = None
+
+    def test_pbkdf2_password_is_rehashed_on_login(self):
+        """
+        Tests that passwords hashed with PBKDF2 are still accepted, and are rehashed with Argon2 when their user logs
+        in.
+        """
+        user = get_user_model().objects.create(username='pbkdf2_user', email='pbkdf2_user@example.com',
+                                               password=make_password('password', hasher='pbkdf2_sha256'))
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+        self.assertTrue(self.client.login(username='pbkdf2_user', password='password'))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('argon2$'))
+        self.assertTrue(user.check_password('password'))
+
+    @override_settings(PASSWORD_HASHING={**settings.PASSWORD_HASHING, 'CONCURRENCY': 1, 'TIMEOUT': 0.01})
+    def test_hashing_fails_when_slots_are_taken(self):
+        """
+        Tests that hashing raises HashingUnavailable when no slot is freed in time, and that nested hasher calls from
+        the same thread don't wait for a second slot.
+        """
+        with hashers.hashing_slot():
+            # This thread holds the only slot, so the hasher runs in it
+            self.assertTrue(make_password('password').startswith('argon2$'))
+
+            # Other threads have to wait for it, and give up after the timeout
+            errors = []
+
+            def hash_password():
+                try:
+                    make_password('password')
+                except hashers.HashingUnavailable as e:
+                    errors.append(e)
+
+            thread = threading.Thread(target=hash_password)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(len(errors), 1)
+        # Once the slot is released, hashing works again
+        self.assertTrue(make_password('password').startswith('argon2$'))
+
+    @override_settings(PASSWORD_HASHING={**settings.PASSWORD_HASHING, 'CONCURRENCY': 1, 'TIMEOUT': 0.01})
+    def test_api_responds_with_503_when_slots_are_taken(self):
+        """
+        Tests that API requests that can't get a hashing slot in time get a 503 response.
+        """
+        get_user_model().objects.create_user(username='busy_user', email='busy_user@example.com', password='password')
+        slots = hashers.get_hashing_slots()
+        slots.acquire()
+        try:
+            response = self.client.post('/api/login/', data={'username': 'busy_user', 'password': 'password'},
+                                        content_type='application/json')
+        finally:
+            slots.release()
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.json()['detail'], 'The server is busy, please try again later.')
+
+
+class CachedModelBackendTests(TestCase):
+    """Contains tests for the cached authentication backend."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='cached_user', email='cached_user@example.com')
+
+    def setUp(self):
+        cache.clear()
+        self.backend = CachedModelBackend()
+
+    def test_user_is_fetched_once(self):
+        """
+        Tests that the user is fetched from the database on the first lookup, and from the cache afterwards.
+        """
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.user.id), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.id), self.user)
+
+    def test_saving_user_invalidates_cache(self):
+        """
+        Tests that the cached user is dropped once changes to the user are committed, so that deactivated users can't
+        keep authenticating with the cached copy.
+        """
+        self.backend.get_user(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.backend.get_user(self.user.id))
+
+    def test_session_requests_use_cached_user(self):
+        """
+        Tests that authenticated requests don't query the database for the session's user once it's cached.
+        """
+        self.client.force_login(self.user)
+        self.client.get('/api/session_info/')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/session_info/')
+        self.assertEqual(response.data['id'], str(self.user.id))
@@ -2,11 +2,11 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
-from drf_spectacular.views import SpectacularSwaggerView, SpectacularAPIView
 from rest_framework import routers
 
 from chats.views import FriendChatViewSet, FriendChatMessageViewSet, \
     ChannelChatMessageViewSet
+from common.views import get_db_pool_stats, get_rate_limit_stats
 from communities.views import ChannelViewSet, MembershipViewSet
 from users import views
 from users.views import LoginView, get_session_info, LogoutView, SetPassword
@@ -46,7 +46,16 @@ urlpatterns = [
                   path('api/session_info/', get_session_info),
                   path('api/set_password/', SetPassword.as_view()),
 
-                  # OpenAPI Documentation
-                  path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-                  path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+                  # Monitoring views
+                  path('api/db_pool_stats/', get_db_pool_stats),
+                  path('api/rate_limit_stats/', get_rate_limit_stats),
               ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+# OpenAPI Documentation. Left out of the production profile, which doesn't install drf_spectacular's app.
+if 'drf_spectacular' in settings.INSTALLED_APPS:
+    from drf_spectacular.views import SpectacularSwaggerView, SpectacularAPIView
+
+    urlpatterns += [
+        path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+        path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+    ]
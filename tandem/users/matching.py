@@ -0,0 +1,249 @@
+"""
+Language exchange partner matching. Finds reciprocal partners for a user: users who are native speakers of a language
+the user is learning, and who are learning one of the user's native languages.
+
+Matches are served from an index kept in the memory of each worker process. Each user with languages gets a slot (a bit
+position), and the index keeps a bitset (a Python int) of the slots of the users with each language and level. Finding
+the partners of a user takes a few bitwise operations over these bitsets, regardless of the number of users, and uses
+about 125 KB per bitset with 1M users.
+
+Language changes update the index of the worker that makes them, and mark the user with a timestamp
+(CustomUser.languages_updated_at), from which the rest of the workers reload the user's languages every few seconds.
+"""
+import datetime
+import itertools
+import threading
+import time
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from common.models import ProficiencyLevel
+from users.models import UserLanguage
+
+# Seconds between the reloads of the users whose languages have changed
+REFRESH_INTERVAL = 5
+
+# Extra seconds of changes reloaded each time, so that changes committed after a reload but timestamped before it
+# aren't missed
+REFRESH_OVERLAP = 60
+
+LEARNING_LEVELS = [level for level in ProficiencyLevel.values if level != ProficiencyLevel.NATIVE]
+
+
+def get_slots(bitset):
+    """ Yields the positions of the set bits of the bitset, from the highest to the lowest one. """
+    while bitset:
+        slot = bitset.bit_length() - 1
+        yield slot
+        bitset ^= 1 << slot
+
+
+class Matches:
+    """
+    Ranked list of the partners of a user, which can be paginated like a queryset. Partners are ranked by the number of
+    languages that they can exchange with the user, and then by how recently they joined.
+    Only the slice that is accessed is computed.
+    """
+
+    def __init__(self, index, tiers):
+        self.index = index
+        # Score and bitset of the partners with each score, from the highest score to the lowest
+        self.tiers = tiers
+
+    def __len__(self):
+        return sum(bitset.bit_count() for _, bitset in self.tiers)
+
+    def count(self):
+        return len(self)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None:
+            raise TypeError('Matches only support slicing.')
+        start, stop = item.start or 0, item.stop
+        results = []
+        for score, bitset in self.tiers:
+            size = bitset.bit_count()
+            if start >= size:
+                start -= size
+                if stop is not None:
+                    stop -= size
+                continue
+            slots = itertools.islice(get_slots(bitset), start, None if stop is None else max(stop, 0))
+            results += [(self.index.user_ids[slot], score) for slot in slots]
+            start = 0
+            if stop is not None:
+                stop -= size
+                if stop <= 0:
+                    break
+        return results
+
+
+class MatchingIndex:
+    """ Bitset index of the users' languages. Builds itself from the database on first use. Thread safe. """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built = False
+        # User ID of each slot, and slot of each user ID
+        self.user_ids = []
+        self.slots = {}
+        # Bitset of the users with each (language, level) pair
+        self.bitsets = defaultdict(int)
+        self.refreshed_at = None
+        self.refreshed = 0
+
+    def load(self, rows):
+        """ Replaces the contents of the index with the given (user ID, language, level) rows. Bits are set in byte
+        arrays and then converted to ints, as setting them one at a time on large ints would copy them each time. """
+        user_ids, slots = [], {}
+        pair_data = defaultdict(bytearray)
+        for user_id, language, level in rows:
+            slot = slots.get(user_id)
+            if slot is None:
+                slot = slots[user_id] = len(user_ids)
+                user_ids.append(user_id)
+            data = pair_data[(language, level)]
+            if len(data) <= slot >> 3:
+                data.extend(bytes(max(len(data), (slot >> 3) + 1 - len(data))))
+            data[slot >> 3] |= 1 << (slot & 7)
+
+        bitsets = defaultdict(int)
+        for pair, data in pair_data.items():
+            bitsets[pair] = int.from_bytes(data, 'little')
+
+        with self.lock:
+            self.user_ids, self.slots, self.bitsets = user_ids, slots, bitsets
+            self.built = True
+
+    def build(self):
+        """ Loads the languages of all users from the database. """
+        started_at = timezone.now()
+        # Users get their slots in the order they joined, as new users get the next free slot
+        rows = UserLanguage.objects.order_by('user__date_joined', 'user_id') \
+            .values_list('user_id', 'language', 'level').iterator(chunk_size=10000)
+        self.load(rows)
+        self.refreshed_at = started_at
+        self.refreshed = time.monotonic()
+
+    def ensure_ready(self):
+        """ Builds the index if it hasn't been built yet, or reloads the users whose languages have changed since the
+        last refresh if it's due. """
+        with self.lock:
+            if not self.built:
+                self.build()
+            elif self.refreshed_at is not None and time.monotonic() - self.refreshed > REFRESH_INTERVAL:
+                self.refresh()
+
+    def refresh(self):
+        started_at = timezone.now()
+        since = self.refreshed_at - datetime.timedelta(seconds=REFRESH_OVERLAP)
+        user_ids = list(get_user_model().objects.filter(languages_updated_at__gte=since).values_list('id', flat=True))
+        self.reload_users(user_ids)
+        self.refreshed_at = started_at
+        self.refreshed = time.monotonic()
+
+    def reload_users(self, user_ids):
+        """ Loads the current languages of the given users from the database. """
+        languages = defaultdict(list)
+        for user_id, language, level in UserLanguage.objects.filter(user_id__in=user_ids) \
+                .values_list('user_id', 'language', 'level'):
+            languages[user_id].append((language, level))
+        with self.lock:
+            for user_id in user_ids:
+                self.set_languages(user_id, languages[user_id])
+
+    def set_languages(self, user_id, languages):
+        """ Replaces the (language, level) pairs of the user in the index. """
+        with self.lock:
+            slot = self.slots.get(user_id)
+            if slot is None:
+                if not languages:
+                    return
+                slot = self.slots[user_id] = len(self.user_ids)
+                self.user_ids.append(user_id)
+            bit = 1 << slot
+            for pair, bitset in self.bitsets.items():
+                if bitset & bit and pair not in languages:
+                    self.bitsets[pair] = bitset ^ bit
+            for pair in languages:
+                self.bitsets[pair] |= bit
+
+    def remove_user(self, user_id):
+        self.set_languages(user_id, [])
+
+    def get_languages(self, user_id):
+        slot = self.slots.get(user_id)
+        if slot is None:
+            return []
+        return [pair for pair, bitset in self.bitsets.items() if bitset >> slot & 1]
+
+    def find_matches(self, user_id, exclude_ids=(), levels=None):
+        """ Returns the ranked reciprocal partners of the user, excluding the given users. If levels are given, only
+        users learning the user's native languages at those levels are included. """
+        self.ensure_ready()
+        with self.lock:
+            languages = self.get_languages(user_id)
+            native = [language for language, level in languages if level == ProficiencyLevel.NATIVE]
+            learning = [language for language, level in languages if level != ProficiencyLevel.NATIVE]
+            levels = levels or LEARNING_LEVELS
+
+            # Users who speak each of the languages that the user is learning, and who learn each of their native ones
+            speakers = [self.bitsets.get((language, ProficiencyLevel.NATIVE), 0) for language in learning]
+            learners = [self.or_all(self.bitsets.get((language, level), 0) for level in levels) for language in native]
+
+            candidates = self.or_all(speakers) & self.or_all(learners)
+            for excluded_id in itertools.chain([user_id], exclude_ids):
+                slot = self.slots.get(excluded_id)
+                if slot is not None and candidates >> slot & 1:
+                    candidates ^= 1 << slot
+            if not candidates:
+                return Matches(self, [])
+
+            # Add up the matching languages of each candidate, with each bit of the sum in a separate bitset
+            planes = []
+            for bitset in speakers + learners:
+                carry = bitset & candidates
+                for i, plane in enumerate(planes):
+                    if not carry:
+                        break
+                    planes[i], carry = plane ^ carry, plane & carry
+                if carry:
+                    planes.append(carry)
+
+            tiers = []
+            for score in range(len(speakers) + len(learners), 1, -1):
+                bitset = candidates
+                for i, plane in enumerate(planes):
+                    bitset &= plane if score >> i & 1 else ~plane
+                if score >> len(planes):
+                    bitset = 0
+                if bitset:
+                    tiers.append((score, bitset))
+            return Matches(self, tiers)
+
+    @staticmethod
+    def or_all(bitsets):
+        result = 0
+        for bitset in bitsets:
+            result |= bitset
+        return result
+
+
+_matching_index = None
+_matching_index_lock = threading.Lock()
+
+
+def get_matching_index():
+    """ Returns the matching index of the process. """
+    global _matching_index
+    with _matching_index_lock:
+        if _matching_index is None:
+            _matching_index = MatchingIndex()
+        return _matching_index
+
+
+def get_built_matching_index():
+    """ Returns the matching index of the process if it has been built, or None otherwise. """
+    return _matching_index if _matching_index is not None and _matching_index.built else None
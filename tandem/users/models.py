@@ -4,6 +4,7 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from dry_rest_permissions.generics import authenticated_users, allow_staff_or_superuser
+from rest_framework.reverse import reverse
 
 from common.models import AvailableLanguage, ProficiencyLevel
 
@@ -42,6 +43,18 @@ class CustomUser(AbstractUser):
         """ Allow users to update only their own profile (except for staff, who edit any user). """
         return self == request.user
 
+    @authenticated_users
+    @allow_staff_or_superuser
+    def has_object_friend_chats_permission(self, request):
+        """ Allow users to view only their own friend chats (except for staff, who view any user's). """
+        return self == request.user
+
+    @authenticated_users
+    @allow_staff_or_superuser
+    def has_object_export_permission(self, request):
+        """ Allow users to export only their own messages (except for staff, who export any user's). """
+        return self == request.user
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     email = models.EmailField(_('email address'), blank=False, unique=True)
     description = models.TextField(
@@ -49,6 +62,8 @@ class CustomUser(AbstractUser):
         max_length=2000,
     )
     image = models.ImageField(upload_to=upload_to, blank=True)
+    # Time of the last change to the user's languages, from which the workers update their matching index
+    languages_updated_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
 
 
 class UserLanguage(models.Model):
@@ -68,9 +83,7 @@ class UserLanguage(models.Model):
     @authenticated_users
     def has_create_permission(request):
         """ Allow users to add languages only for themselves (except for staff, who add languages to any user). """
-        from users.serializers import UserSerializer
-        serializer = UserSerializer(request.user, context={'request': request})
-        return request.data.get('user') == serializer.data.get('url')
+        return request.data.get('user') == reverse('customuser-detail', kwargs={'pk': request.user.id}, request=request)
 
     @staticmethod
     @authenticated_users
@@ -1,10 +1,11 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
-from rest_framework.utils.field_mapping import get_nested_relation_kwargs
+from rest_framework.reverse import reverse
 from rest_framework.validators import UniqueValidator, UniqueTogetherValidator
 
-from communities.models import Channel
+from chats.models import FriendChat
+from communities.models import Channel, Membership
 from users.models import UserLanguage
 
 
@@ -28,8 +29,9 @@ class UserLanguageSerializer(serializers.HyperlinkedModelSerializer):
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
     """
-    User serializer class. Does not include messages and other models, nor the user's password. Related fields are
-    set to be read only to avoid unwanted updates, as they should be done through custom controllers (views).
+    User serializer class. Does not include messages and other models, nor the user's password. The user's friend chats
+    and memberships are counted and linked to, and can be fetched a page at a time from their own endpoints. Related
+    fields are set to be read only to avoid unwanted updates, as they should be done through custom controllers (views).
     """
 
     def to_representation(self, instance):
@@ -37,6 +39,9 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         ret = super(UserSerializer, self).to_representation(instance)
         del ret['email']
         del ret['password']
+        request = self.context['request']
+        ret['friendChatsUrl'] = reverse('customuser-friend-chats', kwargs={'pk': instance.id}, request=request)
+        ret['membershipsUrl'] = reverse('customuser-memberships', kwargs={'pk': instance.id}, request=request)
         return ret
 
     def create(self, validated_data):
@@ -49,54 +54,17 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         user.save()
         return user
 
-    def build_nested_field(self, field_name, relation_info, nested_depth):
-        """
-        Create nested fields for forward and reverse relationships.
-        Source: https://stackoverflow.com/a/50633184
-        """
-
-        class UserFriendChatSerializer(serializers.HyperlinkedModelSerializer):
-            def build_nested_field(self, field_name_2, relation_info_2, nested_depth_2):
-                class UserFriendChatUserSerializer(serializers.HyperlinkedModelSerializer):
-                    class Meta:
-                        model = relation_info_2.related_model
-                        depth = nested_depth_2 - 1
-                        fields = ['id', 'url', 'username', 'description', 'image']
-
-                if field_name_2 == 'users':
-                    field_class_2 = UserFriendChatUserSerializer
-
-                field_kwargs_2 = get_nested_relation_kwargs(relation_info_2)
-
-                return field_class_2, field_kwargs_2
-
-            class Meta:
-                model = relation_info.related_model
-                depth = nested_depth - 1
-                fields = ['id', 'url', 'users']
-
-        class UserChannelSerializer(serializers.HyperlinkedModelSerializer):
-            class Meta:
-                model = Channel
-                depth = nested_depth - 2
-                fields = ['id', 'url', 'name', 'description', 'language', 'level', 'image']
+    friend_chat_count = serializers.SerializerMethodField()
+    membership_count = serializers.SerializerMethodField()
 
-        class UserMembershipSerializer(serializers.HyperlinkedModelSerializer):
-            channel = UserChannelSerializer(read_only=True)
+    def get_friend_chat_count(self, instance) -> int:
+        # Use the count annotated by UserViewSet, if it's there
+        count = getattr(instance, 'friend_chat_count', None)
+        return instance.friend_chats.count() if count is None else count
 
-            class Meta:
-                model = relation_info.related_model
-                depth = nested_depth - 1
-                fields = ['id', 'url', 'channel', 'role']
-
-        if field_name == 'friend_chats':
-            field_class = UserFriendChatSerializer
-        if field_name == 'memberships':
-            field_class = UserMembershipSerializer
-
-        field_kwargs = get_nested_relation_kwargs(relation_info)
-
-        return field_class, field_kwargs
+    def get_membership_count(self, instance) -> int:
+        count = getattr(instance, 'membership_count', None)
+        return instance.memberships.count() if count is None else count
 
     languages = UserLanguageSerializer(many=True, read_only=True)
     image = serializers.ImageField(required=False)
@@ -112,14 +80,47 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
             'url',
             'username',
             'description',
-            'friend_chats',
+            'friend_chat_count',
             'languages',
-            'memberships',
+            'membership_count',
             'image',
             'email',
             'password',
         ]
-        depth = 2
+
+
+class UserFriendChatUserSerializer(serializers.HyperlinkedModelSerializer):
+    class Meta:
+        model = get_user_model()
+        fields = ['id', 'url', 'username', 'description', 'image']
+
+
+class UserFriendChatSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Serializer of a user's friend chats, with their users' details. Used by the user friend chats endpoint.
+    """
+    users = UserFriendChatUserSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = FriendChat
+        fields = ['id', 'url', 'users']
+
+
+class UserChannelSerializer(serializers.HyperlinkedModelSerializer):
+    class Meta:
+        model = Channel
+        fields = ['id', 'url', 'name', 'description', 'language', 'level', 'image']
+
+
+class UserMembershipSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Serializer of a user's memberships, with their channels' details. Used by the user memberships endpoint.
+    """
+    channel = UserChannelSerializer(read_only=True)
+
+    class Meta:
+        model = Membership
+        fields = ['id', 'url', 'channel', 'role']
 
 
 class UserPasswordUpdateSerializer(UserSerializer):
@@ -4,7 +4,10 @@ from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient, APITestCase
 
+from chats.models import FriendChat
 from common.models import ProficiencyLevel
+from communities.models import Channel, ChannelRole, Membership
+from users import matching
 from users.models import UserLanguage
 
 
@@ -142,3 +145,152 @@ class UserCrudTests(APITestCase):
         self.assertEqual(user_object.username, data['username'])
         self.assertEqual(user_object.email, data['email'])
         self.assertEqual(user_object.description, data['description'])
+
+
+class MatchingTests(APITestCase):
+    """Contains tests for the language exchange partner matching."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        def create_user(username, languages):
+            user = get_user_model().objects.create_user(username=username, email=f'{username}@example.com')
+            for language, level in languages:
+                UserLanguage.objects.create(user=user, language=language, level=level)
+            return user
+
+        cls.user = create_user('matching_user', [('ES', 'NA'), ('EN', 'BE'), ('FR', 'IN')])
+        # Speaks both languages the user is learning, and is learning the user's native language
+        cls.best_partner = create_user('best_partner', [('EN', 'NA'), ('FR', 'NA'), ('ES', 'BE')])
+        cls.partner = create_user('partner', [('EN', 'NA'), ('ES', 'IN')])
+        # Speaks a language the user is learning, but isn't learning the user's native language
+        cls.non_partner = create_user('non_partner', [('EN', 'NA'), ('DE', 'BE')])
+        cls.friend = create_user('matching_friend', [('EN', 'NA'), ('ES', 'AD')])
+        chat = FriendChat.objects.create()
+        chat.users.add(cls.user, cls.friend)
+
+    def setUp(self):
+        super(MatchingTests, self).setUp()
+        self.client.force_authenticate(user=self.user)
+        matching._matching_index = None
+
+    def test_partners_are_ranked(self):
+        """
+        Tests that only reciprocal partners are matched, ranked by the number of languages they can exchange with the
+        user, and that they can be filtered by the level they're learning the user's native language at.
+        """
+        index = matching.get_matching_index()
+        matches = index.find_matches(self.user.id, exclude_ids=[self.friend.id])
+        self.assertEqual(matches.count(), 2)
+        self.assertEqual(matches[0:10], [(self.best_partner.id, 3), (self.partner.id, 2)])
+        self.assertEqual(matches[1:2], [(self.partner.id, 2)])
+
+        matches = index.find_matches(self.user.id, exclude_ids=[self.friend.id], levels=['IN'])
+        self.assertEqual(matches[0:10], [(self.partner.id, 2)])
+
+    def test_matches_endpoint(self):
+        """
+        Tests that the endpoint returns the session user's partners in order, excluding their friends.
+        """
+        response = self.client.get(reverse('customuser-matches'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([user['id'] for user in response.data['results']],
+                         [str(self.best_partner.id), str(self.partner.id)])
+
+        response = self.client.get(reverse('customuser-matches'), data={'levels': 'NA'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_language_changes_update_index(self):
+        """
+        Tests that language changes are applied to the index once committed, and that they're marked on the user so
+        that other workers can reload them.
+        """
+        index = matching.get_matching_index()
+        self.assertEqual(index.find_matches(self.user.id).count(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserLanguage.objects.create(user=self.non_partner, language='ES', level='BE')
+            UserLanguage.objects.get(user=self.partner, language='ES').delete()
+
+        self.assertEqual([user_id for user_id, _ in index.find_matches(self.user.id)[0:10]],
+                         [self.best_partner.id, self.friend.id, self.non_partner.id])
+        self.non_partner.refresh_from_db()
+        self.assertIsNotNone(self.non_partner.languages_updated_at)
+
+
+class UserSubResourceTests(APITestCase):
+    """Contains tests for the user friend chats and memberships endpoints."""
+
+    client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.friends = [
+            get_user_model().objects.create_user(username=f'sub_resource_user_{i}',
+                                                 email=f'sub_resource_{i}@example.com')
+            for i in range(4)
+        ]
+        for friend in cls.friends:
+            chat = FriendChat.objects.create()
+            chat.users.add(cls.user, friend)
+        cls.channels = [Channel.objects.create(name=f'sub resource channel {i}', language='DE', level='BE')
+                        for i in range(2)]
+        for channel in cls.channels:
+            Membership.objects.create(user=cls.user, channel=channel, role=ChannelRole.USER)
+
+    def setUp(self):
+        super(UserSubResourceTests, self).setUp()
+        self.client.force_authenticate(user=self.user)
+
+    def test_user_detail_has_counts_and_links(self):
+        """
+        Tests that the user detail includes the numbers of friend chats and memberships and links to them, instead of
+        the chats and memberships themselves.
+        """
+        response = self.client.get(reverse('customuser-detail', kwargs={'pk': self.user.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('friend_chats', response.data)
+        self.assertNotIn('memberships', response.data)
+        self.assertEqual((response.data['friend_chat_count'], response.data['membership_count']), (3, 2))
+        self.assertEqual(response.data['friendChatsUrl'], 'http://testserver' + reverse(
+            'customuser-friend-chats', kwargs={'pk': self.user.id}))
+
+        response = self.client.get(reverse('customuser-list'), {'search': 'sub_resource_user'})
+        self.assertEqual({user['username']: (user['friend_chat_count'], user['membership_count'])
+                          for user in response.data['results']},
+                         {'sub_resource_user_0': (3, 2), 'sub_resource_user_1': (1, 0), 'sub_resource_user_2': (1, 0),
+                          'sub_resource_user_3': (1, 0)})
+
+    def test_friend_chats_are_paginated(self):
+        """
+        Tests that the friend chats endpoint returns all of the user's chats with their users, a page at a time, and
+        that it's only available to the user.
+        """
+        url = reverse('customuser-friend-chats', kwargs={'pk': self.user.id})
+        chat_ids = []
+        response = self.client.get(url, {'size': 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            chat_ids += [chat['id'] for chat in response.data['results']]
+            for chat in response.data['results']:
+                self.assertIn(str(self.user.id), [user['id'] for user in chat['users']])
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        expected_ids = FriendChat.objects.filter(users=self.user).values_list('id', flat=True)
+        self.assertEqual(sorted(chat_ids), sorted(str(chat_id) for chat_id in expected_ids))
+
+        response = self.client.get(reverse('customuser-friend-chats', kwargs={'pk': self.friends[0].id}))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_memberships(self):
+        """
+        Tests that the memberships endpoint returns the user's memberships with their channels.
+        """
+        response = self.client.get(reverse('customuser-memberships', kwargs={'pk': self.user.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({membership['channel']['name'] for membership in response.data['results']},
+                         {channel.name for channel in self.channels})
@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model, login, authenticate, logout
 from django.contrib.auth.hashers import check_password
 from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import ensure_csrf_cookie
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiResponse, inline_serializer, extend_schema_view, \
@@ -9,14 +12,22 @@ from dry_rest_permissions.generics import DRYPermissions
 from rest_framework import permissions, status, parsers, fields, mixins
 from rest_framework import viewsets
 from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.views import APIView
 
+from chats.export import EXPORT_FORMATS, iter_messages, parse_cursor
+from chats.friends import get_friend_ids
+from chats.models import FriendChat
 from common.models import ProficiencyLevel, AvailableLanguage
+from communities.models import Membership
+from tandem.pagination import KeysetPagination
 from users.filters import UserFilter
+from users.matching import LEARNING_LEVELS, get_matching_index
 from users.models import UserLanguage
-from users.serializers import UserSerializer, UserLanguageSerializer, UserPasswordUpdateSerializer
+from users.serializers import UserSerializer, UserLanguageSerializer, UserPasswordUpdateSerializer, \
+    UserFriendChatSerializer, UserMembershipSerializer
 
 
 @extend_schema_view(
@@ -46,6 +57,36 @@ from users.serializers import UserSerializer, UserLanguageSerializer, UserPasswo
             OpenApiParameter('levels', type=OpenApiTypes.STR, many=True,
                              description="Filters users by the level of their learning (i.e. non-native) languages."),
         ]
+    ),
+    matches=extend_schema(
+        description="Returns the session user's language exchange partners: users who are native speakers of a "
+                    "language the user is learning, and who are learning one of the user's native languages. Users "
+                    "who can exchange more languages with the user come first. Friends are excluded.",
+        parameters=[
+            OpenApiParameter('levels', type=OpenApiTypes.STR, many=True,
+                             description="Filters partners by the level at which they're learning the user's native "
+                                         "languages."),
+        ]
+    ),
+    friend_chats=extend_schema(
+        description="Returns a page of the specified user's friend chats, with their users' details. Only available "
+                    "for the session's user, unless they're a superuser.",
+        responses=UserFriendChatSerializer(many=True)
+    ),
+    memberships=extend_schema(
+        description="Returns a page of the specified user's channel memberships, with their channels' details.",
+        responses=UserMembershipSerializer(many=True)
+    ),
+    export=extend_schema(
+        description="Streams the messages of all of the user's friend chats and channels, as JSON Lines or CSV. Each "
+                    "message includes a cursor, which can be passed to resume the export after it.",
+        parameters=[
+            OpenApiParameter('file_type', type=OpenApiTypes.STR, enum=list(EXPORT_FORMATS),
+                             description="Format of the export. Defaults to 'jsonl'."),
+            OpenApiParameter('cursor', type=OpenApiTypes.STR,
+                             description="Cursor of the last message received, to export only the messages after it."),
+        ],
+        responses={200: OpenApiTypes.BINARY},
     )
 )
 class UserViewSet(mixins.RetrieveModelMixin,
@@ -65,10 +106,24 @@ class UserViewSet(mixins.RetrieveModelMixin,
     parser_classes = [parsers.JSONParser, parsers.MultiPartParser]
     filterset_class = UserFilter
     permission_classes = [DRYPermissions]
+    throttle_scopes = {'create': 'user_create', 'discover': 'discover', 'matches': 'discover', 'export': 'export'}
 
     # Disable PUT method, as it's not currently supported due to nested serializer fields
     http_method_names = ['get', 'post', 'patch', 'delete', 'head']
 
+    def get_queryset(self):
+        """ Annotates the users' numbers of friend chats and memberships, which are included in their details. """
+        queryset = super(UserViewSet, self).get_queryset()
+        ChatUser = FriendChat.users.through
+        return queryset.annotate(
+            friend_chat_count=Coalesce(Subquery(
+                ChatUser.objects.filter(customuser_id=OuterRef('pk')).order_by().values('customuser_id')
+                .annotate(count=Count('*')).values('count')), 0),
+            membership_count=Coalesce(Subquery(
+                Membership.objects.filter(user_id=OuterRef('pk')).order_by().values('user_id')
+                .annotate(count=Count('*')).values('count')), 0),
+        )
+
     @transaction.atomic()
     def create(self, request, *args, **kwargs):
         """
@@ -113,11 +168,66 @@ class UserViewSet(mixins.RetrieveModelMixin,
 
     @action(detail=False, methods=['get'])
     def discover(self, request):
-        """ Returns a list of random users which aren't friends of the session's user. """
-        # Exclude users who are friends with the session's user from the queryset and order it randomly.
-        self.queryset = self.Meta.model.objects.exclude(friend_chats__users=request.user).order_by('?')
+        """ Returns a list of random users other than the session's user which aren't their friends. """
+        # Exclude the session's user and their friends from the queryset and order it randomly.
+        self.queryset = self.Meta.model.objects.exclude(id__in=get_friend_ids(request.user.id) | {request.user.id}) \
+            .order_by('?')
         return self.list(self, request)
 
+    @action(detail=False, methods=['get'])
+    def matches(self, request):
+        """ Returns a page of the session user's reciprocal language exchange partners, from the matching index. """
+        levels = request.query_params.getlist('levels')
+        for level in levels:
+            if level not in LEARNING_LEVELS:
+                raise ValidationError({'levels': [f'{level} is not a valid choice.']})
+
+        matches = get_matching_index().find_matches(request.user.id, exclude_ids=get_friend_ids(request.user.id),
+                                                    levels=levels)
+        page = self.paginate_queryset(matches)
+        users = self.get_queryset().in_bulk([user_id for user_id, _ in page])
+        # Users deleted since the index was updated are skipped
+        serializer = self.get_serializer([users[user_id] for user_id, _ in page if user_id in users], many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], pagination_class=KeysetPagination)
+    def friend_chats(self, request, pk=None):
+        """ Returns a page of the user's friend chats, with their users. """
+        user = self.get_object()
+        queryset = FriendChat.objects.filter(users=user).prefetch_related('users')
+        page = self.paginate_queryset(queryset)
+        serializer = UserFriendChatSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], pagination_class=KeysetPagination)
+    def memberships(self, request, pk=None):
+        """ Returns a page of the user's channel memberships, with their channels. """
+        user = self.get_object()
+        queryset = Membership.objects.filter(user=user).select_related('channel')
+        page = self.paginate_queryset(queryset)
+        serializer = UserMembershipSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """ Streams the messages of the user's chats in the requested format, starting after the given cursor. """
+        user = self.get_object()
+        file_type = request.query_params.get('file_type', 'jsonl')
+        if file_type not in EXPORT_FORMATS:
+            return Response({'file_type': [f"'{file_type}' is not a valid choice."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                parse_cursor(cursor)
+            except ValueError:
+                return Response({'cursor': ['Invalid cursor.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type, render = EXPORT_FORMATS[file_type]
+        response = StreamingHttpResponse(render(iter_messages(user, cursor)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="messages-{user.id}.{file_type}"'
+        return response
+
 
 @extend_schema_view(
     retrieve=extend_schema(
@@ -202,6 +312,7 @@ class LoginView(APIView):
     Attempts user login.
     """
     permission_classes = [permissions.AllowAny]
+    throttle_scope = 'login'
 
     def post(self, request):
         try:
@@ -254,6 +365,7 @@ class SetPassword(APIView):
     """
     Updates the session user's password.
     """
+    throttle_scope = 'set_password'
 
     def patch(self, request):
         try: